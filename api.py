@@ -0,0 +1,151 @@
+"""
+Lättviktig HTTP/JSON-tjänst för temp-, imd- och skada-kalkylerna.
+
+Bygger bara på standardbiblioteket (http.server) och beräkningskärnan, så den
+kan köras bredvid Streamlit-appen utan extra beroenden.
+
+    python api.py --port 8600
+
+    GET  /halsa               -> {"status": "ok"}
+    POST /berakna/<kalkyl>    body: ett scenario (samma nycklar som scenariofilerna)
+    POST /batch[/<kalkyl>]    body: [scenario, ...] eller {"scenarier": [...]}; beräknas vektoriserat
+"""
+import argparse
+import json
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import batch
+import kalkyl
+
+MAX_BODY_BYTES = 64 * 2**20
+MAX_SCENARIER_PER_BATCH = 100_000
+
+
+class ApiFel(Exception):
+    def __init__(self, status, meddelande):
+        super().__init__(meddelande)
+        self.status = status
+        self.meddelande = meddelande
+
+
+def berakna_ett(calc, scenario):
+    """Ett scenario -> resultat-dict (samma fält som kalkyl.Resultat och dess underklasser)."""
+    if calc not in kalkyl.CALC_KEY_LIST:
+        raise ApiFel(404, f"okänd kalkyl: {calc!r}")
+    try:
+        _, varden = batch.tolka_scenario(scenario, calc)
+    except ValueError as e:
+        raise ApiFel(400, str(e)) from None
+    return {'calc': calc, **kalkyl.berakna(calc, varden).as_dict()}
+
+
+def berakna_batch(scenarier, calc=None):
+    """Lista med scenarier -> resultatrader i samma ordning. Felaktiga rader får 'fel' i stället för att stoppa batchen."""
+    if isinstance(scenarier, dict):
+        scenarier = scenarier.get('scenarier')
+    if not isinstance(scenarier, list):
+        raise ApiFel(400, "förväntade en lista med scenarier eller {\"scenarier\": [...]}")
+    if len(scenarier) > MAX_SCENARIER_PER_BATCH:
+        raise ApiFel(413, f"högst {MAX_SCENARIER_PER_BATCH} scenarier per anrop")
+    if calc is not None and calc not in kalkyl.CALC_KEY_LIST:
+        raise ApiFel(404, f"okänd kalkyl: {calc!r}")
+
+    poster = [batch.skapa_post('batch', i, scenario, calc) for i, scenario in enumerate(scenarier)]
+    rader = batch.berakna_block(poster)
+    for rad in rader:
+        del rad['kalla']
+        rad['index'] = rad.pop('rad')
+    return {
+        'antal': len(rader),
+        'fel': sum(rad['fel'] is not None for rad in rader),
+        'resultat': rader,
+    }
+
+
+class KalkylHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, viktigt för genomströmningen
+    disable_nagle_algorithm = True  # Annars ger header + body i separata paket ~40 ms fördröjd ACK
+    server_version = "IoTKalkylApi/1.0"
+
+    def log_message(self, format, *args):
+        if getattr(self.server, 'logga', False):
+            super().log_message(format, *args)
+
+    def _svara(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _las_json(self):
+        try:
+            langd = int(self.headers.get('Content-Length') or 0)
+            if langd < 0:
+                raise ValueError
+        except ValueError:
+            # Utan giltig längd går det inte att hitta nästa förfrågan på anslutningen
+            self.close_connection = True
+            raise ApiFel(400, f"ogiltig Content-Length: {self.headers.get('Content-Length')!r}") from None
+        if langd > MAX_BODY_BYTES:
+            self.close_connection = True  # Kroppen läses inte
+            raise ApiFel(413, f"för stor förfrågan (max {MAX_BODY_BYTES} bytes)")
+        try:
+            return json.loads(self.rfile.read(langd) or b'null')
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ApiFel(400, f"ogiltig JSON: {e}") from None
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/halsa':
+            self._svara(200, {'status': 'ok', 'kalkyler': list(kalkyl.CALC_KEY_LIST)})
+        else:
+            self._svara(404, {'fel': f"okänd sökväg: {self.path}"})
+
+    def do_POST(self):
+        delar = [d for d in self.path.split('?')[0].split('/') if d]
+        try:
+            data = self._las_json()
+            if len(delar) == 2 and delar[0] == 'berakna':
+                self._svara(200, berakna_ett(delar[1], data))
+            elif delar and delar[0] == 'batch' and len(delar) <= 2:
+                self._svara(200, berakna_batch(data, delar[1] if len(delar) == 2 else None))
+            else:
+                raise ApiFel(404, f"okänd sökväg: {self.path}")
+        except ApiFel as e:
+            self._svara(e.status, {'fel': e.meddelande})
+        except Exception as e:
+            traceback.print_exc()
+            self.close_connection = True
+            self._svara(500, {'fel': f"internt fel: {type(e).__name__}"})
+
+
+def skapa_server(host='127.0.0.1', port=8600, logga=False):
+    server = ThreadingHTTPServer((host, port), KalkylHandler)
+    server.daemon_threads = True
+    server.logga = logga
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON-API för IoT ROI-kalkylerna.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--logga', action='store_true', help="Logga varje förfrågan till stderr")
+    args = parser.parse_args(argv)
+
+    server = skapa_server(args.host, args.port, args.logga)
+    print(f"Lyssnar på http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
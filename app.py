@@ -1,31 +1,112 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
+import datetime
 import json
+import os
+import tempfile
+import time
+from dataclasses import fields
+
+import batch
+import berakningsgraf
+import finans
+import jamforelse
+import jobb
+import kalkyl
+import kanslighet
+import kassaflode
+import inomhustemp
+import malsokning
+import matardata
+import montecarlo
+import optimering
+import parallell
+import portfolj
+import portfoljlager
+import profilering
+import rutnat
+import scenariobibliotek
+import scenariocache
+import skadesimulering
+import timpris
 
 # --- HUVUDAPPLIKATION STARTAR HÄR ---
 # st.set_page_config MÅSTE vara det första st-anropet.
 st.set_page_config(page_title="IoT ROI Kalkylator", layout="wide") 
 
+# Opt-in profilering av omkörningen (kryssruta i sidofältet eller IOT_PROFILERING=1)
+profil = profilering.Profilerare(aktiv=st.session_state.get('profilering_aktiv', os.environ.get('IOT_PROFILERING') == '1'))
+
 # --- KONSTANTER OCH MAPPNING ---
 CALC_OPTIONS = {
     "🌡️ Temperatur & Energi": "temp", 
     "💧 IMD: Vattenförbrukning": "imd", 
-    "🚨 Vattenskadeskydd": "skada"
+    "🚨 Vattenskadeskydd": "skada",
+    "🏢 Portfölj (flera fastigheter)": "portfolj",
+    "⚖️ Jämför Scenarier": "jamfor"
 }
 CALC_KEY_LIST = list(CALC_OPTIONS.values()) 
 
-# --- FUNKTIONER FÖR BERÄKNINGAR OCH VISUALISERING ---
+KASSAFLODE_TITLAR = {
+    'temp': "Ackumulerat Kassaflöde (Temperatur)",
+    'imd': "Ackumulerat Kassaflöde (IMD Vatten)",
+    'skada': "Ackumulerat Kassaflöde (Vattenskadeskydd)",
+}
+
+# Korta etiketter för indatanycklarna (används i analysverktygen)
+NYCKEL_ETIKETTER = {
+    'antal_lgh_main': "Antal lägenheter",
+    'uh_per_sensor': "Underhåll/batteri per sensor/år",
+    'lora_cost': "LoRaWAN per sensor/år",
+    'web_cost': "Plattform per sensor/år",
+    'app_cost': "Applikationskostnad/år",
+    'pris_sensor_temp': "Pris per Temp-sensor",
+    'pris_install_temp': "Installation per Temp-sensor",
+    'startkostnad_temp': "Projektstartkostnad",
+    'kvm_snitt': "Snittyta per lgh",
+    'kwh_kvm': "Förbrukning kWh/m²/år",
+    'pris_kwh': "Energipris kr/kWh",
+    'besparing_temp': "Energibesparing %",
+    'uh_besparing_temp': "Minskat underhåll/lgh (Temp)",
+    'pris_sensor_imd': "Pris per Vattenmätare",
+    'pris_install_imd': "Installation per mätare",
+    'besparing_lgh_vatten': "Vattenbesparing/lgh/år",
+    'besparing_lgh_uh_imd': "Minskat underhåll/lgh (IMD)",
+    'pris_sensor_skada': "Pris per Läckagesensor",
+    'pris_install_skada': "Installation per Läckagesensor",
+    'kostnad_skada': "Snittkostnad per vattenskada",
+    'frekvens_skada': "Vattenskador per 1000 lgh/år",
+    'besparing_skada_pct': "Minskning skadekostnad %",
+    'uh_besparing_skada_lgh': "Övrig underhållsbesparing/lgh",
+}
+
+# Förvalda osäkra indata i Monte Carlo-analysen
+MC_STANDARDNYCKLAR = {
+    'temp': ['besparing_temp', 'pris_kwh'],
+    'imd': ['besparing_lgh_vatten'],
+    'skada': ['frekvens_skada', 'besparing_skada_pct'],
+}
+
+# Över dessa storlekar körs Monte Carlo och portföljen i processpoolen (parallell.py) om det finns flera kärnor
+PARALLELL_DRAGNINGAR = 2_000_000
+PARALLELL_FASTIGHETER = 100_000
+# Portföljer från denna storlek räknas som bakgrundsjobb (jobb.py); sidan frågar efter status med detta intervall
+BAKGRUND_FASTIGHETER = 500_000
+JOBB_UPPDATERING_S = 1.0
+JOBBTYPER_ETIKETTER = {'montecarlo': "Monte Carlo", 'portfolj': "Portfölj", 'skadesimulering': "Skaderisk"}
+SKADEFORDELNINGAR = {"Lognormal": 'lognormal', "Pareto": 'pareto'}
 
-def create_cashflow_chart(initial_cost, net_annual_flow, title):
-    """Genererar den ackumulerade kassaflödesgrafen."""
-    years = list(range(1, 11))
-    cashflow = []
-    current_balance = -initial_cost
+# Jobb som den här omkörningen väntar på (fylls av bevaka_jobb)
+vantande_jobb = []
+
+# --- FUNKTIONER FÖR BERÄKNINGAR OCH VISUALISERING ---
 
-    for year in years:
-        current_balance += net_annual_flow
-        cashflow.append(current_balance)
+def create_cashflow_chart(arsfloden, title):
+    """Genererar den ackumulerade kassaflödesgrafen från kassaflödet per år (år 0 = investeringen)."""
+    cashflow = kassaflode.ackumulerat([arsfloden])[0].tolist()
+    years = list(range(1, len(cashflow) + 1))
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -37,6 +118,120 @@ def create_cashflow_chart(initial_cost, net_annual_flow, title):
     fig.update_layout(title=title, xaxis_title="År", yaxis_title="SEK", template="plotly_white")
     return fig, cashflow
 
+@st.cache_resource
+def hamta_profilstatistik():
+    """Rullande tidsstatistik per avsnitt, gemensam för alla sessioner i processen."""
+    return profilering.Statistik()
+
+@st.cache_resource
+def hamta_cache():
+    """Processgemensam resultat- och figurcache som delas av alla sessioner. IOT_CACHE_DIR aktiverar disklagring."""
+    return scenariocache.ScenarioCache(katalog=os.environ.get('IOT_CACHE_DIR') or None)
+
+@st.cache_resource
+def hamta_jobbko():
+    """Bakgrundsjobb i en begränsad pool som delas av alla sessioner. Status och resultat sparas i IOT_JOBB_DIR."""
+    return jobb.Jobbko(os.environ.get('IOT_JOBB_DIR') or 'iot_jobb')
+
+@st.cache_resource(max_entries=8)
+def hamta_jobbresultat(jobb_id):
+    """Resultatet av ett klart jobb, läst från disk en gång per serverprocess."""
+    return hamta_jobbko().resultat(jobb_id)
+
+def bevaka_jobb(jobb_id, text):
+    """
+    Visar förlopp (med avbrytknapp) eller utfall för ett bakgrundsjobb.
+    Returnerar (status, resultat); resultatet är None tills jobbet är klart.
+    """
+    ko = hamta_jobbko()
+    status = ko.status(jobb_id)
+    if status is None:
+        st.warning(f"Jobb {jobb_id} finns inte längre.")
+        return None, None
+    if status['status'] == 'klar':
+        return 'klar', hamta_jobbresultat(jobb_id)
+    if status['status'] in jobb.VANTANDE:
+        vantande_jobb.append(jobb_id)
+        col_forlopp, col_avbryt = st.columns([4, 1])
+        col_forlopp.progress(status['forlopp'], text=f"{text} (jobb {jobb_id}, {status['status']}, {status['forlopp'] * 100:.0f} %)")
+        col_avbryt.button("Avbryt jobb", key=f'avbryt_jobb_{jobb_id}', on_click=ko.avbryt, args=(jobb_id,))
+    else:
+        st.warning(f"Jobb {jobb_id} {status['status']}. {status['meddelande'] or ''}")
+    return status['status'], None
+
+def uppdatera_vid_vantande_jobb():
+    """Kör om sidan efter en stund om omkörningen väntar på bakgrundsjobb (sidans statusfrågning)."""
+    if vantande_jobb and st.session_state.get('jobb_auto', True):
+        time.sleep(JOBB_UPPDATERING_S)
+        st.rerun()
+
+def antaganden_fran_session():
+    """Antaganden för kassaflödet år för år, från sidofältet."""
+    return kassaflode.Antaganden.from_dict(st.session_state)
+
+def _figur_nod(calc):
+    """Grafnod för kassaflödesgrafen (serialiserad figur) som bygger på 'arsfloden'."""
+    title = KASSAFLODE_TITLAR[calc]
+    return berakningsgraf.Nod('figur', lambda arsfloden: json.loads(create_cashflow_chart(arsfloden, title)[0].to_json()))
+
+def hamta_graf(calc):
+    """Sessionens beräkningsgraf för kalkylen (skapas vid första användningen)."""
+    nyckel = f'berakningsgraf_{calc}'
+    if nyckel not in st.session_state:
+        st.session_state[nyckel] = berakningsgraf.skapa_graf(calc, [_figur_nod(calc)])
+    return st.session_state[nyckel]
+
+def uppdatera_graf(calc, indata):
+    """
+    Uppdaterar sessionens graf med indata och sidofältets antaganden; bara
+    påverkade noder räknas om. Grafen uppdateras högst en gång per omkörning,
+    så att `senaste` beskriver omkörningens ändringar.
+    """
+    graf = hamta_graf(calc)
+    if st.session_state.get(f'berakningsgraf_omraknad_{calc}'):
+        return dict(graf.varden)
+    st.session_state[f'berakningsgraf_omraknad_{calc}'] = True
+    with profil.sektion(f"{calc}/formler"):
+        return graf.uppdatera({
+            **indata.as_dict(),
+            'horisont_ar': st.session_state.horisont_ar,
+            **antaganden_fran_session().as_dict(),
+        })
+
+def _periodnyckel(typ, calc, indata):
+    """Cachenyckel för det som beror på scenariot, kalkylperioden och antagandena."""
+    return (typ, calc, indata.as_dict(), st.session_state.horisont_ar, antaganden_fran_session().as_dict())
+
+def berakna_graf(calc, indata):
+    """
+    Kalkylresultatet ur den processgemensamma cachen, nycklad på scenariots
+    kanoniska hash. Vid en miss räknar sessionens graf om det som påverkas.
+    Anropas en gång per omkörning och nollställer därför grafpanelens
+    markering av om grafen har körts.
+    """
+    st.session_state[f'berakningsgraf_omraknad_{calc}'] = False
+    klass = kalkyl.RESULTAT_KLASSER[calc]
+    def berakna():
+        varden = uppdatera_graf(calc, indata)
+        return {f.name: varden[f.name] for f in fields(klass)}
+    return klass(**hamta_cache().hamta_eller_berakna(('resultat', calc, indata.as_dict()), berakna))
+
+def berakna_arsfloden(calc, indata):
+    """Kassaflödet per år över vald kalkylperiod (år 0 = investeringen), via cachen och vid miss grafen."""
+    return hamta_cache().hamta_eller_berakna(
+        _periodnyckel('arsfloden', calc, indata),
+        lambda: uppdatera_graf(calc, indata)['arsfloden'].tolist()
+    )
+
+def visa_cashflow_chart(calc, indata):
+    """Ritar kassaflödesgrafen. Den serialiserade figuren återanvänds ur cachen för redan ritade scenarier."""
+    with profil.sektion(f"{calc}/plotly_chart"):
+        figur = hamta_cache().hamta_eller_berakna(
+            _periodnyckel('figur', calc, indata) + (KASSAFLODE_TITLAR[calc],),
+            lambda: uppdatera_graf(calc, indata)['figur']
+        )
+        st.plotly_chart(figur, use_container_width=True)
+
 # Funktion för att visa KPIer för IMD/Skada (3 kolumner)
 def display_kpis_3(initial, netto, payback):
     """Visar de tre nyckeltalen."""
@@ -49,6 +244,19 @@ def display_kpis_3(initial, netto, payback):
     col2_kpi.metric("Årlig Nettobesparing", f"{netto:,.0f} kr".replace(",", " "), delta_color="normal")
     col3_kpi.metric("Payback-tid", f"{payback:.1f} år" if payback > 0 else "N/A")
     
+# Diskonterade nyckeltal (NPV, IRR, diskonterad payback) med horisont och kalkylränta från sidofältet
+def display_kpis_finans(arsfloden):
+    """Visar nuvärde, internränta och diskonterad payback för kassaflödet per år."""
+    ar = len(arsfloden) - 1
+    ranta = st.session_state.kalkylranta
+    varden = portfolj.berakna_finans([arsfloden], ranta)
+    npv, irr, disk_payback = (float(varden[k][0]) for k in portfolj.FINANSNYCKLAR)
+
+    col1_kpi, col2_kpi, col3_kpi = st.columns(3)
+    col1_kpi.metric(f"Nuvärde (NPV, {ar} år, {ranta:g} %)", f"{npv:,.0f} kr".replace(",", " "))
+    col2_kpi.metric("Internränta (IRR)", f"{irr * 100:.1f} %" if irr == irr else "N/A")
+    col3_kpi.metric("Diskonterad Payback", f"{disk_payback:.1f} år" if disk_payback == disk_payback else f"> {ar} år")
+
 # KORRIGERAD FUNKTION: Linjerar med [1, 1, 1] breddförhållande
 def display_kpis_5_temp(initial, netto, payback, besparing_lgh_ar, total_drift_ar):
     """Visar de fem nyckeltalen, inkl. Brutto/Netto och TOTAL driftskostnad för fastigheten."""
@@ -75,6 +283,664 @@ def display_kpis_5_temp(initial, netto, payback, besparing_lgh_ar, total_drift_a
     # row2_kpi_col3 lämnas tom
 
 
+def create_montecarlo_chart(mc_resultat, title):
+    """Genererar P10/P50/P90-band för ackumulerat kassaflöde och sannolikhet för break-even per år."""
+    years = list(range(1, mc_resultat.ar + 1))
+    percentiler = mc_resultat.kassaflode_percentiler()
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=years, y=percentiler[90], name="P90", line=dict(color='#00cc96', width=0)))
+    fig.add_trace(go.Scatter(x=years, y=percentiler[10], name="P10–P90", fill='tonexty', line=dict(color='#00cc96', width=0)))
+    fig.add_trace(go.Scatter(x=years, y=percentiler[50], name="P50 (median)", line=dict(color='#636efa', width=3)))
+    fig.add_trace(go.Bar(
+        x=years,
+        y=mc_resultat.sannolikhet_break_even * 100,
+        name="Sannolikhet break-even (%)",
+        yaxis='y2',
+        opacity=0.3,
+        marker_color='#ab63fa'
+    ))
+    fig.update_layout(
+        title=title, xaxis_title="År", yaxis_title="SEK", template="plotly_white",
+        yaxis2=dict(title="Sannolikhet break-even (%)", overlaying='y', side='right', range=[0, 100]),
+        legend=dict(orientation='h', y=-0.2)
+    )
+    return fig
+
+def create_jamforelse_chart(jamforelse_resultat, title):
+    """Ackumulerat kassaflöde för alla fastnålade scenarier i samma figur."""
+    years = list(range(1, jamforelse_resultat.kassaflode.shape[1] + 1))
+    fig = go.Figure()
+    for i, namn in enumerate(jamforelse_resultat.namn):
+        fig.add_trace(go.Scatter(x=years, y=jamforelse_resultat.kassaflode[i], mode='lines+markers', name=f"{i + 1}. {namn}"))
+    fig.add_hline(y=0, line_dash='dash', line_color='grey')
+    fig.update_layout(title=title, xaxis_title="År", yaxis_title="SEK", template="plotly_white")
+    return fig
+
+def visa_monte_carlo(calc, scenario):
+    """Visar Monte Carlo-analysen för en kalkyl. `scenario` är de aktuella indata (dict)."""
+    with st.expander("🎲 Osäkerhetsanalys (Monte Carlo)"):
+        st.markdown("Välj vilka indata som är osäkra och ange en fördelning runt det aktuella värdet. "
+                    "Simuleringen ger P10/P50/P90 för payback och sannolikheten att investeringen har gått jämnt ut år för år.")
+        with st.form(key=f'mc_form_{calc}'):
+            etikett_till_nyckel = {NYCKEL_ETIKETTER[k]: k for k in kalkyl.SCENARIO_NYCKLAR[calc]}
+            osakra_etiketter = st.multiselect(
+                "Osäkra indata",
+                options=list(etikett_till_nyckel),
+                default=[NYCKEL_ETIKETTER[k] for k in MC_STANDARDNYCKLAR[calc]],
+                key=f'mc_nycklar_{calc}'
+            )
+            col_typ, col_spridning, col_antal, col_seed = st.columns(4)
+            typ = col_typ.selectbox("Fördelning", montecarlo.FORDELNINGSTYPER, key=f'mc_typ_{calc}')
+            spridning = col_spridning.number_input("Osäkerhet ± (%)", min_value=0.0, max_value=100.0, value=30.0, step=5.0, key=f'mc_spridning_{calc}')
+            antal = col_antal.number_input("Antal dragningar", min_value=10_000, max_value=10_000_000, value=1_000_000, step=100_000, key=f'mc_antal_{calc}', format="%i")
+            seed = col_seed.number_input("Seed", min_value=0, value=42, key=f'mc_seed_{calc}', format="%i")
+            bakgrund = st.checkbox("Kör som bakgrundsjobb", key=f'mc_bakgrund_{calc}',
+                                   help="Simuleringen körs i jobbkön och fortsätter även om sidan laddas om eller ändras. Resultatet visas när jobbet är klart.")
+            korning = st.form_submit_button("Kör simulering")
+
+        if korning and bakgrund:
+            osakra = [etikett_till_nyckel[e] for e in osakra_etiketter]
+            fordelningar = {k: montecarlo.Fordelning.kring(typ, float(scenario[k]), spridning) for k in osakra}
+            antal_text = f"{int(antal):,}".replace(",", " ")
+            st.session_state[f'mc_jobb_{calc}'] = hamta_jobbko().skicka(
+                'montecarlo', dict(calc=calc, scenario=dict(scenario), fordelningar=fordelningar, antal=int(antal), seed=int(seed),
+                                  ar=st.session_state.horisont_ar, antaganden=antaganden_fran_session()),
+                etikett=f"{calc}, {antal_text} dragningar", omstart=True,
+            )
+        elif korning:
+            osakra = [etikett_till_nyckel[e] for e in osakra_etiketter]
+            fordelningar = {k: montecarlo.Fordelning.kring(typ, float(scenario[k]), spridning) for k in osakra}
+            processer = parallell.antal_processer() if antal >= PARALLELL_DRAGNINGAR else 1
+            # Ett klick på Avbryt startar en ny omkörning, som stoppar simuleringen vid nästa förloppsuppdatering
+            st.button("Avbryt", key=f'mc_avbryt_{calc}')
+            forlopp = st.progress(0.0, text="Simulerar...")
+
+            def visa_forlopp(klara, totalt, summa):
+                forlopp.progress(klara / totalt, text=f"Simulerar... {summa['antal']:,} dragningar klara, "
+                                                      f"aldrig lönsam hittills {summa['aldrig'] / summa['antal'] * 100:.1f} %".replace(",", " "))
+
+            st.session_state[f'mc_resultat_{calc}'] = montecarlo.simulera(
+                calc, scenario, fordelningar, antal=int(antal), seed=int(seed),
+                ar=st.session_state.horisont_ar, antaganden=antaganden_fran_session(),
+                processer=processer, vid_delresultat=visa_forlopp,
+            )
+            forlopp.empty()
+
+        if f'mc_jobb_{calc}' in st.session_state:
+            status, jobbresultat = bevaka_jobb(st.session_state[f'mc_jobb_{calc}'], "Simulerar i bakgrunden...")
+            if status not in jobb.VANTANDE:
+                del st.session_state[f'mc_jobb_{calc}']
+            if jobbresultat is not None:
+                st.session_state[f'mc_resultat_{calc}'] = jobbresultat
+
+        mc_resultat = st.session_state.get(f'mc_resultat_{calc}')
+        if mc_resultat is not None:
+            col1_kpi, col2_kpi, col3_kpi, col4_kpi = st.columns(4)
+            for col, p in zip((col1_kpi, col2_kpi, col3_kpi), montecarlo.PERCENTILER):
+                varde = mc_resultat.payback_percentiler[p]
+                col.metric(f"Payback P{p}", f"{varde:.1f} år" if varde != float('inf') else "N/A")
+            col4_kpi.metric("Aldrig lönsam", f"{mc_resultat.andel_aldrig * 100:.1f} %")
+            st.plotly_chart(create_montecarlo_chart(mc_resultat, f"Osäkerhet i Ackumulerat Kassaflöde ({mc_resultat.antal:,} dragningar)".replace(",", " ")), use_container_width=True)
+
+def create_skaderisk_chart(skaderesultat, title):
+    """Histogram över årlig skadekostnad utan och med sensorer."""
+    fig = go.Figure()
+    for serie, namn, farg in ((skaderesultat.utan, "Utan sensorer", '#ef553b'), (skaderesultat.med, "Med sensorer", '#00cc96')):
+        fig.add_trace(go.Histogram(x=serie.ravel(), name=namn, marker_color=farg, opacity=0.6, nbinsx=80))
+    fig.add_vline(x=skaderesultat.forvantad, line_dash='dash', line_color='black', annotation_text="Väntevärde (kalkylen)")
+    fig.update_layout(title=title, xaxis_title="SEK/år", yaxis_title="Antal försöksår", barmode='overlay', template="plotly_white")
+    return fig
+
+def visa_skadesimulering(scenario):
+    """Visar den stokastiska skadesimuleringen: fördelningen av årlig skadekostnad och svansrisken."""
+    with st.expander("🌊 Skaderisk (stokastisk simulering)"):
+        st.markdown("Kalkylen räknar med den förväntade skadekostnaden. Simuleringen drar skador per lägenhet och år (Poisson) med "
+                    "tungsvansade skadekostnader och visar hur dåliga år kan bli (VaR och expected shortfall) och hur mycket sensorerna undviker.")
+        with st.form(key='skadesim_form'):
+            col_typ, col_cv, col_alfa = st.columns(3)
+            fordelning = SKADEFORDELNINGAR[col_typ.selectbox("Skadekostnad", list(SKADEFORDELNINGAR), key='skadesim_fordelning')]
+            cv = col_cv.number_input("Variationskoefficient (lognormal)", min_value=0.1, max_value=10.0, value=skadesimulering.STANDARD_CV, step=0.5,
+                                     key='skadesim_cv', help="Standardavvikelse delat med medelkostnaden.")
+            alfa = col_alfa.number_input("Svansindex (Pareto)", min_value=1.1, max_value=10.0, value=skadesimulering.STANDARD_ALFA, step=0.1,
+                                         key='skadesim_alfa', help="Lägre värde ger tyngre svans, dvs. fler mycket dyra skador.")
+            col_antal, col_seed = st.columns(2)
+            antal = col_antal.number_input("Antal försök", min_value=100, max_value=100_000, value=10_000, step=1_000, key='skadesim_antal', format="%i")
+            seed = col_seed.number_input("Seed", min_value=0, value=42, key='skadesim_seed', format="%i")
+            bakgrund = st.checkbox("Kör som bakgrundsjobb", key='skadesim_bakgrund',
+                                   help="Rekommenderas för stora fastighetsbestånd. Resultatet visas när jobbet är klart.")
+            korning = st.form_submit_button("Kör simulering")
+
+        argument = dict(scenario=dict(scenario), antal_forsok=int(antal), ar=st.session_state.horisont_ar, fordelning=fordelning, cv=cv, alfa=alfa,
+                        prisokning_pct=st.session_state.prisokning_pct, seed=int(seed))
+        if korning and bakgrund:
+            antal_text = f"{int(antal):,}".replace(",", " ")
+            lgh_text = f"{int(scenario['antal_lgh_main']):,}".replace(",", " ")
+            st.session_state.skadesim_jobb = hamta_jobbko().skicka('skadesimulering', argument, etikett=f"{lgh_text} lgh, {antal_text} försök", omstart=True)
+        elif korning:
+            forlopp = st.progress(0.0, text="Simulerar skador...")
+            st.session_state.skadesim_resultat = skadesimulering.simulera(
+                **argument, vid_delresultat=lambda klara, totalt, _: forlopp.progress(klara / totalt, text="Simulerar skador..."),
+            )
+            forlopp.empty()
+
+        if 'skadesim_jobb' in st.session_state:
+            status, jobbresultat = bevaka_jobb(st.session_state.skadesim_jobb, "Simulerar skador i bakgrunden...")
+            if status not in jobb.VANTANDE:
+                del st.session_state.skadesim_jobb
+            if jobbresultat is not None:
+                st.session_state.skadesim_resultat = jobbresultat
+
+        skaderesultat = st.session_state.get('skadesim_resultat')
+        if skaderesultat is None:
+            return
+        risk = skaderesultat.riskmatt()
+        sammanfattning = skaderesultat.sammanfattning()
+        undviken = skaderesultat.undviken_percentiler(period='horisont')
+        col1_kpi, col2_kpi, col3_kpi, col4_kpi = st.columns(4)
+        col1_kpi.metric("Medelkostnad/år utan sensorer", f"{sammanfattning['medel_utan']:,.0f} kr".replace(",", " "))
+        col2_kpi.metric("VaR 99 % utan sensorer", f"{risk.loc[0.99, 'var_utan']:,.0f} kr".replace(",", " "))
+        col3_kpi.metric("VaR 99 % med sensorer", f"{risk.loc[0.99, 'var_med']:,.0f} kr".replace(",", " "))
+        col4_kpi.metric("Undviken kostnad P50 (hela perioden)", f"{undviken[50]:,.0f} kr".replace(",", " "))
+        st.caption(f"Undviken kostnad över {skaderesultat.ar} år: P5 {undviken[5]:,.0f} kr, P95 {undviken[95]:,.0f} kr.".replace(",", " "))
+        antal_text = f"{skaderesultat.antal_forsok:,}".replace(",", " ")
+        st.plotly_chart(create_skaderisk_chart(skaderesultat, f"Årlig skadekostnad ({antal_text} försök × {skaderesultat.ar} år)"), use_container_width=True)
+        st.dataframe(risk.rename(index=lambda niva: f"{niva * 100:g} %", columns={
+            'var_utan': "VaR utan (kr/år)", 'es_utan': "ES utan (kr/år)", 'var_med': "VaR med (kr/år)", 'es_med': "ES med (kr/år)",
+        }).round(0), use_container_width=True)
+
+def create_tornado_chart(rader, bas, steg, title, xaxis_title):
+    """Genererar tornadodiagrammet. `rader` är (nyckel, utfall vid -steg, utfall vid +steg), störst först."""
+    rader = list(reversed(rader))  # Plotly ritar nedifrån och upp
+    etiketter = [NYCKEL_ETIKETTER.get(r[0], r[0]) for r in rader]
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        y=etiketter, x=[r[1] - bas for r in rader], base=bas, orientation='h',
+        name=f"-{steg:g} %", marker_color='#ef553b'
+    ))
+    fig.add_trace(go.Bar(
+        y=etiketter, x=[r[2] - bas for r in rader], base=bas, orientation='h',
+        name=f"+{steg:g} %", marker_color='#00cc96'
+    ))
+    fig.update_layout(
+        title=title, xaxis_title=xaxis_title, barmode='overlay', template="plotly_white",
+        height=max(350, 40 * len(rader) + 120)
+    )
+    return fig
+
+def visa_kanslighet(calc, scenario):
+    """Visar känslighetsanalysen (tornado) för en kalkyl. Alla indata störs i ett vektoriserat svep."""
+    with st.expander("🌪️ Känslighetsanalys (Tornado)"):
+        col_steg, col_matt = st.columns(2)
+        steg = col_steg.slider("Steg ± (%)", 1.0, 50.0, value=10.0, step=1.0, key=f'kanslighet_steg_{calc}')
+        matt = col_matt.radio("Påverkan på", ["Årlig Nettobesparing", "Payback-tid"], horizontal=True, key=f'kanslighet_matt_{calc}')
+
+        resultat = kanslighet.berakna_kanslighet(calc, scenario, steg_pct=(steg,))
+        if matt == "Årlig Nettobesparing":
+            rader = resultat.tornado(steg, 'netto')
+            fig = create_tornado_chart(rader, resultat.bas_netto, steg, f"Känslighet: Årlig Nettobesparing (±{steg:g} %)", "SEK/år")
+        else:
+            rader = resultat.tornado(steg, 'payback')
+            fig = create_tornado_chart(rader, resultat.bas_payback, steg, f"Känslighet: Payback-tid (±{steg:g} %)", "År")
+        st.plotly_chart(fig, use_container_width=True)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def berakna_portfolj_cachad(filinnehall, argument, _tabell):
+    """
+    Portföljen räknas en gång per fil och antaganden; `filinnehall` (filens
+    bytes) och `argument` är cachenyckeln, `_tabell` är den inlästa filen.
+    """
+    return portfolj.berakna_portfolj(_tabell, **argument)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def berakna_rutnat_cachad(calc, scenario, x_nyckel, x_spann, y_nyckel, y_spann, upplosning):
+    """Rutnätet cachas per indata, så att omkörningar med samma inställningar inte räknar om det."""
+    x_varden = rutnat.axel_kring(scenario[x_nyckel], x_spann, upplosning)
+    y_varden = rutnat.axel_kring(scenario[y_nyckel], y_spann, upplosning)
+    return rutnat.berakna_rutnat(calc, scenario, x_nyckel, x_varden, y_nyckel, y_varden)
+
+def create_heatmap_chart(grid, scenario, mal_payback, title, horisont=portfolj.AR):
+    """Genererar heatmap för payback med break-even-kontur (netto = 0) och kontur för mål-payback. Färgskalan går till `horisont` år."""
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        x=grid.x, y=grid.y, z=grid.payback,
+        zmin=0, zmax=horisont, colorscale='RdYlGn_r',
+        colorbar=dict(title="Payback (år)"),
+        hovertemplate="x: %{x:,.2f}<br>y: %{y:,.2f}<br>Payback: %{z:.1f} år<extra></extra>"
+    ))
+    fig.add_trace(go.Contour(
+        x=grid.x, y=grid.y, z=grid.netto, name="Break-even (netto = 0)",
+        contours=dict(start=0, end=0, size=1, coloring='lines'),
+        line=dict(color='black', width=3), showscale=False, showlegend=True, hoverinfo='skip'
+    ))
+    fig.add_trace(go.Contour(
+        x=grid.x, y=grid.y, z=grid.payback, name=f"Payback = {mal_payback:g} år",
+        contours=dict(start=mal_payback, end=mal_payback, size=1, coloring='lines'),
+        line=dict(color='white', width=2, dash='dash'), showscale=False, showlegend=True, hoverinfo='skip'
+    ))
+    fig.add_trace(go.Scatter(
+        x=[scenario[grid.x_nyckel]], y=[scenario[grid.y_nyckel]], mode='markers', name="Aktuellt scenario",
+        marker=dict(color='#636efa', size=12, symbol='x')
+    ))
+    fig.update_layout(
+        title=title, template="plotly_white", height=600,
+        xaxis_title=NYCKEL_ETIKETTER[grid.x_nyckel], yaxis_title=NYCKEL_ETIKETTER[grid.y_nyckel],
+        legend=dict(orientation='h', y=-0.15)
+    )
+    return fig
+
+def visa_heatmap(calc, scenario):
+    """Visar payback som heatmap över två valfria indata."""
+    with st.expander("🗺️ Break-even Heatmap (två indata)"):
+        # Rutnätet är stort (upp till 500×500), så det ritas bara på begäran
+        if not st.checkbox("Visa heatmap", key=f'heatmap_visa_{calc}'):
+            return
+        etikett_till_nyckel = {NYCKEL_ETIKETTER[k]: k for k in kalkyl.SCENARIO_NYCKLAR[calc]}
+        etiketter = list(etikett_till_nyckel)
+        x_std, y_std = rutnat.STANDARDAXLAR[calc]
+
+        col_x, col_y = st.columns(2)
+        x_etikett = col_x.selectbox("X-axel", etiketter, index=etiketter.index(NYCKEL_ETIKETTER[x_std]), key=f'heatmap_x_{calc}')
+        x_spann = col_x.slider("Spann X ± (%)", 10, 100, value=50, step=10, key=f'heatmap_x_spann_{calc}')
+        y_etikett = col_y.selectbox("Y-axel", etiketter, index=etiketter.index(NYCKEL_ETIKETTER[y_std]), key=f'heatmap_y_{calc}')
+        y_spann = col_y.slider("Spann Y ± (%)", 10, 100, value=50, step=10, key=f'heatmap_y_spann_{calc}')
+
+        col_res, col_mal = st.columns(2)
+        upplosning = col_res.select_slider("Upplösning", options=[100, 250, 500], value=500, key=f'heatmap_upplosning_{calc}')
+        horisont = float(st.session_state.horisont_ar)
+        if st.session_state.get(f'heatmap_mal_{calc}', 0.0) > horisont:
+            del st.session_state[f'heatmap_mal_{calc}']  # Kalkylperioden har kortats; börja om från förvalt mål
+        mal_payback = col_mal.number_input("Mål-payback (år)", min_value=0.5, max_value=horisont, value=min(3.0, horisont),
+                                           step=0.5, key=f'heatmap_mal_{calc}')
+
+        if x_etikett == y_etikett:
+            st.warning("Välj två olika indata för X- och Y-axeln.")
+            return
+        grid = berakna_rutnat_cachad(calc, scenario, etikett_till_nyckel[x_etikett], x_spann, etikett_till_nyckel[y_etikett], y_spann, upplosning)
+        st.plotly_chart(create_heatmap_chart(grid, scenario, mal_payback, f"Payback-tid ({upplosning}×{upplosning})", horisont), use_container_width=True)
+        st.caption("Svart linje: break-even (årlig nettobesparing = 0). Vita fält saknar break-even. Streckad linje: mål-payback.")
+
+# Målsökning: etikett -> (mål i malsokning.py, förvalt målvärde)
+MAL_ETIKETTER = {
+    "Payback-tid (år)": ('payback', 3.0),
+    "Årlig Nettobesparing (kr)": ('netto', 0.0),
+    "Nuvärde, NPV (kr)": ('npv', 0.0),
+    "Internränta, IRR (%)": ('irr', 8.0),
+    "Diskonterad Payback (år)": ('diskonterad_payback', 5.0),
+}
+MALSOKNING_STANDARD = {'temp': 'pris_sensor_temp', 'imd': 'pris_sensor_imd', 'skada': 'pris_sensor_skada'}
+
+def valj_malsokning(calc, nyckelprefix):
+    """Väljare för målsökningen. Returnerar (variabel, mål, målvärde)."""
+    etikett_till_nyckel = {NYCKEL_ETIKETTER[k]: k for k in kalkyl.SCENARIO_NYCKLAR[calc]}
+    etiketter = list(etikett_till_nyckel)
+    col_var, col_mal, col_varde = st.columns(3)
+    variabel = col_var.selectbox("Lös för", etiketter, index=etiketter.index(NYCKEL_ETIKETTER[MALSOKNING_STANDARD[calc]]), key=f'{nyckelprefix}_variabel_{calc}')
+    mal_etikett = col_mal.selectbox("Mål", list(MAL_ETIKETTER), key=f'{nyckelprefix}_mal_{calc}')
+    mal, standardvarde = MAL_ETIKETTER[mal_etikett]
+    malvarde = col_varde.number_input(mal_etikett, value=standardvarde, key=f'{nyckelprefix}_varde_{calc}_{mal}')
+    return etikett_till_nyckel[variabel], mal, malvarde
+
+def visa_malsokning(calc, scenario):
+    """Löser vilket värde på en vald indata som ger mål-payback, netto, NPV eller IRR."""
+    with st.expander("🎯 Målsökning"):
+        variabel, mal, malvarde = valj_malsokning(calc, 'malsokning')
+        try:
+            varde, uppnatt = malsokning.los_scenario(
+                calc, scenario, variabel, mal, malvarde,
+                ar=st.session_state.horisont_ar, ranta=st.session_state.kalkylranta, antaganden=antaganden_fran_session(),
+            )
+        except ValueError as e:
+            st.warning(str(e))
+            return
+        if varde != varde:
+            st.warning(f"Målet går inte att nå genom att ändra {NYCKEL_ETIKETTER[variabel]} (inom 0–{'100' if variabel in malsokning.PROCENTNYCKLAR else '∞'}).")
+            return
+        col_varde, col_nu = st.columns(2)
+        col_varde.metric(NYCKEL_ETIKETTER[variabel], f"{varde:,.2f}".replace(",", " "),
+                         delta=f"{varde - scenario[variabel]:+,.2f} mot nuvarande".replace(",", " "), delta_color="off")
+        col_nu.metric("Nuvarande värde", f"{scenario[variabel]:,.2f}".replace(",", " "))
+        uppnatt_text = f"{uppnatt:,.2f}".replace(",", " ")
+        st.caption(f"Uppnått mål: {uppnatt_text}. Övriga indata, kalkylperiod, kalkylränta och antaganden är oförändrade.")
+
+
+# Sortering i scenariobiblioteket: etikett -> (kolumn, fallande)
+BIBLIOTEK_SORTERINGAR = {
+    "Nyast först": ('skapad', True),
+    "Kortast payback": ('payback', False),
+    "Flest lägenheter": ('antal_lgh', True),
+}
+BIBLIOTEK_SIDSTORLEK = 25
+
+@st.cache_resource
+def hamta_bibliotek():
+    """Scenariobibliotek (SQLite) som delas av alla sessioner. IOT_SCENARIO_DB anger filen."""
+    return scenariobibliotek.ScenarioBibliotek(os.environ.get('IOT_SCENARIO_DB') or "iot_scenarier.sqlite")
+
+def _bibliotek_forsta_sidan(calc):
+    st.session_state[f'bibliotek_markorer_{calc}'] = [None]
+
+def _bibliotek_nasta_sida(calc, markor):
+    st.session_state[f'bibliotek_markorer_{calc}'].append(markor)
+
+def _bibliotek_foregaende_sida(calc):
+    st.session_state[f'bibliotek_markorer_{calc}'].pop()
+
+def _bibliotek_ladda(calc, etikett_till_id):
+    """Körs före omkörningen, så att även sidofältets reglage kan få de laddade värdena."""
+    post = hamta_bibliotek().hamta(etikett_till_id[st.session_state[f'bibliotek_val_{calc}']])
+    if post is None:
+        return
+    for key, value in post[1].items():
+        st.session_state[key] = value
+    st.session_state[f'bibliotek_laddat_{calc}'] = True
+
+def visa_scenariobibliotek(calc, scenario):
+    """Spara aktuellt scenario i biblioteket, bläddra bland sparade scenarier med filter och ladda ett av dem."""
+    with st.expander("📚 Scenariobibliotek"):
+        bibliotek = hamta_bibliotek()
+        if st.session_state.pop(f'bibliotek_laddat_{calc}', False):
+            st.success("Scenario laddat från biblioteket! Klicka på 'Beräkna ROI' för att visa de nya resultaten.")
+
+        col_namn, col_spara = st.columns([2, 1])
+        namn = col_namn.text_input("Namn på scenariot", key=f'bibliotek_namn_{calc}', placeholder="t.ex. Brf Ekbacken, offert 2")
+        if col_spara.button("Spara i biblioteket", key=f'bibliotek_spara_{calc}'):
+            bibliotek.spara(calc, scenario, namn or None)
+            _bibliotek_forsta_sidan(calc)
+            st.success("Scenariot är sparat.")
+
+        col_payback, col_lgh, col_sort = st.columns(3)
+        max_payback = col_payback.number_input("Max payback (år, 0 = alla)", min_value=0.0, value=0.0, step=0.5, key=f'bibliotek_max_payback_{calc}', on_change=_bibliotek_forsta_sidan, args=(calc,))
+        min_lgh = col_lgh.number_input("Minst antal lägenheter", min_value=0, value=0, step=10, key=f'bibliotek_min_lgh_{calc}', on_change=_bibliotek_forsta_sidan, args=(calc,))
+        sortering, fallande = BIBLIOTEK_SORTERINGAR[col_sort.selectbox("Sortering", list(BIBLIOTEK_SORTERINGAR), key=f'bibliotek_sortering_{calc}', on_change=_bibliotek_forsta_sidan, args=(calc,))]
+
+        filtrering = dict(calc=calc, max_payback=max_payback or None, min_lgh=min_lgh or None)
+        markorer = st.session_state.setdefault(f'bibliotek_markorer_{calc}', [None])
+        rader, nasta = bibliotek.lista(**filtrering, sortering=sortering, fallande=fallande, antal=BIBLIOTEK_SIDSTORLEK, efter=markorer[-1])
+        if not rader:
+            st.info("Inga sparade scenarier matchar filtret.")
+            return
+
+        st.caption(f"{bibliotek.rakna(**filtrering):,} scenarier · sida {len(markorer)}".replace(",", " "))
+        st.dataframe(pd.DataFrame(rader).rename(columns={
+            'namn': "Namn", 'antal_lgh': "Lgh", 'total_initial': "Investering (kr)",
+            'netto': "Netto/år (kr)", 'payback': "Payback (år)", 'skapad': "Skapad (UTC)",
+        }).drop(columns=['calc']), hide_index=True, use_container_width=True)
+
+        col_foreg, col_nasta = st.columns(2)
+        col_foreg.button("← Föregående", key=f'bibliotek_foreg_{calc}', disabled=len(markorer) == 1, on_click=_bibliotek_foregaende_sida, args=(calc,))
+        col_nasta.button("Nästa →", key=f'bibliotek_nasta_{calc}', disabled=nasta is None, on_click=_bibliotek_nasta_sida, args=(calc, nasta))
+
+        etikett_till_id = {f"#{rad['id']} {rad['namn'] or '(namnlöst)'} – {rad['skapad']}": rad['id'] for rad in rader}
+        col_val, col_ladda = st.columns([2, 1])
+        col_val.selectbox("Välj scenario", list(etikett_till_id), key=f'bibliotek_val_{calc}')
+        col_ladda.button("Ladda valt scenario", key=f'bibliotek_ladda_{calc}', on_click=_bibliotek_ladda, args=(calc, etikett_till_id))
+
+
+def visa_massimport(calc):
+    """Beräknar många scenariofiler (JSON, ZIP eller CSV) i ett svep. Felaktiga rader listas separat."""
+    with st.expander("📦 Massimport av scenarier"):
+        st.caption("Ladda upp flera scenariofiler (.json), ett ZIP-arkiv med sådana, eller en CSV med ett scenario per rad. "
+                   "Saknade värden får standardvärden; kolumnerna `id` eller `namn` används som etikett.")
+        filer = st.file_uploader("Scenariofiler", type=list(batch.FILTYPER), accept_multiple_files=True, key=f'massimport_uploader_{calc}')
+        if not filer:
+            return
+
+        poster = (post for fil in filer for post in batch.las_fil(fil.name, fil, calc, strikt=True))
+        rader = batch.berakna_alla(poster)
+        fel = [rad for rad in rader if rad['fel'] is not None]
+        ok = [rad for rad in rader if rad['fel'] is None]
+        st.write(f"**{len(ok):,}** scenarier beräknade, **{len(fel):,}** med fel.".replace(",", " "))
+
+        if ok:
+            resultat_df = pd.DataFrame(ok, columns=['kalla', 'rad', 'id'] + list(batch.RESULTATNYCKLAR)).rename(columns={
+                'kalla': "Fil", 'rad': "Rad", 'id': "Namn/Id", 'total_initial': "Investering (kr)",
+                'total_besparing': "Besparing/år (kr)", 'total_drift_ar': "Drift/år (kr)",
+                'netto': "Netto/år (kr)", 'payback': "Payback (år)",
+            })
+            st.dataframe(resultat_df, hide_index=True, use_container_width=True)
+            st.download_button(
+                label="Ladda ner Resultat (.csv)",
+                data=resultat_df.to_csv(index=False),
+                file_name=f"iot_{calc}_massimport.csv",
+                mime="text/csv",
+                key=f'massimport_ladda_ner_{calc}',
+            )
+        if fel:
+            st.warning("Rader som inte kunde beräknas:")
+            st.dataframe(pd.DataFrame(fel, columns=['kalla', 'rad', 'fel']).rename(columns={'kalla': "Fil", 'rad': "Rad", 'fel': "Fel"}), hide_index=True, use_container_width=True)
+
+
+def _fastnal(calc, scenario, namn):
+    """Fäster ett scenario i jämförelsevyn (körs som callback, före omkörningen)."""
+    try:
+        st.session_state.jamforelse_fastnalda = jamforelse.lagg_till(st.session_state.get('jamforelse_fastnalda', []), namn, calc, scenario)
+    except ValueError as e:
+        st.session_state.jamforelse_fel = [str(e)]
+
+def _fastnal_filer(filer):
+    """Fäster uppladdade scenariofiler. Kalkylen avgörs av nycklarna i filen."""
+    fel = []
+    for fil in filer:
+        fil.seek(0)
+        try:
+            data = json.load(fil)
+            calc, varden = batch.tolka_scenario(data)
+            namn = (data.get('namn') or data.get('id') or os.path.splitext(fil.name)[0])
+            st.session_state.jamforelse_fastnalda = jamforelse.lagg_till(st.session_state.get('jamforelse_fastnalda', []), str(namn), calc, varden)
+        except ValueError as e:
+            fel.append(f"{fil.name}: {e}")
+    st.session_state.jamforelse_fel = fel
+
+def visa_fastnal(calc, scenario):
+    """Knapp som fäster aktuella värden i jämförelsevyn ("⚖️ Jämför Scenarier")."""
+    fastnalda = st.session_state.get('jamforelse_fastnalda', [])
+    namn = st.session_state.get(f'bibliotek_namn_{calc}') or f"{calc} #{len(fastnalda) + 1}"
+    st.button(f"📌 Fäst i jämförelsen ({len(fastnalda)}/{jamforelse.MAX_SCENARIER})", key=f'fastnal_{calc}',
+              on_click=_fastnal, args=(calc, scenario, namn), disabled=len(fastnalda) >= jamforelse.MAX_SCENARIER,
+              help="Jämför scenariot med andra under '⚖️ Jämför Scenarier' i sidofältet. Namnet tas från scenariobiblioteket.")
+
+
+MATARDATA_PERIODER = {"Månad": 'M', "Dag": 'D', "År": 'Y'}
+
+def _anvand_matardata(besparing):
+    """Sätter den uppmätta besparingen i IMD-formuläret (körs före omkörningen)."""
+    st.session_state.besparing_lgh_vatten = besparing
+    # Widgeten skapas med value= från baskeyn; utan sin egen key skapas den om med det nya värdet
+    st.session_state.pop('besparing_lgh_vatten_form', None)
+
+def visa_matardata():
+    """Uppmätt vattenbesparing per lägenhet ur IMD-mätardata, i stället för det antagna värdet."""
+    with st.expander("📏 Uppmätt besparing från mätardata"):
+        st.caption("En rad per avläsning: lägenhet, tidpunkt och förbrukning i m³ sedan föregående avläsning. "
+                   "Filen läses i block, så minnet beror på antalet lägenheter och inte på filens storlek. "
+                   "Mycket stora filer kan läsas med `python matardata.py` i stället för att laddas upp.")
+        fil = st.file_uploader("Mätardata", type=['csv', 'parquet'], key='matardata_uploader')
+        col_lgh, col_tid, col_m3 = st.columns(3)
+        kolumner = {
+            'lgh': col_lgh.text_input("Kolumn för lägenhet", value=matardata.STANDARD_KOLUMNER['lgh'], key='matardata_kolumn_lgh'),
+            'tid': col_tid.text_input("Kolumn för tidpunkt", value=matardata.STANDARD_KOLUMNER['tid'], key='matardata_kolumn_tid'),
+            'm3': col_m3.text_input("Kolumn för förbrukning (m³)", value=matardata.STANDARD_KOLUMNER['m3'], key='matardata_kolumn_m3'),
+        }
+        col_datum, col_pris, col_period = st.columns(3)
+        brytdatum = col_datum.date_input("IMD installerades", value=datetime.date(datetime.date.today().year, 1, 1), key='matardata_brytdatum',
+                                         help="Avläsningar före detta datum räknas som 'före', övriga som 'efter'.")
+        pris_m3 = col_pris.number_input("Vattenpris (kr/m³)", min_value=0.0, value=matardata.STANDARD_PRIS_M3, step=5.0, key='matardata_pris_m3')
+        period = MATARDATA_PERIODER[col_period.selectbox("Period", list(MATARDATA_PERIODER), key='matardata_period')]
+
+        if fil is not None and st.button("Läs in mätardata", key='matardata_las'):
+            try:
+                with st.spinner("Läser mätardata..."):
+                    st.session_state.matardata_resultat = matardata.las_matardata(fil, brytdatum, kolumner, pris_m3, period)
+            except Exception as e:
+                st.error(f"Kunde inte läsa mätardata. Kontrollera kolumnnamnen och formatet: {e}")
+
+        resultat = st.session_state.get('matardata_resultat')
+        if resultat is None:
+            return
+        jamforda = resultat.jamforda
+        col1_kpi, col2_kpi, col3_kpi, col4_kpi = st.columns(4)
+        col1_kpi.metric("Avläsningar", f"{resultat.antal_rader:,}".replace(",", " "))
+        col2_kpi.metric("Lägenheter före och efter", f"{len(jamforda):,} av {len(resultat.per_lgh):,}".replace(",", " "))
+        col3_kpi.metric("Minskning per lgh/år (median)", f"{jamforda['besparing_m3_ar'].median():.1f} m³" if len(jamforda) else "N/A")
+        col4_kpi.metric("Uppmätt besparing per lgh/år", f"{resultat.besparing_lgh_vatten:,.0f} kr".replace(",", " "))
+
+        fig = go.Figure()
+        for fas, namn, farg in zip(matardata.FASER, ("Före", "Efter"), ('#ef553b', '#00cc96')):
+            del_df = resultat.per_period[resultat.per_period['fas'] == fas]
+            fig.add_trace(go.Bar(x=del_df['period'], y=del_df['m3'] / del_df['antal_lgh'], name=namn, marker_color=farg))
+        fig.update_layout(title="Förbrukning per lägenhet och period", xaxis_title="Period", yaxis_title="m³ per lägenhet", template="plotly_white")
+        st.plotly_chart(fig, use_container_width=True)
+
+        besparing = int(round(resultat.besparing_lgh_vatten))
+        st.button(f"Använd {besparing} kr/lgh/år i IMD-kalkylen", key='matardata_anvand', on_click=_anvand_matardata, args=(besparing,),
+                  disabled=not len(jamforda), help="Ersätter 'Vatten/Varmvatten-besparing per lgh/år'. Klicka sedan på 'Beräkna ROI'.")
+        st.download_button(
+            label="Ladda ner Per Lägenhet (.csv)",
+            data=resultat.per_lgh.to_csv(),
+            file_name="iot_imd_uppmatt.csv",
+            mime="text/csv",
+        )
+
+
+def _anvand_inomhustemp(besparing, kwh_kvm):
+    """Sätter uppmätt besparing (och normalårskorrigerad förbrukning) i temp-formuläret."""
+    st.session_state.besparing_temp = besparing
+    st.session_state.pop('besparing_temp_form', None)
+    if kwh_kvm is not None:
+        st.session_state.kwh_kvm = kwh_kvm
+        st.session_state.pop('kwh_kvm_form', None)
+
+def visa_inomhustemp():
+    """Uppmätt energibesparing ur timvärden från temperaturgivarna, graddagsnormerad."""
+    with st.expander("🌡️ Uppmätt besparing från temperaturgivare"):
+        st.caption("Inomhustemperatur per timme i lång form (lägenhet, tidpunkt, temperatur) och utetemperatur (tidpunkt, temperatur). "
+                   "Besparingen är den minskning av gradtimmarna som fås om alla lägenheter över måltemperaturen sänks till den. "
+                   "Stora filer konverteras en gång med `python inomhustemp.py` och analyseras minnesmappat.")
+        col_inne, col_ute = st.columns(2)
+        fil_inne = col_inne.file_uploader("Inomhustemperatur", type=['csv'], key='inomhustemp_uploader')
+        fil_ute = col_ute.file_uploader("Utetemperatur", type=['csv'], key='inomhustemp_ute_uploader')
+        col_mal, col_grans, col_andel = st.columns(3)
+        maltemp = col_mal.number_input("Måltemperatur (°C)", value=inomhustemp.STANDARD_MALTEMP, step=0.5, key='inomhustemp_maltemp')
+        grans = col_grans.number_input("Eldningsgräns (°C)", value=inomhustemp.STANDARD_GRANS, step=0.5, key='inomhustemp_grans')
+        andel = col_andel.slider("Uppvärmningens andel av energin (%)", 0, 100, int(inomhustemp.STANDARD_ANDEL_UPPVARMNING * 100),
+                                 key='inomhustemp_andel', help="Resten, främst varmvatten, påverkas inte av inomhustemperaturen.")
+        col_kwh, col_gd = st.columns(2)
+        uppmatt_kwh = col_kwh.number_input("Uppmätt förbrukning samma år (kWh/m²)", min_value=0.0, value=float(st.session_state.kwh_kvm),
+                                           key='inomhustemp_kwh_kvm')
+        graddagar_normalar = col_gd.number_input("Graddagar normalår (0 = ingen korrigering)", min_value=0.0, value=0.0, step=100.0,
+                                                 key='inomhustemp_graddagar', help="Graddagar för orten med samma bas som eldningsgränsen.")
+
+        if fil_inne is not None and fil_ute is not None and st.button("Analysera temperaturer", key='inomhustemp_las'):
+            try:
+                with st.spinner("Analyserar temperaturer..."), tempfile.TemporaryDirectory() as katalog:
+                    serie = inomhustemp.konvertera_csv(fil_inne, katalog)
+                    ute = inomhustemp.las_utetemp(fil_ute, serie)
+                    st.session_state.inomhustemp_resultat = inomhustemp.analysera(serie, ute, maltemp, grans, andel / 100)
+                    del serie
+            except Exception as e:
+                st.error(f"Kunde inte analysera temperaturerna. Kontrollera kolumnnamnen och formatet: {e}")
+
+        analys = st.session_state.get('inomhustemp_resultat')
+        if analys is None:
+            return
+        scenario = analys.scenario(uppmatt_kwh or None, graddagar_normalar or None)
+        col1_kpi, col2_kpi, col3_kpi, col4_kpi = st.columns(4)
+        col1_kpi.metric("Lägenheter", f"{len(analys.per_lgh):,}".replace(",", " "))
+        col2_kpi.metric("Graddagar mätåret", f"{analys.graddagar:,.0f}".replace(",", " "))
+        col3_kpi.metric("Medelsänkning", f"{analys.per_lgh['sankning'].mean():.2f} °C")
+        col4_kpi.metric("Uppmätt energibesparing", f"{analys.besparing_temp:.1f} %")
+
+        fig = go.Figure(go.Histogram(x=analys.per_lgh['medeltemp'], nbinsx=40, marker_color='#636efa'))
+        fig.add_vline(x=maltemp, line_dash='dash', line_color='#ef553b')
+        fig.update_layout(title="Medeltemperatur under eldningssäsongen per lägenhet", xaxis_title="°C", yaxis_title="Antal lägenheter",
+                          template="plotly_white")
+        st.plotly_chart(fig, use_container_width=True)
+
+        # Reglaget i formuläret går till 15 %
+        besparing = round(min(max(scenario['besparing_temp'], 0.0), 15.0), 1)
+        kwh_kvm = round(scenario['kwh_kvm'], 1) if 'kwh_kvm' in scenario else None
+        etikett = f"Använd {besparing} %" + (f" och {kwh_kvm} kWh/m²" if kwh_kvm is not None else "") + " i temperaturkalkylen"
+        st.button(etikett, key='inomhustemp_anvand', on_click=_anvand_inomhustemp, args=(besparing, kwh_kvm),
+                  help="Ersätter 'Förväntad energibesparing' och 'Förbrukning'. Klicka sedan på 'Beräkna ROI'.")
+        st.download_button(
+            label="Ladda ner Per Lägenhet (.csv)",
+            data=analys.per_lgh.to_csv(),
+            file_name="iot_temp_uppmatt.csv",
+            mime="text/csv",
+        )
+
+
+def _las_timserie(fil, slag):
+    """Timserie ur en uppladdad fil, inläst en gång per session och fil."""
+    cache = st.session_state.setdefault('timpris_serier', {})
+    nyckel = (slag, fil.name, fil.size)
+    if nyckel not in cache:
+        cache[nyckel] = timpris.las_serie(fil)
+    return cache[nyckel]
+
+def visa_timpris():
+    """
+    Timviktat energipris ur prisserie och lastprofil. Returnerar (pris i kr/kWh,
+    behållare för jämförelsen med fast pris), eller (None, None) utan serier.
+    Om priset ska användas i kalkylen anges av kryssrutan 'timpris_anvand'.
+    """
+    with st.expander("⏱️ Timpris och lastprofil"):
+        st.caption("Prisserie (kr/kWh) och värmelastprofil med en rad per timme under året (8 760 eller 8 784 rader). "
+                   "Besparingen fördelas över timmarna efter lastprofilen och värderas med timpriset, så att dyra kalla timmar väger tyngre. "
+                   "Lastprofilen kan ha en kolumn för hela fastigheten eller en per lägenhet.")
+        col_pris, col_last = st.columns(2)
+        fil_pris = col_pris.file_uploader("Prisserie", type=['csv'], key='timpris_uploader')
+        fil_last = col_last.file_uploader("Lastprofil", type=['csv'], key='timpris_last_uploader')
+        tillagg = st.number_input("Påslag utöver timpriset (kr/kWh)", min_value=0.0, value=0.0, step=0.05, key='timpris_tillagg',
+                                  help="Nätavgift, energiskatt m.m. som inte ingår i prisserien.")
+        if fil_pris is None or fil_last is None:
+            return None, None
+        try:
+            pris = _las_timserie(fil_pris, 'pris')
+            last = _las_timserie(fil_last, 'last')
+            if pris.ndim != 1:
+                raise ValueError("prisserien ska ha en numerisk kolumn")
+            # Fastighetens kWh fördelas lika på profilerna, dvs. profilerna vägs lika
+            pris_viktat = timpris.viktat_pris(pris, last, tillagg=tillagg)
+        except Exception as e:
+            st.error(f"Kunde inte läsa timserierna. Kontrollera formatet: {e}")
+            return None, None
+
+        jamforelse = st.container()
+        st.checkbox("Använd timviktat pris i kalkylen", key='timpris_anvand',
+                    help="Ersätter 'Energipris' i kalkylen, kassaflödet och analysverktygen.")
+    return pris_viktat, jamforelse
+
+def visa_timpris_jamforelse(jamforelse, pris_viktat, pris_fast, indata):
+    """Energibesparingen med fast pris och med timviktat pris, för formulärets aktuella indata (TempIndata)."""
+    kwh = kalkyl.total_kwh_fastighet(indata.antal_lgh_main, indata.kvm_snitt, indata.kwh_kvm)
+    besparing_fast = kalkyl.besparing_energi_kr(kwh, pris_fast, indata.besparing_temp)
+    besparing_viktad = kalkyl.besparing_energi_kr(kwh, pris_viktat, indata.besparing_temp)
+    col1_kpi, col2_kpi, col3_kpi = jamforelse.columns(3)
+    col1_kpi.metric("Lastviktat pris", f"{pris_viktat:.3f} kr/kWh", f"{pris_viktat - pris_fast:+.3f} mot fast pris",
+                    delta_color='off')
+    col2_kpi.metric("Energibesparing/år, fast pris", f"{besparing_fast:,.0f} kr".replace(",", " "))
+    col3_kpi.metric("Energibesparing/år, timpris", f"{besparing_viktad:,.0f} kr".replace(",", " "))
+
+
+def _andra_fastighet(lager_nyckel, tabell, argument, rad, nyckel, varde):
+    """Uppdaterar en fastighet i portföljlagret (skapas vid första ändringen) före omkörningen."""
+    if st.session_state.get('portfolj_lager_nyckel') != lager_nyckel:
+        st.session_state.portfolj_lager = portfoljlager.Portfoljlager(tabell, **argument)
+        st.session_state.portfolj_lager_nyckel = lager_nyckel
+    st.session_state.portfolj_lager.uppdatera(rad, {nyckel: varde})
+    st.session_state.pop('portfolj_lager_kontroll', None)
+
+def _kontrollera_lager():
+    st.session_state.portfolj_lager_kontroll = st.session_state.portfolj_lager.kontrollera()
+
+def _aterstall_lager():
+    for nyckel in ('portfolj_lager', 'portfolj_lager_nyckel', 'portfolj_lager_kontroll'):
+        st.session_state.pop(nyckel, None)
+
+
 # --- HUVUDAPPLIKATION FORTSÄTTER ---
 
 st.title("💰 IoT ROI Kalkylator")
@@ -100,6 +966,11 @@ with st.expander("ℹ️ Instruktioner & Wiki – Hur du använder kalkylatorn")
     ### 3. Justera Scenariot & Beräkna
     * I huvudfönstret för din valda kalkyl justerar du de **unika parametrarna** (t.ex. sensorpriser, installationskostnader och besparingsprocenter).
     * **Viktigt:** Klicka på den röda knappen **"Beräkna ROI"** för att utvärdera ditt scenario och uppdatera alla KPI-mätare och kassaflödesgrafen.
+    * **Målsökning:** Under **"🎯 Målsökning"** väljer du en indata och ett mål (t.ex. payback 3 år eller NPV 0 kr). Kalkylatorn räknar ut vilket värde som krävs, t.ex. högsta sensorpris för 3 års payback.
+    * **Skaderisk:** I vattenskadekalkylen simulerar **"🌊 Skaderisk (stokastisk simulering)"** skador per lägenhet och år med tungsvansade skadekostnader. Du ser fördelningen av årlig skadekostnad med och utan sensorer, VaR och expected shortfall samt spridningen i den undvikna kostnaden.
+    * **Uppmätt IMD-besparing:** I IMD-kalkylen läser **"📏 Uppmätt besparing från mätardata"** in avläsningar per lägenhet (CSV eller Parquet) och jämför förbrukningen före och efter installationen. Den uppmätta besparingen kan ersätta det antagna värdet med en knapptryckning.
+    * **Uppmätt temperaturbesparing:** I temperaturkalkylen analyserar **"🌡️ Uppmätt besparing från temperaturgivare"** timvärden per lägenhet mot utetemperaturen. Besparingen räknas som minskade gradtimmar om alla lägenheter över måltemperaturen sänks till den, och en uppmätt förbrukning kan normalårskorrigeras med graddagar.
+    * **Timpris:** Under **"⏱️ Timpris och lastprofil"** i temperaturkalkylen laddar du upp en prisserie och en värmelastprofil per timme. Besparingen värderas då timme för timme, och det lastviktade priset kan användas i stället för det fasta energipriset.
 
     ---
 
@@ -107,37 +978,45 @@ with st.expander("ℹ️ Instruktioner & Wiki – Hur du använder kalkylatorn")
     Du kan spara och ladda dina exakta parameterinställningar för senare användning, arkivering eller jämförelser:
     * **Spara:** Använd knappen **"Spara [Kalkylnamn] Scenario (.json)"** för att ladda ner en JSON-fil med alla aktuella inställningar för den aktiva kalkylen.
     * **Ladda:** Använd **filväljaren** direkt till höger om spara-knappen för att ladda en tidigare sparad fil. Efter laddning, klicka på **"Beräkna ROI"** för att aktivera de nya värdena.
+    * **Massimport:** Under **"📦 Massimport av scenarier"** kan du ladda upp många JSON-filer, ett ZIP-arkiv eller en CSV på en gång. Alla scenarier beräknas direkt i en sorterbar tabell och felaktiga rader listas separat.
+    * **Scenariobibliotek:** Under **"📚 Scenariobibliotek"** sparas scenarier med namn i en lokal databas. Filtrera på payback och antal lägenheter, bläddra sida för sida och ladda ett sparat scenario direkt.
+
+    ---
+
+    ### 5. Portfölj (flera fastigheter)
+    * Välj **`🏢 Portfölj`** i sidofältet och ladda upp en CSV med en rad per fastighet. Kolumnnamnen är desamma som i de sparade scenariofilerna (t.ex. `antal_lgh_main`, `pris_sensor_temp`).
+    * Kolumner som saknas tar värdet från sidofältet och kalkylformulären. Alla tre kalkylerna beräknas för samtliga fastigheter på en gång.
+    * **"🎯 Målsökning för hela portföljen"** ställer samma fråga för varje fastighet, t.ex. vilken energibesparing varje fastighet behöver för att gå jämnt ut.
+    * **"💰 Budgetoptimering"** fördelar en investeringsbudget: varje fastighet får den lösning (eller kombination) som ger högst summa NPV för portföljen. Optimalitetsgapet visar hur långt från bästa möjliga fördelning resultatet högst kan vara.
+    * **"✏️ Ändra enskilda fastigheter"** ändrar en indata för en fastighet (t.ex. antal lägenheter efter en renovering). Bara den fastigheten räknas om och portföljaggregaten uppdateras stegvis; *Kontrollera mot full omräkning* bekräftar att summorna stämmer.
+    * Stora portföljer (från 100 000 fastigheter) och Monte Carlo-körningar med många dragningar räknas på alla processorkärnor med en förloppsindikator. Klicka **Avbryt** för att stoppa en pågående körning.
+    * **Bakgrundsjobb:** Kryssa i *Kör som bakgrundsjobb* i Monte Carlo-analysen (portföljer från 500 000 fastigheter körs alltid så). Jobbet körs i en gemensam kö och fortsätter även om du ändrar något eller laddar om sidan; panelen *Bakgrundsjobb* i sidofältet visar status och öppnar färdiga resultat.
+
+    ---
+
+    ### 6. Jämför Scenarier
+    * Klicka **"📌 Fäst i jämförelsen"** i en kalkyl för att spara de aktuella värdena, eller välj **`⚖️ Jämför Scenarier`** och fäst aktuella värden eller uppladdade scenariofiler (.json).
+    * Upp till 50 scenarier, även från olika kalkyler, räknas tillsammans och visas i samma kassaflödesgraf och nyckeltalstabell.
+
+    ---
+
+    ### 7. Kalkylperiod, NPV och IRR
+    * **Kalkylperiod (år)** och **Kalkylränta (%)** i sidofältet styr kassaflödesgrafen och de diskonterade nyckeltalen.
+    * Kassaflödet byggs år för år: energi-/vattenpris och driftkostnader kan räknas upp årligen, batterier kan bytas vart N:e år och sensorerna köpas om när livslängden är slut. Med standardvärdena (0) är nettot detsamma varje år.
+    * **NPV** är nuvärdet av investeringen och alla årliga nettobesparingar under perioden. **IRR** är den ränta där NPV blir noll. **Diskonterad payback** är tiden tills de diskonterade besparingarna täcker investeringen (visas som "> N år" om det inte sker inom perioden).
     """)
 st.markdown("---")
 
 # --- INITIALISERING AV SESSION STATE ---
-if 'antal_lgh_main' not in st.session_state: st.session_state.antal_lgh_main = 1000
-if 'uh_per_sensor' not in st.session_state: st.session_state.uh_per_sensor = 100
-if 'lora_cost' not in st.session_state: st.session_state.lora_cost = 75
-if 'web_cost' not in st.session_state: st.session_state.web_cost = 50
-if 'app_cost' not in st.session_state: st.session_state.app_cost = 5000
-
-if 'pris_sensor_temp' not in st.session_state: st.session_state.pris_sensor_temp = 688
-if 'pris_install_temp' not in st.session_state: st.session_state.pris_install_temp = 409
-if 'startkostnad_temp' not in st.session_state: st.session_state.startkostnad_temp = 27500
-if 'kvm_snitt' not in st.session_state: st.session_state.kvm_snitt = 67
-if 'kwh_kvm' not in st.session_state: st.session_state.kwh_kvm = 130.6
-if 'pris_kwh' not in st.session_state: st.session_state.pris_kwh = 1.02
-if 'besparing_temp' not in st.session_state: st.session_state.besparing_temp = 6.0
-if 'uh_besparing_temp' not in st.session_state: st.session_state.uh_besparing_temp = 200
-
-if 'pris_sensor_imd' not in st.session_state: st.session_state.pris_sensor_imd = 1875
-if 'pris_install_imd' not in st.session_state: st.session_state.pris_install_imd = 459
-if 'besparing_lgh_vatten' not in st.session_state: st.session_state.besparing_lgh_vatten = 500
-if 'besparing_lgh_uh_imd' not in st.session_state: st.session_state.besparing_lgh_uh_imd = 200
-
-if 'pris_sensor_skada' not in st.session_state: st.session_state.pris_sensor_skada = 714.42
-if 'pris_install_skada' not in st.session_state: st.session_state.pris_install_skada = 523
-if 'kostnad_skada' not in st.session_state: st.session_state.kostnad_skada = 70000
-if 'frekvens_skada' not in st.session_state: st.session_state.frekvens_skada = 50
-if 'besparing_skada_pct' not in st.session_state: st.session_state.besparing_skada_pct = 60.0
-if 'uh_besparing_skada_lgh' not in st.session_state: st.session_state.uh_besparing_skada_lgh = 171
+for nyckel, standardvarde in kalkyl.STANDARDVARDEN.items():
+    if nyckel not in st.session_state: st.session_state[nyckel] = standardvarde
+if 'horisont_ar' not in st.session_state: st.session_state.horisont_ar = portfolj.AR
+if 'kalkylranta' not in st.session_state: st.session_state.kalkylranta = finans.STANDARD_RANTA
+for nyckel, standardvarde in kassaflode.STANDARDANTAGANDEN.items():
+    if nyckel not in st.session_state: st.session_state[nyckel] = standardvarde
+
 
+profil.klar("initiering")
 
 # --- NAVIGATION OCH SIDEBAR FÖR GEMENSAMMA INDATA ---
 
@@ -174,8 +1053,18 @@ with st.sidebar:
     applikation_kostnad = st.number_input("Applikationskostnad (fast avgift/år)", value=st.session_state.app_cost, key='app_cost', format="%i")
     
     # Total årlig drift (Används i alla kalkyler)
-    total_drift_ar_per_sensor = underhall_per_sensor + lora_kostnad + webiot_kostnad
-    total_drift_ar = (antal_lgh * total_drift_ar_per_sensor) + applikation_kostnad
+    total_drift_ar = kalkyl.total_drift_ar(antal_lgh, underhall_per_sensor, lora_kostnad, webiot_kostnad, applikation_kostnad)
+    gemensamma_indata = {k: st.session_state[k] for k in kalkyl.GEMENSAMMA_NYCKLAR}
+
+    st.subheader("Kalkylperiod och Ränta")
+    st.number_input("Kalkylperiod (år)", min_value=1, max_value=50, step=1, key='horisont_ar', help="Horisont för kassaflödesgraf, NPV, IRR och diskonterad payback.")
+    st.number_input("Kalkylränta (%)", min_value=0.0, max_value=50.0, step=0.5, key='kalkylranta', format="%.1f")
+    st.number_input("Prisökning energi/vatten/skador (%/år)", min_value=-20.0, max_value=50.0, step=0.5, key='prisokning_pct', format="%.1f", help="Räknar upp pris_kwh (och vatten- resp. skadekostnaden) år för år.")
+    st.number_input("Kostnadsökning drift/underhåll (%/år)", min_value=-20.0, max_value=50.0, step=0.5, key='kostnadsokning_pct', format="%.1f")
+    st.number_input("Batteribyte vart N:e år (0 = jämnt varje år)", min_value=0, max_value=30, step=1, key='batteribyte_ar', help="Underhåll/batteri per sensor tas som en klumpsumma (N × årsbeloppet) vid varje byte.")
+    st.number_input("Sensorernas livslängd (år, 0 = hela perioden)", min_value=0, max_value=50, step=1, key='livslangd_ar', help="Sensorer och installation köps om vid livslängdens slut.")
+
+profil.klar("sidofält")
 
 
 # --- 2. INNEHÅLLSBLOCK STYRS AV active_tab ---
@@ -184,6 +1073,7 @@ with st.sidebar:
 if active_tab == "":
     st.info("👋 Välkommen! Vänligen välj en kalkyl i sidofältet till vänster (t.ex. '🌡️ Temperatur & Energi') för att börja beräkna ROI.")
     st.snow() 
+    profil.klar("start")
 
 # --- FLIK 1: TEMPERATUR & ENERGI (Kompakt Layout & 536 kr beräkning) ---
 elif active_tab == "temp":
@@ -199,15 +1089,7 @@ elif active_tab == "temp":
     
     # 1. Spara-knapp (Vänster kolumn)
     with col_save:
-        scenario_data_to_save = {
-            'antal_lgh_main': st.session_state.antal_lgh_main, 'uh_per_sensor': st.session_state.uh_per_sensor,
-            'lora_cost': st.session_state.lora_cost, 'web_cost': st.session_state.web_cost,
-            'app_cost': st.session_state.app_cost, 'pris_sensor_temp': st.session_state.pris_sensor_temp,
-            'pris_install_temp': st.session_state.pris_install_temp, 'startkostnad_temp': st.session_state.startkostnad_temp,
-            'kvm_snitt': st.session_state.kvm_snitt, 'kwh_kvm': st.session_state.kwh_kvm,
-            'pris_kwh': st.session_state.pris_kwh, 'besparing_temp': st.session_state.besparing_temp,
-            'uh_besparing_temp': st.session_state.uh_besparing_temp
-        }
+        scenario_data_to_save = {k: st.session_state[k] for k in kalkyl.SCENARIO_NYCKLAR['temp']}
         json_data = json.dumps(scenario_data_to_save, indent=4)
         
         st.download_button(
@@ -236,6 +1118,13 @@ elif active_tab == "temp":
             except Exception as e:
                 st.error(f"Kunde inte ladda filen. Kontrollera formatet: {e}")
                 
+    visa_scenariobibliotek('temp', scenario_data_to_save)
+    visa_massimport('temp')
+    visa_fastnal('temp', scenario_data_to_save)
+    visa_inomhustemp()
+    pris_viktat, timpris_jamforelse = visa_timpris()
+    pris_timviktat = pris_viktat if pris_viktat is not None and st.session_state.get('timpris_anvand') else None
+    profil.klar("temp/spara_ladda")
     st.markdown("---")
 
     
@@ -250,9 +1139,6 @@ elif active_tab == "temp":
             pris_install_temp = st.number_input("Installation/Konfig. per sensor (kr)", value=st.session_state.pris_install_temp, key='pris_install_temp_form', format="%i") 
             startkostnad_projekt_temp = st.number_input("Projektstartkostnad (kr)", value=st.session_state.startkostnad_temp, key='startkostnad_temp_form', format="%i")
             # -----------------------------
-            
-            # --- BERÄKNING: INITIAL KOSTNAD ---
-            total_initial_temp = antal_lgh * (pris_sensor_temp * 1.01 + pris_install_temp) + startkostnad_projekt_temp 
 
         with col2:
             st.subheader("Besparingsparametrar")
@@ -261,31 +1147,29 @@ elif active_tab == "temp":
             kvm_snitt = st.number_input("Snittyta per lgh (kvm)", value=st.session_state.kvm_snitt, key='kvm_snitt_form', format="%i")
             energiforbrukning_kvm = st.number_input("Förbrukning (kWh/m²/år)", value=st.session_state.kwh_kvm, key='kwh_kvm_form')
             energipris = st.number_input("Energipris (kr/kWh)", value=st.session_state.pris_kwh, key='pris_kwh_form')
+            if pris_timviktat is not None:
+                st.caption(f"Kalkylen använder det timviktade priset {pris_timviktat:.3f} kr/kWh i stället för Energipris.")
             besparing_procent = st.slider("Förväntad energibesparing (%)", 0.0, 15.0, value=st.session_state.besparing_temp, step=0.1, key='besparing_temp_form')
             underhall_besparing_lgh = st.number_input("Minskat underhåll/lgh (kr/år)", value=st.session_state.uh_besparing_temp, key='uh_besparing_temp_form', format="%i")
             # -----------------------------
             
-            # --- BERÄKNING: NETTO/BESPARING ---
-            total_kwh_fastighet = antal_lgh * kvm_snitt * energiforbrukning_kvm
-            
-            # 1. Total Energibesparing (Rått värde)
-            besparing_energi_kr = total_kwh_fastighet * energipris * (besparing_procent / 100)
-            
-            # 2. Total Underhållsbesparing
-            besparing_underhall_kr = antal_lgh * underhall_besparing_lgh
-            
-            # Total Bruttobesparing (Energibesparing + Underhållsbesparing)
-            total_besparing_temp = besparing_energi_kr + besparing_underhall_kr
-            
-            # Nettoresultat (Total Bruttobesparing minus Total Driftkostnad)
-            netto_temp = total_besparing_temp - total_drift_ar
-            payback_temp = total_initial_temp / netto_temp if netto_temp > 0 else 0
-            
-            # Beräkning för KPI #1: Brutto Energibesparing/Lgh/år (536 kr)
-            besparing_lgh_ar = (kvm_snitt * energiforbrukning_kvm * energipris * (besparing_procent / 100)) 
 
+        # --- BERÄKNING (kalkyl.py) ---
+        indata_temp = kalkyl.TempIndata(
+            **gemensamma_indata,
+            pris_sensor_temp=pris_sensor_temp, pris_install_temp=pris_install_temp,
+            startkostnad_temp=startkostnad_projekt_temp, kvm_snitt=kvm_snitt, kwh_kvm=energiforbrukning_kvm,
+            pris_kwh=energipris if pris_timviktat is None else pris_timviktat, besparing_temp=besparing_procent, uh_besparing_temp=underhall_besparing_lgh,
+        )
+        resultat_temp = berakna_graf('temp', indata_temp)
+        if pris_viktat is not None:
+            visa_timpris_jamforelse(timpris_jamforelse, pris_viktat, energipris, indata_temp)
+        total_initial_temp = resultat_temp.total_initial
+        netto_temp = resultat_temp.netto
+        payback_temp = resultat_temp.payback
+        # KPI #1: Brutto Energibesparing/Lgh/år (536 kr)
+        besparing_lgh_ar = resultat_temp.besparing_lgh_ar
 
-        
         # Knappen för att utlösa omkörning (Commit)
         if st.form_submit_button(label='Beräkna ROI', type='primary'):
             # Uppdatera session_state med formulärvärden efter commit, för att spara dem
@@ -301,10 +1185,19 @@ elif active_tab == "temp":
     # --- RESULTAT DISPLAY (Utanför Form) ---
     st.subheader("📊 Nyckeltal (KPIer) & ROI-Resultat") 
     display_kpis_5_temp(total_initial_temp, netto_temp, payback_temp, besparing_lgh_ar, total_drift_ar)
+    arsfloden_temp = berakna_arsfloden('temp', indata_temp)
+    display_kpis_finans(arsfloden_temp)
     
     st.markdown("---")
-    fig_temp, _ = create_cashflow_chart(total_initial_temp, netto_temp, "Ackumulerat Kassaflöde (Temperatur)")
-    st.plotly_chart(fig_temp, use_container_width=True)
+    profil.klar("temp/formulär_och_nyckeltal")
+    visa_cashflow_chart('temp', indata_temp)
+    profil.klar("temp/diagram")
+
+    visa_kanslighet('temp', indata_temp.as_dict())
+    visa_heatmap('temp', indata_temp.as_dict())
+    visa_malsokning('temp', indata_temp.as_dict())
+    visa_monte_carlo('temp', indata_temp.as_dict())
+    profil.klar("temp/analysverktyg")
 
 # --- FLIK 2: IMD: VATTENFÖRBRUKNING (Kompakt Layout) ---
 elif active_tab == "imd":
@@ -320,13 +1213,7 @@ elif active_tab == "imd":
     
     # 1. Spara-knapp (Vänster kolumn)
     with col_save:
-        scenario_data_to_save = {
-            'antal_lgh_main': st.session_state.antal_lgh_main, 'uh_per_sensor': st.session_state.uh_per_sensor,
-            'lora_cost': st.session_state.lora_cost, 'web_cost': st.session_state.web_cost,
-            'app_cost': st.session_state.app_cost, 'pris_sensor_imd': st.session_state.pris_sensor_imd,
-            'pris_install_imd': st.session_state.pris_install_imd, 'besparing_lgh_vatten': st.session_state.besparing_lgh_vatten,
-            'besparing_lgh_uh_imd': st.session_state.besparing_lgh_uh_imd
-        }
+        scenario_data_to_save = {k: st.session_state[k] for k in kalkyl.SCENARIO_NYCKLAR['imd']}
         json_data = json.dumps(scenario_data_to_save, indent=4)
         
         st.download_button(
@@ -354,6 +1241,11 @@ elif active_tab == "imd":
             except Exception as e:
                 st.error(f"Kunde inte ladda filen. Kontrollera formatet: {e}")
 
+    visa_scenariobibliotek('imd', scenario_data_to_save)
+    visa_massimport('imd')
+    visa_fastnal('imd', scenario_data_to_save)
+    visa_matardata()
+    profil.klar("imd/spara_ladda")
     st.markdown("---")
 
     with st.form(key='imd_form'):
@@ -366,18 +1258,22 @@ elif active_tab == "imd":
             pris_install_imd = st.number_input("Installation/Konfig per mätare (kr)", value=st.session_state.pris_install_imd, key='pris_install_imd_form', format="%i") 
             # -----------------------------
             
-            total_initial_imd = antal_lgh * (pris_sensor_imd + pris_install_imd) + (5 * pris_sensor_imd) 
-            
         with col4:
             st.subheader("Besparingsparametrar (Förbrukning)")
             # --- TUSENTALSSEPARATOR HÄR ---
             besparing_per_lgh_vatten = st.number_input("Vatten/Varmvatten-besparing per lgh/år (kr)", value=st.session_state.besparing_lgh_vatten, key='besparing_lgh_vatten_form', format="%i")
             besparing_per_lgh_underhall = st.number_input("Minskat underhåll/lgh (kr/år)", value=st.session_state.besparing_lgh_uh_imd, key='besparing_lgh_uh_imd_form', format="%i")
             # -----------------------------
-            
-            total_besparing_imd = antal_lgh * (besparing_per_lgh_vatten + besparing_per_lgh_underhall)
-            netto_imd = total_besparing_imd - total_drift_ar
-            payback_imd = total_initial_imd / netto_imd if netto_imd > 0 else 0
+
+        indata_imd = kalkyl.ImdIndata(
+            **gemensamma_indata,
+            pris_sensor_imd=pris_sensor_imd, pris_install_imd=pris_install_imd,
+            besparing_lgh_vatten=besparing_per_lgh_vatten, besparing_lgh_uh_imd=besparing_per_lgh_underhall,
+        )
+        resultat_imd = berakna_graf('imd', indata_imd)
+        total_initial_imd = resultat_imd.total_initial
+        netto_imd = resultat_imd.netto
+        payback_imd = resultat_imd.payback
 
         if st.form_submit_button(label='Beräkna ROI', type='primary'):
             st.session_state.pris_sensor_imd = pris_sensor_imd
@@ -388,9 +1284,18 @@ elif active_tab == "imd":
     st.subheader("📊 Nyckeltal (KPIer) & ROI-Resultat")
     # ANVÄND display_kpis_3 för IMD
     display_kpis_3(total_initial_imd, netto_imd, payback_imd)
+    arsfloden_imd = berakna_arsfloden('imd', indata_imd)
+    display_kpis_finans(arsfloden_imd)
     st.markdown("---")
-    fig_imd, _ = create_cashflow_chart(total_initial_imd, netto_imd, "Ackumulerat Kassaflöde (IMD Vatten)")
-    st.plotly_chart(fig_imd, use_container_width=True)
+    profil.klar("imd/formulär_och_nyckeltal")
+    visa_cashflow_chart('imd', indata_imd)
+    profil.klar("imd/diagram")
+
+    visa_kanslighet('imd', indata_imd.as_dict())
+    visa_heatmap('imd', indata_imd.as_dict())
+    visa_malsokning('imd', indata_imd.as_dict())
+    visa_monte_carlo('imd', indata_imd.as_dict())
+    profil.klar("imd/analysverktyg")
 
 # --- FLIK 3: VATTENSKADESKYDD (Kompakt Layout) ---
 elif active_tab == "skada":
@@ -406,14 +1311,7 @@ elif active_tab == "skada":
     
     # 1. Spara-knapp (Vänster kolumn)
     with col_save:
-        scenario_data_to_save = {
-            'antal_lgh_main': st.session_state.antal_lgh_main, 'uh_per_sensor': st.session_state.uh_per_sensor,
-            'lora_cost': st.session_state.lora_cost, 'web_cost': st.session_state.web_cost,
-            'app_cost': st.session_state.app_cost, 'pris_sensor_skada': st.session_state.pris_sensor_skada,
-            'pris_install_skada': st.session_state.pris_install_skada, 'kostnad_skada': st.session_state.kostnad_skada,
-            'frekvens_skada': st.session_state.frekvens_skada, 'besparing_skada_pct': st.session_state.besparing_skada_pct,
-            'uh_besparing_skada_lgh': st.session_state.uh_besparing_skada_lgh
-        }
+        scenario_data_to_save = {k: st.session_state[k] for k in kalkyl.SCENARIO_NYCKLAR['skada']}
         json_data = json.dumps(scenario_data_to_save, indent=4)
         
         st.download_button(
@@ -441,6 +1339,10 @@ elif active_tab == "skada":
             except Exception as e:
                 st.error(f"Kunde inte ladda filen. Kontrollera formatet: {e}")
 
+    visa_scenariobibliotek('skada', scenario_data_to_save)
+    visa_massimport('skada')
+    visa_fastnal('skada', scenario_data_to_save)
+    profil.klar("skada/spara_ladda")
     st.markdown("---")
     
     with st.form(key='skada_form'):
@@ -453,8 +1355,6 @@ elif active_tab == "skada":
             pris_install_skada = st.number_input("Installation/Konfig per sensor (kr)", value=st.session_state.pris_install_skada, key='pris_install_skada_form', format="%i") 
             # -----------------------------
             
-            total_initial_skada = antal_lgh * (pris_sensor_skada + pris_install_skada)
-            
         with col6:
             st.subheader("Besparingsparametrar (Skadereduktion)")
             # --- TUSENTALSSEPARATOR HÄR ---
@@ -463,13 +1363,19 @@ elif active_tab == "skada":
             besparing_procent_skador = st.slider("Förväntad Minskning av Skadekostnad (%)", 0.0, 90.0, value=st.session_state.besparing_skada_pct, step=5.0, key='besparing_skada_pct_form')
             uh_besparing_skada_lgh = st.number_input("Övrig underhållsbesparing per lgh/år (kr)", value=st.session_state.uh_besparing_skada_lgh, key='uh_besparing_skada_lgh_form', format="%i")
             # -----------------------------
-            
-            tot_skadekostnad_utan_iot = (antal_lgh / 1000) * (frekvens_vattenskada * kostnad_vattenskada)
-            besparing_skador_kr = tot_skadekostnad_utan_iot * (besparing_procent_skador / 100)
-            
-            total_besparing_skada = besparing_skador_kr + (antal_lgh * uh_besparing_skada_lgh)
-            netto_skada = total_besparing_skada - total_drift_ar
-            payback_skada = total_initial_skada / netto_skada if netto_skada > 0 else 0
+
+        indata_skada = kalkyl.SkadaIndata(
+            **gemensamma_indata,
+            pris_sensor_skada=pris_sensor_skada, pris_install_skada=pris_install_skada,
+            kostnad_skada=kostnad_vattenskada, frekvens_skada=frekvens_vattenskada,
+            besparing_skada_pct=besparing_procent_skador, uh_besparing_skada_lgh=uh_besparing_skada_lgh,
+        )
+        resultat_skada = berakna_graf('skada', indata_skada)
+        total_initial_skada = resultat_skada.total_initial
+        netto_skada = resultat_skada.netto
+        payback_skada = resultat_skada.payback
+        tot_skadekostnad_utan_iot = resultat_skada.tot_skadekostnad_utan_iot
+        besparing_skador_kr = resultat_skada.besparing_skador_kr
 
         if st.form_submit_button(label='Beräkna ROI', type='primary'):
             st.session_state.pris_sensor_skada = pris_sensor_skada
@@ -482,10 +1388,342 @@ elif active_tab == "skada":
     st.subheader("📊 Nyckeltal (KPIer) & ROI-Resultat")
     # ANVÄND display_kpis_3 för Skada
     display_kpis_3(total_initial_skada, netto_skada, payback_skada)
+    arsfloden_skada = berakna_arsfloden('skada', indata_skada)
+    display_kpis_finans(arsfloden_skada)
     st.markdown("---")
-    fig_skada, _ = create_cashflow_chart(total_initial_skada, netto_skada, "Ackumulerat Kassaflöde (Vattenskadeskydd)")
-    st.plotly_chart(fig_skada, use_container_width=True)
+    profil.klar("skada/formulär_och_nyckeltal")
+    visa_cashflow_chart('skada', indata_skada)
+    profil.klar("skada/diagram")
     
     st.markdown("#### Beräkningsdetaljer")
     st.write(f"Besparing från undvikna skadekostnader ({st.session_state.besparing_skada_pct:.1f}% av {tot_skadekostnad_utan_iot:,.0f} kr): **{besparing_skador_kr:,.0f} kr**")
     st.write(f"Övrig underhållsbesparing (från Excel): **{antal_lgh * st.session_state.uh_besparing_skada_lgh:,.0f} kr**")
+
+    visa_kanslighet('skada', indata_skada.as_dict())
+    visa_heatmap('skada', indata_skada.as_dict())
+    visa_malsokning('skada', indata_skada.as_dict())
+    visa_monte_carlo('skada', indata_skada.as_dict())
+    visa_skadesimulering(indata_skada.as_dict())
+    profil.klar("skada/analysverktyg")
+
+# --- FLIK 4: PORTFÖLJ (Alla kalkyler för många fastigheter i ett svep) ---
+elif active_tab == "portfolj":
+    st.header("Portföljkalkyl")
+    st.markdown("Fokus: ROI för alla fastigheter i portföljen på en gång – en rad per fastighet, alla tre kalkylerna.")
+    st.markdown("---")
+
+    st.subheader("📥 Ladda Portfölj (.csv)")
+    col_mall, col_load = st.columns([1, 2])
+
+    # Aktuella värden används för kolumner som saknas i filen
+    aktuella_varden = {k: st.session_state[k] for k in kalkyl.STANDARDVARDEN}
+
+    with col_mall:
+        mall = pd.DataFrame([aktuella_varden])
+        st.download_button(
+            label="Ladda ner Portföljmall (.csv)",
+            data=mall.to_csv(index=False),
+            file_name="iot_portfolj_mall.csv",
+            mime="text/csv",
+            help="En rad med alla kolumner och aktuella värden. Fyll på med en rad per fastighet."
+        )
+
+    with col_load:
+        st.markdown('<p style="font-size: 0.9em; margin-bottom: -15px; padding: 0;">Ladda Portfölj (.csv)</p>', unsafe_allow_html=True)
+        uploaded_file = st.file_uploader(label="", type="csv", key='portfolj_uploader')
+
+    st.markdown("---")
+
+    if uploaded_file is None:
+        st.info("Ladda upp en portfölj-CSV för att beräkna alla fastigheter. Ladda ner mallen för rätt kolumnnamn.")
+    else:
+        try:
+            portfolj_df = pd.read_csv(uploaded_file)
+            portfolj_argument = dict(ar=st.session_state.horisont_ar, standard=aktuella_varden, ranta=st.session_state.kalkylranta, antaganden=antaganden_fran_session(),
+                                     med_irr=True)
+            # Ändrade fastigheter gäller så länge filen och antagandena är desamma
+            lager_nyckel = (uploaded_file.name, uploaded_file.size, repr(portfolj_argument))
+            if st.session_state.get('portfolj_lager_nyckel') == lager_nyckel:
+                portfolj_resultat = st.session_state.portfolj_lager.som_resultat()
+                portfolj_df = pd.DataFrame(portfolj_resultat.indata)
+            elif len(portfolj_df) >= BAKGRUND_FASTIGHETER:
+                # Samma fil och antaganden ger samma jobb, så varje omkörning hittar jobbet igen
+                jobbargument = dict(tabell=portfolj_df, **portfolj_argument)
+                antal_text = f"{len(portfolj_df):,}".replace(",", " ")
+                jobbetikett = f"{uploaded_file.name}, {antal_text} fastigheter"
+                status, portfolj_resultat = bevaka_jobb(hamta_jobbko().skicka('portfolj', jobbargument, etikett=jobbetikett),
+                                                        "Beräknar portföljen i bakgrunden...")
+                if portfolj_resultat is None:
+                    if status not in jobb.VANTANDE:
+                        st.button("Beräkna igen", key='portfolj_omstart', on_click=hamta_jobbko().skicka,
+                                  args=('portfolj', jobbargument), kwargs=dict(etikett=jobbetikett, omstart=True))
+                    uppdatera_vid_vantande_jobb()
+                    st.stop()
+            elif len(portfolj_df) >= PARALLELL_FASTIGHETER and parallell.antal_processer() > 1:
+                st.button("Avbryt", key='portfolj_avbryt')
+                forlopp = st.progress(0.0, text="Beräknar portföljen...")
+
+                def visa_forlopp(klara, totalt, summor):
+                    antal_klara = summor[kalkyl.CALC_KEY_LIST[0]]['antal_fastigheter']
+                    forlopp.progress(klara / totalt, text=f"Beräknar portföljen... {antal_klara:,} av {len(portfolj_df):,} fastigheter".replace(",", " "))
+
+                portfolj_resultat = parallell.berakna_portfolj(portfolj_df, vid_delresultat=visa_forlopp, **portfolj_argument)
+                forlopp.empty()
+            else:
+                portfolj_resultat = berakna_portfolj_cachad(uploaded_file.getvalue(), portfolj_argument, portfolj_df)
+        except Exception as e:
+            st.error(f"Kunde inte beräkna portföljen. Kontrollera formatet: {e}")
+            st.stop()
+
+        st.subheader(f"📊 Portföljaggregat ({portfolj_resultat.n:,} fastigheter)".replace(",", " "))
+        namn_per_calc = {v: k for k, v in CALC_OPTIONS.items()}
+        aggregat_rader = []
+        for calc, agg in portfolj_resultat.aggregat.items():
+            aggregat_rader.append({
+                "Kalkyl": namn_per_calc[calc],
+                "Total Investering (kr)": agg['summa_total_initial'],
+                "Årlig Nettobesparing (kr)": agg['summa_netto'],
+                "Payback Portfölj (år)": agg['payback_portfolj'],
+                "Payback Median (år)": agg['payback_median'],
+                "Summa NPV (kr)": agg['summa_npv'],
+                "Lönsamma fastigheter": agg['antal_lonsamma'],
+            })
+        st.dataframe(pd.DataFrame(aggregat_rader), hide_index=True, use_container_width=True)
+
+        vald_namn = st.radio("Visa kassaflöde för:", options=[namn_per_calc[c] for c in kalkyl.CALC_KEY_LIST], horizontal=True, key='portfolj_calc')
+        vald_calc = CALC_OPTIONS[vald_namn]
+        agg = portfolj_resultat.aggregat[vald_calc]
+        display_kpis_3(agg['summa_total_initial'], agg['summa_netto'], agg['payback_portfolj'])
+        display_kpis_finans(agg['arsfloden_portfolj'])
+        fig_portfolj, _ = create_cashflow_chart(agg['arsfloden_portfolj'], f"Ackumulerat Kassaflöde (Portfölj, {namn_per_calc[vald_calc]})")
+        st.plotly_chart(fig_portfolj, use_container_width=True)
+
+        st.markdown("#### Resultat per fastighet")
+        resultat_df = portfolj_resultat.som_dataframe()
+        st.dataframe(resultat_df, use_container_width=True)
+        st.download_button(
+            label="Ladda ner Resultat (.csv)",
+            data=resultat_df.to_csv(index=False),
+            file_name="iot_portfolj_resultat.csv",
+            mime="text/csv",
+        )
+
+        with st.expander("✏️ Ändra enskilda fastigheter"):
+            st.caption("Bara den ändrade fastigheten räknas om; portföljaggregaten uppdateras stegvis. "
+                       "Ändringarna gäller tills filen eller antagandena i sidofältet ändras.")
+            col_rad, col_nyckel, col_varde = st.columns(3)
+            andra_rad = int(col_rad.number_input("Rad", min_value=0, max_value=portfolj_resultat.n - 1, value=0, step=1, key='portfolj_andra_rad', format="%i"))
+            andra_nyckel = col_nyckel.selectbox("Indata", list(kalkyl.STANDARDVARDEN), key='portfolj_andra_nyckel')
+            nuvarande = portfolj_resultat.indata[andra_nyckel][andra_rad] if andra_nyckel in portfolj_resultat.indata else aktuella_varden[andra_nyckel]
+            andra_varde = col_varde.number_input("Nytt värde", value=float(nuvarande), key='portfolj_andra_varde')
+            col_andra, col_kontroll, col_aterstall = st.columns(3)
+            col_andra.button("Uppdatera fastighet", key='portfolj_andra', type='primary', on_click=_andra_fastighet,
+                             args=(lager_nyckel, portfolj_df, portfolj_argument, andra_rad, andra_nyckel, andra_varde))
+            lager_aktivt = st.session_state.get('portfolj_lager_nyckel') == lager_nyckel
+            col_kontroll.button("Kontrollera mot full omräkning", key='portfolj_kontrollera', on_click=_kontrollera_lager, disabled=not lager_aktivt)
+            col_aterstall.button("Återställ till filen", key='portfolj_aterstall', on_click=_aterstall_lager, disabled=not lager_aktivt)
+            kontroll = st.session_state.get('portfolj_lager_kontroll')
+            if lager_aktivt and kontroll is not None:
+                stammer = all(k['antal_stammer'] and max(k['summor'], k['rader'], k['floden']) < 1e-9 for k in kontroll.values())
+                st.caption(("✅ Stämmer" if stammer else "⚠️ Avviker") + " med full omräkning. Största relativa avvikelse: "
+                           + ", ".join(f"{namn_per_calc[c]} {max(k['summor'], k['rader'], k['floden']):.1e}" for c, k in kontroll.items()))
+
+        with st.expander(f"🎯 Målsökning för hela portföljen ({namn_per_calc[vald_calc]})"):
+            variabel, mal, malvarde = valj_malsokning(vald_calc, 'portfolj_malsokning')
+            try:
+                losning = malsokning.los_portfolj(
+                    vald_calc, portfolj_df, variabel, mal, malvarde, standard=aktuella_varden,
+                    ar=st.session_state.horisont_ar, ranta=st.session_state.kalkylranta, antaganden=antaganden_fran_session(),
+                )
+            except ValueError as e:
+                st.warning(str(e))
+            else:
+                losbara = pd.notna(losning.varde)
+                st.write(f"Målet går att nå för **{int(losbara.sum()):,} av {portfolj_resultat.n:,}** fastigheter.".replace(",", " "))
+                malsokning_df = pd.DataFrame(portfolj_resultat.indata)
+                malsokning_df[f"{variabel} (löst)"] = losning.varde
+                malsokning_df[f"{mal} (uppnått)"] = losning.uppnatt
+                st.dataframe(malsokning_df, use_container_width=True)
+
+        with st.expander("💰 Budgetoptimering (vilken lösning var?)"):
+            st.markdown("Väljer lösning per fastighet så att **summa NPV** blir så hög som möjligt inom investeringsbudgeten.")
+            kombinationer = st.checkbox("Tillåt flera lösningar i samma fastighet", value=True, key='optimering_kombinationer')
+            alternativ, capex, npv = optimering.alternativ_matris(portfolj_resultat, kombinationer=kombinationer)
+            tak = float(capex.max(axis=1).sum())
+            budget = st.number_input("Investeringsbudget (kr)", min_value=0.0, value=round(tak / 2, -5), step=100000.0, format="%.0f", key='optimering_budget')
+            optimum = optimering.optimera(capex, npv, budget, alternativ)
+
+            col1_kpi, col2_kpi, col3_kpi, col4_kpi = st.columns(4)
+            col1_kpi.metric("Summa NPV", f"{optimum.summa_npv:,.0f} kr".replace(",", " "))
+            col2_kpi.metric("Använd budget", f"{optimum.summa_capex:,.0f} kr".replace(",", " "))
+            col3_kpi.metric("Optimalitetsgap", f"{optimum.gap:.3%}", help="Högst så här stor andel av NPV kan en bättre fördelning ge (jämfört med LP-gränsen).")
+            col4_kpi.metric("Beräkningstid", f"{optimum.tid_ms:.0f} ms")
+
+            st.dataframe(pd.DataFrame(list(optimum.antal_per_alternativ().items()), columns=["Lösning", "Antal fastigheter"]), hide_index=True)
+            rader = np.arange(portfolj_resultat.n)
+            optimering_df = pd.DataFrame(portfolj_resultat.indata)
+            optimering_df["Vald lösning"] = optimum.valda()
+            optimering_df["Investering (kr)"] = optimum.capex[rader, optimum.val]
+            optimering_df["NPV (kr)"] = optimum.npv[rader, optimum.val]
+            st.dataframe(optimering_df, use_container_width=True)
+            st.download_button(
+                label="Ladda ner Fördelning (.csv)",
+                data=optimering_df.to_csv(index=False),
+                file_name="iot_budgetoptimering.csv",
+                mime="text/csv",
+            )
+    profil.klar("portfolj")
+
+# --- FLIK 5: JÄMFÖR SCENARIER ---
+elif active_tab == "jamfor":
+    st.header("Jämför Scenarier")
+    st.markdown(f"Fokus: upp till {jamforelse.MAX_SCENARIER} scenarier sida vid sida – t.ex. sensor A mot sensor B, eller temp mot IMD mot vattenskadeskydd.")
+    st.markdown("---")
+
+    fastnalda = st.session_state.setdefault('jamforelse_fastnalda', [])
+    full = len(fastnalda) >= jamforelse.MAX_SCENARIER
+    st.subheader(f"📌 Fäst Scenarier ({len(fastnalda)}/{jamforelse.MAX_SCENARIER})")
+    col_aktuellt, col_fil = st.columns([1, 2])
+    with col_aktuellt:
+        kalkyl_namn = st.selectbox("Kalkyl", [namn for namn, calc in CALC_OPTIONS.items() if calc in kalkyl.CALC_KEY_LIST], key='jamforelse_calc')
+        jamfor_calc = CALC_OPTIONS[kalkyl_namn]
+        jamfor_namn = st.text_input("Namn", key='jamforelse_namn', placeholder="t.ex. Sensor A")
+        st.button("Fäst aktuella värden", key='jamforelse_fast_aktuellt', disabled=full, on_click=_fastnal,
+                  args=(jamfor_calc, {k: st.session_state[k] for k in kalkyl.SCENARIO_NYCKLAR[jamfor_calc]},
+                        jamfor_namn or f"{jamfor_calc} #{len(fastnalda) + 1}"),
+                  help="Värdena från sidofältet och kalkylens formulär just nu.")
+    with col_fil:
+        filer = st.file_uploader("Scenariofiler (.json)", type="json", accept_multiple_files=True, key='jamforelse_uploader')
+        if filer:
+            st.button(f"Fäst {len(filer)} uppladdade scenarier", key='jamforelse_fast_filer', disabled=full, on_click=_fastnal_filer, args=(filer,))
+    for fel in st.session_state.pop('jamforelse_fel', []):
+        st.warning(fel)
+
+    st.markdown("---")
+    if not fastnalda:
+        st.info("Inga fastnålade scenarier ännu. Fäst aktuella värden eller ladda upp sparade scenariofiler.")
+    else:
+        jamforelse_resultat = jamforelse.jamfor(fastnalda, st.session_state.horisont_ar, st.session_state.kalkylranta, antaganden_fran_session())
+        st.plotly_chart(create_jamforelse_chart(jamforelse_resultat, f"Ackumulerat Kassaflöde ({len(fastnalda)} scenarier)"), use_container_width=True)
+
+        st.subheader("📋 Nyckeltal")
+        nyckeltal_df = jamforelse_resultat.som_dataframe()
+        nyckeltal_df['irr'] = nyckeltal_df['irr'] * 100
+        nyckeltal_df.insert(0, 'nr', range(1, len(fastnalda) + 1))
+        nyckeltal_df = nyckeltal_df.rename(columns={
+            'nr': "Nr", 'namn': "Namn", 'calc': "Kalkyl", 'total_initial': "Investering (kr)",
+            'total_besparing': "Besparing/år (kr)", 'total_drift_ar': "Drift/år (kr)", 'netto': "Netto/år (kr)",
+            'payback': "Payback (år)", 'npv': "NPV (kr)", 'irr': "IRR (%)", 'diskonterad_payback': "Disk. payback (år)",
+        })
+        st.dataframe(nyckeltal_df.round(2), hide_index=True, use_container_width=True)
+        st.caption(f"NPV, IRR och diskonterad payback över {st.session_state.horisont_ar} år vid {st.session_state.kalkylranta:g} % kalkylränta. "
+                   "Payback 0 betyder att investeringen aldrig betalar sig.")
+
+        col_ladda_ner, col_ta_bort, col_tom = st.columns([1, 2, 1])
+        col_ladda_ner.download_button(
+            label="Ladda ner Jämförelse (.csv)",
+            data=nyckeltal_df.to_csv(index=False),
+            file_name="iot_jamforelse.csv",
+            mime="text/csv",
+        )
+        etiketter = [f"{i + 1}. {s['namn']}" for i, s in enumerate(fastnalda)]
+        ta_bort = col_ta_bort.multiselect("Ta bort", etiketter, key='jamforelse_ta_bort', label_visibility="collapsed", placeholder="Välj scenarier att ta bort")
+        if ta_bort and col_ta_bort.button(f"Ta bort {len(ta_bort)} valda", key='jamforelse_ta_bort_knapp'):
+            behall = [s for etikett, s in zip(etiketter, fastnalda) if etikett not in ta_bort]
+            st.session_state.jamforelse_fastnalda = behall
+            del st.session_state.jamforelse_ta_bort
+            st.rerun()
+        if col_tom.button("Töm jämförelsen", key='jamforelse_tom'):
+            st.session_state.jamforelse_fastnalda = []
+            st.rerun()
+    profil.klar("jamfor")
+
+# --- CACHESTATISTIK OCH BERÄKNINGSGRAF (Sidebar, efter alla beräkningar i denna omkörning) ---
+with st.sidebar:
+    if active_tab in kalkyl.CALC_KEY_LIST and f'berakningsgraf_omraknad_{active_tab}' in st.session_state:
+        with st.expander("🧮 Beräkningsgraf"):
+            graf = st.session_state.get(f'berakningsgraf_{active_tab}')
+            if st.session_state[f'berakningsgraf_omraknad_{active_tab}']:
+                senaste = graf.senaste
+                st.write(f"Ändrade indata: **{', '.join(senaste['andrade_lov']) or '–'}**")
+                st.write(f"Omräknade noder: **{len(senaste['omraknade'])}** · Återanvända: **{len(senaste['ateranvanda'])}** · {senaste['tid_ms']:.2f} ms")
+                omraknade = set(senaste['omraknade'])
+                senast = ["omräknad" if nod.namn in omraknade else "återanvänd" for nod in graf.noder]
+            else:
+                st.write("Hämtat ur resultatcachen: **0** noder omräknade i den här omkörningen.")
+                senast = ["ur cachen"] * len(graf.noder) if graf is not None else []
+            if graf is not None:
+                st.dataframe(pd.DataFrame({
+                    "Nod": [nod.namn for nod in graf.noder],
+                    "Senast": senast,
+                    "Omräkningar": [graf.omrakningar[nod.namn] for nod in graf.noder],
+                }), hide_index=True, use_container_width=True)
+
+    with st.expander("🗂️ Bakgrundsjobb", expanded=bool(vantande_jobb)):
+        jobbko = hamta_jobbko()
+        st.checkbox("Uppdatera automatiskt", value=True, key='jobb_auto', help=f"Sidan frågar efter status var {JOBB_UPPDATERING_S:g}:e sekund medan den väntar på ett jobb.")
+        jobblista = jobbko.lista(10)
+        if not jobblista:
+            st.caption(f"Inga jobb ännu. Jobben körs av {jobbko.arbetare} arbetare som delas av alla användare.")
+        else:
+            st.dataframe(pd.DataFrame([{
+                "Jobb": j['id'],
+                "Typ": JOBBTYPER_ETIKETTER.get(j['typ'], j['typ']),
+                "Status": j['status'],
+                "Förlopp (%)": round(j['forlopp'] * 100),
+                "Beskrivning": j['etikett'],
+                "Skapad (UTC)": j['skapad'],
+            } for j in jobblista]), hide_index=True, use_container_width=True)
+            per_etikett = {f"{j['id']} · {j['etikett'] or j['typ']}": j for j in jobblista}
+            vald = per_etikett[st.selectbox("Jobb", list(per_etikett), key='jobb_valt')]
+            valt_jobb = vald['id']
+
+            def oppna_jobb(jobb_id, typ):
+                """Visar jobbet i Monte Carlo- eller skaderiskpanelen för dess kalkyl, t.ex. efter att sidan laddats om."""
+                if typ == 'skadesimulering':
+                    calc = 'skada'
+                    st.session_state.skadesim_jobb = jobb_id
+                else:
+                    calc = jobbko.indata(jobb_id)['calc']
+                    st.session_state[f'mc_jobb_{calc}'] = jobb_id
+                st.session_state.radio_calc_selection = {v: k for k, v in CALC_OPTIONS.items()}[calc]
+
+            col_oppna, col_avbryt, col_ta_bort = st.columns(3)
+            col_oppna.button("Öppna", key='jobb_oppna', on_click=oppna_jobb, args=(valt_jobb, vald['typ']),
+                             disabled=vald['typ'] == 'portfolj' or vald['status'] not in jobb.VANTANDE + ('klar',),
+                             help="Monte Carlo- och skaderiskjobb visas i kalkylens analyspaneler. Portföljjobb hittas igen när samma fil laddas upp.")
+            col_avbryt.button("Avbryt", key='jobb_avbryt', on_click=jobbko.avbryt, args=(valt_jobb,), disabled=vald['status'] not in jobb.VANTANDE)
+            col_ta_bort.button("Ta bort", key='jobb_ta_bort', on_click=jobbko.ta_bort, args=(valt_jobb,), disabled=vald['status'] in jobb.VANTANDE)
+            if vald['meddelande']:
+                st.caption(vald['meddelande'])
+
+    with st.expander("🗄️ Cache-statistik"):
+        cache_statistik = hamta_cache().statistik()
+        st.write(f"Träffar: **{cache_statistik['traffar']}** (disk: {cache_statistik['disktraffar']}) · Missar: **{cache_statistik['missar']}**")
+        st.write(f"Träffgrad: **{cache_statistik['traffgrad'] * 100:.0f} %** · Poster: {cache_statistik['poster']} ({cache_statistik['bytes'] / 1024:.0f} kB) · Utkastade: {cache_statistik['utkastade']}")
+
+    st.checkbox("⏱️ Prestandaprofilering", value=os.environ.get('IOT_PROFILERING') == '1', key='profilering_aktiv', help="Tidtagning per avsnitt av omkörningen. Gäller från nästa omkörning.")
+
+# --- PROFILERING (Mäts t.o.m. sidofältets paneler, panelen nedan ingår inte) ---
+if profil.aktiv:
+    profil_statistik = hamta_profilstatistik()
+    profil_tider = profil.avsluta()
+    profil_statistik.registrera(profil_tider)
+    if os.environ.get('IOT_PROFILERING_FIL'):
+        profilering.exportera(os.environ['IOT_PROFILERING_FIL'], profil_statistik, profil_tider, st.session_state.setdefault('profilering_session', os.urandom(4).hex()))
+
+    with st.sidebar:
+        with st.expander("⏱️ Prestanda per avsnitt", expanded=True):
+            sammanfattning = {rad['avsnitt']: rad for rad in profil_statistik.sammanfattning()}
+            st.dataframe(pd.DataFrame([{
+                "Avsnitt": namn,
+                "Nu (ms)": sekunder * 1000,
+                "p50 (ms)": sammanfattning[namn]['p50'] * 1000,
+                "p95 (ms)": sammanfattning[namn]['p95'] * 1000,
+                "Antal": sammanfattning[namn]['antal'],
+            } for namn, sekunder in profil_tider.items()]).round(2), hide_index=True, use_container_width=True)
+            st.caption(f"p50/p95 över de senaste {profil_statistik.fonster} omkörningarna i serverprocessen (alla sessioner). "
+                       "'formler' och 'plotly_chart' ingår i avsnitten runt dem.")
+
+# --- BAKGRUNDSJOBB (Frågar efter status igen om sidan väntar på ett jobb) ---
+uppdatera_vid_vantande_jobb()
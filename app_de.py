@@ -3,6 +3,8 @@ import pandas as pd
 import plotly.graph_objects as go
 import json
 
+import kalkyl
+
 # --- KONSTANTER OCH MAPPNING (DEUTSCH) ---
 CALC_OPTIONS = {
     "🌡️ Temperatur & Energie": "temp", 
@@ -77,36 +79,9 @@ st.markdown("---")
 
 # --- INITIALISIERUNG DES SESSION STATE (Eingabewerte) ---
 
-# Gemeinsame Eingaben (Variablennamen bleiben Schwedisch, da sie nicht angezeigt werden)
-if 'antal_lgh_main' not in st.session_state: st.session_state.antal_lgh_main = 1000
-if 'uh_per_sensor' not in st.session_state: st.session_state.uh_per_sensor = 100
-if 'lora_cost' not in st.session_state: st.session_state.lora_cost = 75
-if 'web_cost' not in st.session_state: st.session_state.web_cost = 50
-if 'app_cost' not in st.session_state: st.session_state.app_cost = 5000
-
-# Flik 1: Temperatur & Energie
-if 'pris_sensor_temp' not in st.session_state: st.session_state.pris_sensor_temp = 688
-if 'pris_install_temp' not in st.session_state: st.session_state.pris_install_temp = 409
-if 'startkostnad_temp' not in st.session_state: st.session_state.startkostnad_temp = 27500
-if 'kvm_snitt' not in st.session_state: st.session_state.kvm_snitt = 67
-if 'kwh_kvm' not in st.session_state: st.session_state.kwh_kvm = 130.6
-if 'pris_kwh' not in st.session_state: st.session_state.pris_kwh = 1.02
-if 'besparing_temp' not in st.session_state: st.session_state.besparing_temp = 6.0
-if 'uh_besparing_temp' not in st.session_state: st.session_state.uh_besparing_temp = 200
-
-# Flik 2: IMD Vatten
-if 'pris_sensor_imd' not in st.session_state: st.session_state.pris_sensor_imd = 1875
-if 'pris_install_imd' not in st.session_state: st.session_state.pris_install_imd = 459
-if 'besparing_lgh_vatten' not in st.session_state: st.session_state.besparing_lgh_vatten = 500
-if 'besparing_lgh_uh_imd' not in st.session_state: st.session_state.besparing_lgh_uh_imd = 200
-
-# Flik 3: Vattenskadeskydd
-if 'pris_sensor_skada' not in st.session_state: st.session_state.pris_sensor_skada = 714.42
-if 'pris_install_skada' not in st.session_state: st.session_state.pris_install_skada = 523
-if 'kostnad_skada' not in st.session_state: st.session_state.kostnad_skada = 70000
-if 'frekvens_skada' not in st.session_state: st.session_state.frekvens_skada = 50
-if 'besparing_skada_pct' not in st.session_state: st.session_state.besparing_skada_pct = 60.0
-if 'uh_besparing_skada_lgh' not in st.session_state: st.session_state.uh_besparing_skada_lgh = 171
+# Variablennamen bleiben Schwedisch, da sie nicht angezeigt werden (Standardwerte in kalkyl.py)
+for nyckel, standardvarde in kalkyl.STANDARDVARDEN.items():
+    if nyckel not in st.session_state: st.session_state[nyckel] = standardvarde
 
 
 # --- NAVIGATION UND SEITENLEISTE FÜR ALLGEMEINE EINGABEN ---
@@ -145,8 +120,8 @@ with st.sidebar:
     applikation_kostnad = st.number_input("Anwendungskosten (feste Gebühr/Jahr)", value=st.session_state.app_cost, key='app_cost')
     
     # Gesamte jährliche Betriebskosten (wird in allen Kalkulationen verwendet)
-    total_drift_ar_per_sensor = underhall_per_sensor + lora_kostnad + webiot_kostnad
-    total_drift_ar = (antal_lgh * total_drift_ar_per_sensor) + applikation_kostnad
+    total_drift_ar = kalkyl.total_drift_ar(antal_lgh, underhall_per_sensor, lora_kostnad, webiot_kostnad, applikation_kostnad)
+    gemensamma_indata = {k: st.session_state[k] for k in kalkyl.GEMENSAMMA_NYCKLAR}
 
 
 # --- 2. INHALTSBLÖCKE GESTEUERT DURCH active_tab ---
@@ -182,15 +157,7 @@ elif active_tab == "temp":
 
     # 2. Szenario speichern
     with col_save:
-        scenario_data_to_save = {
-            'antal_lgh_main': st.session_state.antal_lgh_main, 'uh_per_sensor': st.session_state.uh_per_sensor,
-            'lora_cost': st.session_state.lora_cost, 'web_cost': st.session_state.web_cost,
-            'app_cost': st.session_state.app_cost, 'pris_sensor_temp': st.session_state.pris_sensor_temp,
-            'pris_install_temp': st.session_state.pris_install_temp, 'startkostnad_temp': st.session_state.startkostnad_temp,
-            'kvm_snitt': st.session_state.kvm_snitt, 'kwh_kvm': st.session_state.kwh_kvm,
-            'pris_kwh': st.session_state.pris_kwh, 'besparing_temp': st.session_state.besparing_temp,
-            'uh_besparing_temp': st.session_state.uh_besparing_temp
-        }
+        scenario_data_to_save = {k: st.session_state[k] for k in kalkyl.SCENARIO_NYCKLAR['temp']}
         json_data = json.dumps(scenario_data_to_save, indent=4)
         
         st.download_button(
@@ -210,7 +177,6 @@ elif active_tab == "temp":
         pris_sensor_temp = st.number_input("Preis pro Temp-Sensor (SEK)", value=st.session_state.pris_sensor_temp, key='pris_sensor_temp')
         pris_install_temp = st.number_input("Installation/Konfig. pro Sensor (SEK)", value=st.session_state.pris_install_temp, key='pris_install_temp') 
         startkostnad_projekt_temp = st.number_input("Projektstartkosten (SEK)", value=st.session_state.startkostnad_temp, key='startkostnad_temp')
-        total_initial_temp = antal_lgh * (pris_sensor_temp * 1.01 + pris_install_temp) + startkostnad_projekt_temp # 1% Reserve
 
     with col2:
         st.subheader("Einsparparameter")
@@ -219,13 +185,17 @@ elif active_tab == "temp":
         energipris = st.number_input("Energiepreis (SEK/kWh)", value=st.session_state.pris_kwh, key='pris_kwh')
         besparing_procent = st.slider("Erwartete Energieeinsparung (%)", 0.0, 15.0, value=st.session_state.besparing_temp, step=0.1, key='besparing_temp')
         underhall_besparing_lgh = st.number_input("Reduzierte Wartung/Wohnung (SEK/Jahr)", value=st.session_state.uh_besparing_temp, key='uh_besparing_temp')
-        
-        total_kwh_fastighet = antal_lgh * kvm_snitt * energiforbrukning_kvm
-        besparing_energi_kr = total_kwh_fastighet * energipris * (besparing_procent / 100)
-        besparing_underhall_kr = antal_lgh * underhall_besparing_lgh
-        total_besparing_temp = besparing_energi_kr + besparing_underhall_kr
-        netto_temp = total_besparing_temp - total_drift_ar
-        payback_temp = total_initial_temp / netto_temp if netto_temp > 0 else 0
+
+    # Berechnung (kalkyl.py, inkl. 1% Reserve auf Sensoren)
+    resultat_temp = kalkyl.berakna_temp(kalkyl.TempIndata(
+        **gemensamma_indata,
+        pris_sensor_temp=pris_sensor_temp, pris_install_temp=pris_install_temp,
+        startkostnad_temp=startkostnad_projekt_temp, kvm_snitt=kvm_snitt, kwh_kvm=energiforbrukning_kvm,
+        pris_kwh=energipris, besparing_temp=besparing_procent, uh_besparing_temp=underhall_besparing_lgh,
+    ))
+    total_initial_temp = resultat_temp.total_initial
+    netto_temp = resultat_temp.netto
+    payback_temp = resultat_temp.payback
 
     display_kpis(total_initial_temp, netto_temp, payback_temp)
     fig_temp, _ = create_cashflow_chart(total_initial_temp, netto_temp, "Kumulierter Cashflow (Temperatur)")
@@ -257,13 +227,7 @@ elif active_tab == "imd":
 
     # 2. Szenario speichern
     with col_save:
-        scenario_data_to_save = {
-            'antal_lgh_main': st.session_state.antal_lgh_main, 'uh_per_sensor': st.session_state.uh_per_sensor,
-            'lora_cost': st.session_state.lora_cost, 'web_cost': st.session_state.web_cost,
-            'app_cost': st.session_state.app_cost, 'pris_sensor_imd': st.session_state.pris_sensor_imd,
-            'pris_install_imd': st.session_state.pris_install_imd, 'besparing_lgh_vatten': st.session_state.besparing_lgh_vatten,
-            'besparing_lgh_uh_imd': st.session_state.besparing_lgh_uh_imd
-        }
+        scenario_data_to_save = {k: st.session_state[k] for k in kalkyl.SCENARIO_NYCKLAR['imd']}
         json_data = json.dumps(scenario_data_to_save, indent=4)
         
         st.download_button(
@@ -281,16 +245,21 @@ elif active_tab == "imd":
         st.subheader("Anfangsinvestition (IMD-Zähler)")
         pris_sensor_imd = st.number_input("Preis pro Wasserzähler/Sensor (SEK)", value=st.session_state.pris_sensor_imd, key='pris_sensor_imd')
         pris_install_imd = st.number_input("Installation/Konfig pro Zähler (SEK)", value=st.session_state.pris_install_imd, key='pris_install_imd') 
-        total_initial_imd = antal_lgh * (pris_sensor_imd + pris_install_imd) + (5 * pris_sensor_imd) # Fünf Reservesensoren hinzugefügt
         
     with col4:
         st.subheader("Einsparparameter (Verbrauch)")
         besparing_per_lgh_vatten = st.number_input("Wasser/Warmwasser-Einsparung pro Wohnung/Jahr (SEK)", value=st.session_state.besparing_lgh_vatten, key='besparing_lgh_vatten')
         besparing_per_lgh_underhall = st.number_input("Reduzierte Wartung/Wohnung (SEK/Jahr)", value=st.session_state.besparing_lgh_uh_imd, key='besparing_lgh_uh_imd')
-        
-        total_besparing_imd = antal_lgh * (besparing_per_lgh_vatten + besparing_per_lgh_underhall)
-        netto_imd = total_besparing_imd - total_drift_ar
-        payback_imd = total_initial_imd / netto_imd if netto_imd > 0 else 0
+
+    # Berechnung (kalkyl.py, inkl. fünf Reservesensoren)
+    resultat_imd = kalkyl.berakna_imd(kalkyl.ImdIndata(
+        **gemensamma_indata,
+        pris_sensor_imd=pris_sensor_imd, pris_install_imd=pris_install_imd,
+        besparing_lgh_vatten=besparing_per_lgh_vatten, besparing_lgh_uh_imd=besparing_per_lgh_underhall,
+    ))
+    total_initial_imd = resultat_imd.total_initial
+    netto_imd = resultat_imd.netto
+    payback_imd = resultat_imd.payback
 
     display_kpis(total_initial_imd, netto_imd, payback_imd)
     fig_imd, _ = create_cashflow_chart(total_initial_imd, netto_imd, "Kumulierter Cashflow (IMD Wasser)")
@@ -322,14 +291,7 @@ elif active_tab == "skada":
 
     # 2. Szenario speichern
     with col_save:
-        scenario_data_to_save = {
-            'antal_lgh_main': st.session_state.antal_lgh_main, 'uh_per_sensor': st.session_state.uh_per_sensor,
-            'lora_cost': st.session_state.lora_cost, 'web_cost': st.session_state.web_cost,
-            'app_cost': st.session_state.app_cost, 'pris_sensor_skada': st.session_state.pris_sensor_skada,
-            'pris_install_skada': st.session_state.pris_install_skada, 'kostnad_skada': st.session_state.kostnad_skada,
-            'frekvens_skada': st.session_state.frekvens_skada, 'besparing_skada_pct': st.session_state.besparing_skada_pct,
-            'uh_besparing_skada_lgh': st.session_state.uh_besparing_skada_lgh
-        }
+        scenario_data_to_save = {k: st.session_state[k] for k in kalkyl.SCENARIO_NYCKLAR['skada']}
         json_data = json.dumps(scenario_data_to_save, indent=4)
         
         st.download_button(
@@ -347,23 +309,26 @@ elif active_tab == "skada":
         st.subheader("Anfangsinvestition (Leckagesensor)")
         pris_sensor_skada = st.number_input("Preis pro Leckagesensor (SEK)", value=st.session_state.pris_sensor_skada, key='pris_sensor_skada')
         pris_install_skada = st.number_input("Installation/Konfig pro Sensor (SEK)", value=st.session_state.pris_install_skada, key='pris_install_skada') 
-        total_initial_skada = antal_lgh * (pris_sensor_skada + pris_install_skada)
         
     with col6:
         st.subheader("Einsparparameter (Schadensminderung)")
         kostnad_vattenskada = st.number_input("Durchschnittliche Kosten pro Wasserschaden (SEK)", value=st.session_state.kostnad_skada, key='kostnad_skada')
         frekvens_vattenskada = st.number_input("Anzahl der Wasserschäden pro 1000 Wohnungen/Jahr (Ohne IoT)", value=st.session_state.frekvens_skada, key='frekvens_skada')
         besparing_procent_skador = st.slider("Erwartete Reduzierung der Schadenskosten (%)", 0.0, 90.0, value=st.session_state.besparing_skada_pct, step=5.0, key='besparing_skada_pct')
-        
-        # Berechnung
-        tot_skadekostnad_utan_iot = (antal_lgh / 1000) * (frekvens_vattenskada * kostnad_vattenskada)
-        besparing_skador_kr = tot_skadekostnad_utan_iot * (besparing_procent_skador / 100)
-        
         uh_besparing_skada_lgh = st.number_input("Sonstige Wartungseinsparungen pro Wohnung/Jahr (SEK)", value=st.session_state.uh_besparing_skada_lgh, key='uh_besparing_skada_lgh')
-        
-        total_besparing_skada = besparing_skador_kr + (antal_lgh * uh_besparing_skada_lgh)
-        netto_skada = total_besparing_skada - total_drift_ar
-        payback_skada = total_initial_skada / netto_skada if netto_skada > 0 else 0
+
+    # Berechnung (kalkyl.py)
+    resultat_skada = kalkyl.berakna_skada(kalkyl.SkadaIndata(
+        **gemensamma_indata,
+        pris_sensor_skada=pris_sensor_skada, pris_install_skada=pris_install_skada,
+        kostnad_skada=kostnad_vattenskada, frekvens_skada=frekvens_vattenskada,
+        besparing_skada_pct=besparing_procent_skador, uh_besparing_skada_lgh=uh_besparing_skada_lgh,
+    ))
+    total_initial_skada = resultat_skada.total_initial
+    netto_skada = resultat_skada.netto
+    payback_skada = resultat_skada.payback
+    tot_skadekostnad_utan_iot = resultat_skada.tot_skadekostnad_utan_iot
+    besparing_skador_kr = resultat_skada.besparing_skador_kr
 
     display_kpis(total_initial_skada, netto_skada, payback_skada)
     fig_skada, _ = create_cashflow_chart(total_initial_skada, netto_skada, "Kumulierter Cashflow (Wasserschadenschutz)")
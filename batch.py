@@ -0,0 +1,280 @@
+"""
+Batchberäkning av scenariofiler från kommandoraden, utan Streamlit.
+
+Läser JSONL (ett scenario per rad, '-' för stdin), CSV (ett scenario per rad),
+ZIP-arkiv eller en katalog med scenariofiler (iot_temp_scenario.json m.fl.)
+som en ström, beräknar nyckeltalen i block om `--block` rader med de
+vektoriserade formlerna och skriver JSONL eller CSV. Minnesåtgången beror
+bara på blockstorleken.
+
+    python batch.py scenarier.jsonl -o resultat.csv
+    python batch.py sparade_scenarier/ --format jsonl > resultat.jsonl
+    python batch.py kunder.zip --calc skada -o resultat.csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+import kalkyl
+import portfolj
+
+FILTYPER = ('json', 'jsonl', 'csv', 'zip')
+METANYCKLAR = frozenset(('id', 'namn', 'calc'))  # Tillåtna utöver kalkylens nycklar
+RESULTATNYCKLAR = ('total_initial', 'total_besparing', 'total_drift_ar', 'netto', 'payback')
+CSV_KOLUMNER = ('kalla', 'rad', 'id', 'calc') + RESULTATNYCKLAR + ('fel',)
+
+# Standardvärden som float per kalkyl, så att valideringen per rad blir billig
+_STANDARD_FLOAT = {
+    calc: tuple((k, float(kalkyl.STANDARDVARDEN[k])) for k in nycklar)
+    for calc, nycklar in kalkyl.SCENARIO_NYCKLAR.items()
+}
+
+
+class Post:
+    """Ett inläst och validerat scenario (eller ett fel) med ursprung, så att felen kan rapporteras per rad."""
+    __slots__ = ('kalla', 'rad', 'id', 'calc', 'varden', 'fel')
+
+    def __init__(self, kalla, rad, id=None, calc=None, varden=None, fel=None):
+        self.kalla = kalla
+        self.rad = rad
+        self.id = id
+        self.calc = calc
+        self.varden = varden
+        self.fel = fel
+
+
+def skapa_post(kalla, rad, data, calc=None, strikt=False):
+    """Validerar `data` och returnerar en Post, med felmeddelande i stället för att kasta."""
+    id = data.get('id', data.get('namn')) if isinstance(data, dict) else None
+    try:
+        calc, varden = tolka_scenario(data, calc, strikt)
+    except ValueError as e:
+        return Post(kalla, rad, id, fel=str(e))
+    return Post(kalla, rad, id, calc, varden)
+
+
+def tolka_scenario(data, calc=None, strikt=False):
+    """
+    Validerar ett scenario mot kalkylens nycklar.
+    Returnerar (calc, värden) eller kastar ValueError med en läsbar förklaring.
+
+    Med `strikt` är `calc` den förväntade kalkylen i stället för ett tvång:
+    scenarier för en annan kalkyl och okända nycklar ger fel.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("scenariot är inte ett JSON-objekt")
+    if strikt:
+        okanda = set(data) - set(kalkyl.SCENARIO_NYCKLAR[calc]) - METANYCKLAR
+        if okanda:
+            raise ValueError(f"okända nycklar för {calc}: {', '.join(sorted(okanda))}")
+        if data.get('calc', calc) != calc:
+            raise ValueError(f"scenariot gäller kalkylen {data['calc']!r}, inte {calc!r}")
+    calc = calc or kalkyl.identifiera_kalkyl(data)
+    if calc is None:
+        raise ValueError("kan inte avgöra kalkyltyp (ange 'calc' eller --calc)")
+    if calc not in kalkyl.SCENARIO_NYCKLAR:
+        raise ValueError(f"okänd kalkyl: {calc!r}")
+    varden = {}
+    for nyckel, standard in _STANDARD_FLOAT[calc]:
+        varde = data.get(nyckel)
+        if varde is None or varde == '':
+            varden[nyckel] = standard
+            continue
+        try:
+            if type(varde) is bool:
+                raise TypeError
+            varden[nyckel] = float(varde)
+        except (TypeError, ValueError):
+            raise ValueError(f"{nyckel}: ogiltigt värde {varde!r}") from None
+    return calc, varden
+
+
+def las_jsonl(fil, kalla, calc=None, strikt=False):
+    """Strömmar en JSONL-fil rad för rad. Tomma rader hoppas över."""
+    for rad, text in enumerate(fil, start=1):
+        if not text.strip():
+            continue
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            yield Post(kalla, rad, fel=f"ogiltig JSON: {e}")
+            continue
+        yield skapa_post(kalla, rad, data, calc, strikt)
+
+
+def las_csv(fil, kalla, calc=None, strikt=False):
+    """Strömmar en CSV-fil med rubrikrad, ett scenario per rad (rad 2 är första scenariot). Tomma celler får standardvärden."""
+    try:
+        for rad, data in enumerate(csv.DictReader(fil), start=2):
+            if None in data:
+                yield Post(kalla, rad, fel="fler värden än kolumner i rubrikraden")
+                continue
+            yield skapa_post(kalla, rad, data, calc, strikt)
+    except (csv.Error, UnicodeDecodeError) as e:
+        yield Post(kalla, 0, fel=f"kunde inte läsa CSV: {e}")
+
+
+def las_json(text, kalla, calc=None, strikt=False):
+    """En scenariofil: ett scenario-objekt eller en lista med scenarier (rad = plats i listan, från 1)."""
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        yield Post(kalla, 1, fel=f"ogiltig JSON: {e}")
+        return
+    if isinstance(data, list):
+        for rad, scenario in enumerate(data, start=1):
+            yield skapa_post(kalla, rad, scenario, calc, strikt)
+    else:
+        yield skapa_post(kalla, 1, data, calc, strikt)
+
+
+def las_fil(namn, fil, calc=None, strikt=False):
+    """
+    Strömmar poster ur en binär fil efter filändelsen: .json, .jsonl, .csv
+    eller .zip (med sådana filer inuti, i arkivets ordning). Källan blir
+    filnamnet, för filer i ett arkiv 'arkiv.zip/fil.json'.
+    """
+    andelse = namn.rsplit('.', 1)[-1].lower()
+    if andelse == 'json':
+        yield from las_json(fil.read(), namn, calc, strikt)
+    elif andelse in ('jsonl', 'csv'):
+        text = io.TextIOWrapper(fil, encoding='utf-8-sig', newline='')
+        yield from (las_jsonl if andelse == 'jsonl' else las_csv)(text, namn, calc, strikt)
+        text.detach()
+    elif andelse == 'zip':
+        try:
+            arkiv = zipfile.ZipFile(fil)
+        except zipfile.BadZipFile as e:
+            yield Post(namn, 0, fel=f"ogiltigt ZIP-arkiv: {e}")
+            return
+        with arkiv:
+            for info in arkiv.infolist():
+                if info.is_dir() or info.filename.rsplit('.', 1)[-1].lower() not in ('json', 'jsonl', 'csv'):
+                    continue
+                with arkiv.open(info) as inre:
+                    yield from las_fil(f"{namn}/{info.filename}", inre, calc, strikt)
+    else:
+        yield Post(namn, 0, fel=f"filtypen stöds inte (använd {', '.join(FILTYPER)})")
+
+
+def las_katalog(sokvag, calc=None):
+    """Strömmar alla *.json-filer i en katalog, en fil i taget och i sorterad ordning."""
+    for namn in sorted(os.listdir(sokvag)):
+        if not namn.lower().endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(sokvag, namn), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            yield Post(namn, 1, fel=f"kunde inte läsa filen: {e}")
+            continue
+        yield skapa_post(namn, 1, data, calc)
+
+
+def berakna_alla(poster, block=10_000):
+    """Beräknar en ström av poster blockvis och returnerar alla resultatrader i ursprunglig ordning."""
+    rader = []
+    for poster_i_block in i_block(poster, block):
+        rader.extend(berakna_block(poster_i_block))
+    return rader
+
+
+def berakna_block(poster):
+    """Beräknar ett block poster, grupperat per kalkyl, och returnerar resultatraderna i ursprunglig ordning."""
+    resultat = [None] * len(poster)
+    for calc in kalkyl.CALC_KEY_LIST:
+        index = [i for i, p in enumerate(poster) if p.fel is None and p.calc == calc]
+        if not index:
+            continue
+        kolumner = {k: np.fromiter((poster[i].varden[k] for i in index), dtype=float, count=len(index))
+                    for k in kalkyl.SCENARIO_NYCKLAR[calc]}
+        varden = portfolj.berakna_vektor(calc, kolumner)
+        listor = {k: np.broadcast_to(np.asarray(varden[k], dtype=float), (len(index),)).tolist() for k in RESULTATNYCKLAR}
+        for j, i in enumerate(index):
+            resultat[i] = {k: listor[k][j] for k in RESULTATNYCKLAR}
+
+    rader = []
+    for post, varden in zip(poster, resultat):
+        rad = {'kalla': post.kalla, 'rad': post.rad, 'id': post.id, 'calc': post.calc}
+        if varden is not None:
+            rad.update(varden)
+        rad['fel'] = post.fel
+        rader.append(rad)
+    return rader
+
+
+def i_block(poster, storlek):
+    """Delar upp en ström av poster i listor om högst `storlek`."""
+    block = []
+    for post in poster:
+        block.append(post)
+        if len(block) >= storlek:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def kor(poster, ut, format='jsonl', block=10_000):
+    """Beräknar en ström av poster och skriver resultatet. Returnerar (antal rader, antal fel)."""
+    antal = fel = 0
+    skrivare = None
+    if format == 'csv':
+        skrivare = csv.writer(ut)
+        skrivare.writerow(CSV_KOLUMNER)
+    for poster_i_block in i_block(poster, block):
+        rader = berakna_block(poster_i_block)
+        antal += len(rader)
+        fel += sum(rad['fel'] is not None for rad in rader)
+        if skrivare is not None:
+            skrivare.writerows([rad.get(k) for k in CSV_KOLUMNER] for rad in rader)
+        else:
+            ut.writelines(json.dumps({k: v for k, v in rad.items() if v is not None}, ensure_ascii=False) + "\n" for rad in rader)
+    return antal, fel
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Beräknar IoT ROI-nyckeltal för scenariofiler (JSONL eller katalog med JSON).")
+    parser.add_argument('indata', help="JSONL-, CSV-, JSON- eller ZIP-fil, katalog med *.json-scenarier eller '-' för stdin")
+    parser.add_argument('-o', '--utdata', default='-', help="Utdatafil (standard: stdout)")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="Utdataformat (standard: efter filändelse, annars jsonl)")
+    parser.add_argument('--calc', choices=kalkyl.CALC_KEY_LIST, help="Tvinga kalkyltyp i stället för att gissa från nycklarna")
+    parser.add_argument('--block', type=int, default=10_000, help="Antal scenarier per vektoriserat block")
+    args = parser.parse_args(argv)
+
+    format = args.format or ('csv' if args.utdata.lower().endswith('.csv') else 'jsonl')
+
+    if args.indata == '-':
+        indatafil = sys.stdin
+        poster = las_jsonl(indatafil, '<stdin>', args.calc)
+    elif os.path.isdir(args.indata):
+        indatafil = None
+        poster = las_katalog(args.indata, args.calc)
+    elif args.indata.rsplit('.', 1)[-1].lower() in ('json', 'csv', 'zip'):
+        indatafil = open(args.indata, 'rb')
+        poster = las_fil(os.path.basename(args.indata), indatafil, args.calc)
+    else:
+        indatafil = open(args.indata, encoding='utf-8')
+        poster = las_jsonl(indatafil, os.path.basename(args.indata), args.calc)
+
+    ut = sys.stdout if args.utdata == '-' else open(args.utdata, 'w', encoding='utf-8', newline='')
+    try:
+        antal, fel = kor(poster, ut, format, args.block)
+    finally:
+        if ut is not sys.stdout:
+            ut.close()
+        if indatafil not in (None, sys.stdin):
+            indatafil.close()
+
+    print(f"{antal} scenarier beräknade, {fel} med fel.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Genomströmningstest för api.py: förfrågningar/s och latenspercentiler.
+
+Startar en lokal instans i en bakgrundstråd (eller använder --url) och kör
+ett antal samtidiga klienter med keep-alive mot enskilda och batchade anrop.
+Körs från repots rot:
+
+    python -m benchmarks.api_genomstromning --klienter 8 --sekunder 10
+    python -m benchmarks.api_genomstromning --url http://127.0.0.1:8600 --batchstorlek 5000
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+import api
+import kalkyl
+
+
+def _klient(host, port, sokvag, body, slut, latenser, fel):
+    anslutning = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    while time.perf_counter() < slut:
+        start = time.perf_counter()
+        try:
+            anslutning.request('POST', sokvag, body=body, headers=headers)
+            svar = anslutning.getresponse()
+            svar.read()
+            if svar.status != 200:
+                fel.append(svar.status)
+                continue
+        except (OSError, http.client.HTTPException):
+            fel.append('anslutning')
+            anslutning.close()
+            anslutning = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latenser.append(time.perf_counter() - start)
+    anslutning.close()
+
+
+def mat(host, port, sokvag, body, klienter, sekunder):
+    """Kör `klienter` trådar i `sekunder` s mot sökvägen och returnerar statistik."""
+    latenser, fel = [], []
+    slut = time.perf_counter() + sekunder
+    tradar = [threading.Thread(target=_klient, args=(host, port, sokvag, body, slut, latenser, fel))
+              for _ in range(klienter)]
+    start = time.perf_counter()
+    for t in tradar:
+        t.start()
+    for t in tradar:
+        t.join()
+    tid = time.perf_counter() - start
+
+    ms = np.array(latenser) * 1000 if latenser else np.zeros(1)
+    return {
+        'forfragningar': len(latenser),
+        'fel': len(fel),
+        'per_sekund': len(latenser) / tid,
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genomströmningstest för IoT-kalkyl-API:t.")
+    parser.add_argument('--url', help="Befintlig instans, t.ex. http://127.0.0.1:8600 (standard: starta en lokal)")
+    parser.add_argument('--klienter', type=int, default=8)
+    parser.add_argument('--sekunder', type=float, default=5.0)
+    parser.add_argument('--batchstorlek', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        server = api.skapa_server(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+
+    scenario = {k: kalkyl.STANDARDVARDEN[k] for k in kalkyl.SCENARIO_NYCKLAR['temp']}
+    batch_body = json.dumps([
+        dict(scenario, calc=kalkyl.CALC_KEY_LIST[i % 3], antal_lgh_main=100 + i)
+        for i in range(args.batchstorlek)
+    ])
+
+    fall = [
+        ("POST /berakna/temp", '/berakna/temp', json.dumps(scenario), 1),
+        (f"POST /batch ({args.batchstorlek} scenarier)", '/batch', batch_body, args.batchstorlek),
+    ]
+    print(f"{args.klienter} klienter, {args.sekunder:g} s per fall, http://{host}:{port}")
+    print(f"{'Fall':<32}{'req/s':>10}{'scen/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'fel':>6}")
+    try:
+        for namn, sokvag, body, per_anrop in fall:
+            r = mat(host, port, sokvag, body, args.klienter, args.sekunder)
+            print(f"{namn:<32}{r['per_sekund']:>10.0f}{r['per_sekund'] * per_anrop:>12.0f}"
+                  f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['fel']:>6}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Körtid och minnestopp för analysen av inomhustemperaturer (inomhustemp.py).
+
+Skapar ett syntetiskt år med timvärden (timmar × lägenheter, float32) direkt
+som minnesmappad .npy-fil, med en sinusformad utetemperatur och lägenheter
+som i snitt är 0-2 °C varmare än måltemperaturen, och mäter analysera på
+den. Med --csv mäts även konverteringen från en lång CSV (lgh, tid, temp).
+Körs från repots rot:
+
+    python -m benchmarks.inomhustemp --lagenheter 1000 10000
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import inomhustemp
+
+TIMMAR = 8760
+
+
+def utetemp(seed=1):
+    rng = np.random.default_rng(seed)
+    timme = np.arange(TIMMAR)
+    return 6 - 10 * np.cos(2 * np.pi * timme / TIMMAR) + 3 * np.sin(2 * np.pi * timme / 24) + rng.normal(0, 2, TIMMAR)
+
+
+def skapa_serie(katalog, lagenheter, seed=1, block=744):
+    """Skriver matrisen månad för månad, så att minnet inte beror på antalet lägenheter × timmar."""
+    rng = np.random.default_rng(seed)
+    niva = inomhustemp.STANDARD_MALTEMP + rng.uniform(0, 2, lagenheter)
+    os.makedirs(katalog, exist_ok=True)
+    temp = np.lib.format.open_memmap(os.path.join(katalog, 'temp.npy'), mode='w+', dtype=np.float32, shape=(TIMMAR, lagenheter))
+    for start in range(0, TIMMAR, block):
+        rader = min(block, TIMMAR - start)
+        temp[start:start + rader] = niva + rng.normal(0, 0.5, (rader, lagenheter))
+    temp.flush()
+    del temp
+    with open(os.path.join(katalog, 'serie.json'), 'w', encoding='utf-8') as f:
+        json.dump({'start': '2024-01-01T00', 'lgh': [str(i) for i in range(lagenheter)]}, f)
+    return inomhustemp.oppna(katalog)
+
+
+def skapa_csv(sokvag, serie, block=100):
+    """Lång CSV (lgh, tid, temp) ur serien, `block` lägenheter i taget."""
+    tider = np.datetime_as_string(serie.tider, unit='h')
+    for start in range(0, len(serie.lgh), block):
+        kolumner = slice(start, min(start + block, len(serie.lgh)))
+        del_df = pd.DataFrame({
+            'lgh': np.repeat(serie.lgh[kolumner], TIMMAR),
+            'tid': np.tile(tider, kolumner.stop - kolumner.start),
+            'temp': np.asarray(serie.temp[:, kolumner]).T.ravel(),
+        })
+        del_df.to_csv(sokvag, mode='a' if start else 'w', header=not start, index=False, float_format='%.2f')
+
+
+def minnestopp_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Körtid och minnestopp för inomhustemp.analysera.")
+    parser.add_argument('--lagenheter', nargs='+', type=int, default=[1_000, 10_000])
+    parser.add_argument('--csv', action='store_true', help="Mät även konverteringen från CSV (långsam för många lägenheter)")
+    args = parser.parse_args(argv)
+
+    ute = utetemp()
+    print(f"{'Lägenheter':>11}{'Rader (M)':>11}{'Fil (MB)':>10}{'Analys (s)':>12}{'M rader/s':>11}{'Topp (MB)':>11}{'besparing_temp':>16}")
+    for lagenheter in args.lagenheter:
+        with tempfile.TemporaryDirectory() as katalog:
+            serie = skapa_serie(katalog, lagenheter)
+            start = time.perf_counter()
+            analys = inomhustemp.analysera(serie, ute)
+            tid = time.perf_counter() - start
+            rader = TIMMAR * lagenheter
+            print(f"{lagenheter:>11}{rader / 1e6:>11.1f}{serie.temp.nbytes / 1e6:>10.0f}{tid:>12.2f}{rader / tid / 1e6:>11.1f}"
+                  f"{minnestopp_mb():>11.0f}{analys.besparing_temp:>15.2f}%")
+            if args.csv:
+                sokvag = os.path.join(katalog, 'inne.csv')
+                skapa_csv(sokvag, serie)
+                start = time.perf_counter()
+                inomhustemp.konvertera_csv(sokvag, os.path.join(katalog, 'konverterad'))
+                print(f"{'':>11}CSV {os.path.getsize(sokvag) / 1e6:.0f} MB konverterad på {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
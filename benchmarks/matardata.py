@@ -0,0 +1,72 @@
+"""
+Genomströmning och minnestopp för inläsningen av mätardata (matardata.py).
+
+Skapar en syntetisk mätarfil (en avläsning per lägenhet och dag i två år,
+10 % lägre förbrukning efter installationen) i block, läser den med
+las_matardata och skriver rader per sekund och processens minnestopp. Minnet
+ska bero på blockstorleken och antalet lägenheter, inte på filens storlek.
+Körs från repots rot:
+
+    python -m benchmarks.matardata --lagenheter 20000 --format parquet
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import matardata
+
+
+def skapa_fil(sokvag, lagenheter, dagar=730, brytdatum='2024-01-01', block=200, seed=1):
+    """Skriver filen `block` lägenheter i taget. Returnerar den förväntade besparingen (kr/lgh/år)."""
+    rng = np.random.default_rng(seed)
+    tider = pd.date_range('2023-01-01', periods=dagar, freq='D').to_numpy()
+    efter = tider >= np.datetime64(brytdatum)
+    bas = rng.uniform(0.2, 0.4, lagenheter)
+    skrivare = None
+    for start in range(0, lagenheter, block):
+        lgh = np.arange(start, min(start + block, lagenheter))
+        m3 = bas[lgh][:, None] * np.where(efter, 0.9, 1.0) * rng.uniform(0.8, 1.2, (lgh.size, dagar))
+        df = pd.DataFrame({'lgh': np.repeat(lgh, dagar).astype(str), 'tid': np.tile(tider, lgh.size), 'm3': m3.ravel()})
+        if sokvag.endswith('.csv'):
+            df.to_csv(sokvag, mode='a' if start else 'w', header=not start, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tabell = pa.Table.from_pandas(df, preserve_index=False)
+            skrivare = skrivare or pq.ParquetWriter(sokvag, tabell.schema)
+            skrivare.write_table(tabell)
+    if skrivare is not None:
+        skrivare.close()
+    return float(np.mean(bas * 0.1 * 365) * matardata.STANDARD_PRIS_M3)
+
+
+def minnestopp_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genomströmning och minnestopp för matardata.las_matardata.")
+    parser.add_argument('--lagenheter', type=int, default=20_000)
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='parquet')
+    parser.add_argument('--block', type=int, default=matardata.BLOCK)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as katalog:
+        sokvag = os.path.join(katalog, f"matare.{args.format}")
+        forvantad = skapa_fil(sokvag, args.lagenheter)
+        print(f"Fil: {os.path.getsize(sokvag) / 1e6:.0f} MB, minnestopp efter skapandet {minnestopp_mb():.0f} MB")
+        start = time.perf_counter()
+        resultat = matardata.las_matardata(sokvag, '2024-01-01', block=args.block)
+        tid = time.perf_counter() - start
+    print(f"{resultat.antal_rader:,} rader på {tid:.1f} s ({resultat.antal_rader / tid / 1e6:.2f} M rader/s)".replace(",", " "))
+    print(f"Minnestopp {minnestopp_mb():.0f} MB")
+    print(f"Uppmätt besparing {resultat.besparing_lgh_vatten:.0f} kr/lgh/år (förväntat {forvantad:.0f})")
+
+
+if __name__ == '__main__':
+    main()
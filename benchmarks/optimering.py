@@ -0,0 +1,52 @@
+"""
+Körtid och optimalitetsgap för budgetoptimeringen på en stor slumpad portfölj.
+
+Alla fastigheter × lösningar beräknas i ett svep med portfolj.berakna_portfolj,
+sedan optimeras valet för några budgetnivåer (andel av kostnaden för att ge
+alla fastigheter alla lösningar). Körs från repots rot:
+
+    python -m benchmarks.optimering --antal 50000
+"""
+import argparse
+import time
+
+import numpy as np
+
+import optimering
+import portfolj
+
+
+def slumpad_portfolj(antal, seed=1):
+    rng = np.random.default_rng(seed)
+    return {
+        'antal_lgh_main': rng.integers(10, 2000, antal),
+        'pris_sensor_temp': rng.uniform(300, 1200, antal),
+        'besparing_temp': rng.uniform(1, 10, antal),
+        'pris_sensor_imd': rng.uniform(1000, 3000, antal),
+        'besparing_lgh_vatten': rng.uniform(100, 900, antal),
+        'frekvens_skada': rng.uniform(5, 80, antal),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Körtid och optimalitetsgap för budgetoptimeringen.")
+    parser.add_argument('--antal', type=int, default=50_000)
+    parser.add_argument('--andelar', nargs='+', type=float, default=[0.05, 0.2, 0.5, 0.8])
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    resultat = portfolj.berakna_portfolj(slumpad_portfolj(args.antal))
+    print(f"{args.antal} fastigheter × 3 kalkyler beräknade på {time.perf_counter() - start:.2f} s")
+
+    print(f"{'Alternativ':<14}{'Budget':>8}{'ms':>9}{'Summa NPV (Mkr)':>18}{'LP-gräns (Mkr)':>17}{'Gap':>11}")
+    for kombinationer in (False, True):
+        alternativ, capex, npv = optimering.alternativ_matris(resultat, kombinationer=kombinationer)
+        tak = capex.max(axis=1).sum()
+        for andel in args.andelar:
+            losning = optimering.optimera(capex, npv, andel * tak, alternativ)
+            print(f"{len(alternativ):<14}{andel:>8.0%}{losning.tid_ms:>9.1f}{losning.summa_npv / 1e6:>18.1f}"
+                  f"{losning.ovre_grans / 1e6:>17.1f}{losning.gap:>11.2e}")
+
+
+if __name__ == '__main__':
+    main()
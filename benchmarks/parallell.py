@@ -0,0 +1,59 @@
+"""
+Uppsnabbning i processpoolen (parallell.py) jämfört med att räkna i en process.
+
+Mäter en stor portfölj och en stor Monte Carlo-körning för olika antal
+processer. Poolen startas före mätningen, så tiderna gäller en varm pool som
+i Streamlit-servern. Körs från repots rot:
+
+    python -m benchmarks.parallell --fastigheter 1000000 --dragningar 20000000 --processer 1 2 4 8
+"""
+import argparse
+import os
+import time
+
+import kalkyl
+import montecarlo
+import parallell
+import portfolj
+from benchmarks.optimering import slumpad_portfolj
+
+
+def mat(namn, funktion, referens=None):
+    start = time.perf_counter()
+    funktion()
+    tid = time.perf_counter() - start
+    print(f"{namn:<34}{tid:>9.2f}{referens / tid if referens else 1.0:>11.2f}")
+    return tid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Uppsnabbning i processpoolen.")
+    parser.add_argument('--fastigheter', type=int, default=1_000_000)
+    parser.add_argument('--dragningar', type=int, default=20_000_000)
+    parser.add_argument('--processer', nargs='+', type=int, default=[p for p in (1, 2, 4, 8) if p <= (os.cpu_count() or 1)])
+    args = parser.parse_args(argv)
+
+    tabell = slumpad_portfolj(args.fastigheter)
+    fordelningar = {
+        'besparing_temp': montecarlo.Fordelning.kring('triangel', kalkyl.STANDARDVARDEN['besparing_temp'], 30),
+        'pris_kwh': montecarlo.Fordelning.kring('normal', kalkyl.STANDARDVARDEN['pris_kwh'], 30),
+    }
+    print(f"{os.cpu_count()} kärnor, {args.fastigheter} fastigheter, {args.dragningar} dragningar")
+    print(f"{'Körning':<34}{'s':>9}{'Uppsnabb.':>11}")
+
+    ref_portfolj = mat("portfölj, en process", lambda: portfolj.berakna_portfolj(tabell))
+    ref_mc = mat("monte carlo, en process",
+                 lambda: montecarlo.simulera('temp', kalkyl.STANDARDVARDEN, fordelningar, antal=args.dragningar, seed=1))
+    for processer in args.processer:
+        parallell.hamta_pool(processer)
+        mat(f"portfölj, {processer} processer", lambda: parallell.berakna_portfolj(tabell, processer=processer), ref_portfolj)
+        if processer == 1:
+            continue  # montecarlo.simulera räknar i den egna processen med processer=1
+        mat(f"monte carlo, {processer} processer",
+            lambda: montecarlo.simulera('temp', kalkyl.STANDARDVARDEN, fordelningar, antal=args.dragningar, seed=1,
+                                        processer=processer), ref_mc)
+    parallell.stang_pool()
+
+
+if __name__ == '__main__':
+    main()
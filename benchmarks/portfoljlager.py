@@ -0,0 +1,51 @@
+"""
+Tid per stegvis uppdatering i portföljlagret (portfoljlager.py) mot full omräkning.
+
+Skapar syntetiska portföljer, bygger lagret och mäter medeltiden för
+uppdateringar av slumpvis valda fastigheter. Tiden per uppdatering ska vara
+oberoende av portföljens storlek. Avslutas med kontrollera() mot en full
+omräkning. Körs från repots rot:
+
+    python -m benchmarks.portfoljlager --fastigheter 10000 50000 200000
+"""
+import argparse
+import time
+
+import numpy as np
+
+import portfoljlager
+
+
+def skapa_tabell(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return {
+        'antal_lgh_main': rng.integers(10, 300, n).astype(float),
+        'pris_sensor_temp': rng.uniform(200, 900, n),
+        'frekvens_skada': rng.uniform(5, 80, n),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stegvis uppdatering mot full omräkning i portfoljlager.")
+    parser.add_argument('--fastigheter', nargs='+', type=int, default=[10_000, 50_000, 200_000])
+    parser.add_argument('--uppdateringar', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(2)
+    print(f"{'Fastigheter':>12}{'Full (s)':>10}{'Uppdatering (ms)':>18}{'Största avvikelse':>19}")
+    for n in args.fastigheter:
+        start = time.perf_counter()
+        lager = portfoljlager.Portfoljlager(skapa_tabell(n))
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.uppdateringar):
+            lager.uppdatera(int(rng.integers(n)), {'antal_lgh_main': float(rng.integers(1, 400))})
+        per_uppdatering = (time.perf_counter() - start) / args.uppdateringar
+        kontroll = lager.kontrollera()
+        avvikelse = max(max(k['summor'], k['rader'], k['floden']) for k in kontroll.values())
+        assert all(k['antal_stammer'] for k in kontroll.values())
+        print(f"{n:>12}{full:>10.2f}{per_uppdatering * 1000:>18.2f}{avvikelse:>19.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Frågetider för scenariobiblioteket med många lagrade scenarier.
+
+Fyller en tillfällig SQLite-fil med `--antal` slumpade scenarier (jämnt
+fördelade över kalkylerna och över ett år av skapandedatum) och mäter
+typiska frågor. Körs från repots rot:
+
+    python -m benchmarks.scenariobibliotek --antal 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+import kalkyl
+from scenariobibliotek import ScenarioBibliotek
+
+BLOCK = 50_000
+
+
+def fyll(bibliotek, antal, seed=1):
+    rng = np.random.default_rng(seed)
+    start = date(2024, 1, 1)
+    sparade = 0
+    while sparade < antal:
+        calc = kalkyl.CALC_KEY_LIST[(sparade // BLOCK) % len(kalkyl.CALC_KEY_LIST)]
+        n = min(BLOCK, antal - sparade)
+        bas = {k: kalkyl.STANDARDVARDEN[k] for k in kalkyl.SCENARIO_NYCKLAR[calc]}
+        antal_lgh = rng.integers(10, 2000, n)
+        skala = rng.uniform(0.3, 3.0, n)
+        scenarier = [dict(bas, antal_lgh_main=int(a)) for a in antal_lgh]
+        for s, f in zip(scenarier, skala):
+            for nyckel in kalkyl.SCENARIO_NYCKLAR[calc][5:7]:  # Två första kalkylspecifika priser
+                s[nyckel] = bas[nyckel] * f
+        dag = start + timedelta(days=int(rng.integers(0, 365)))
+        bibliotek.spara_manga(calc, scenarier, skapad=f"{dag.isoformat()} 12:00:00")
+        sparade += n
+
+
+def mat(namn, funktion, upprepningar=20):
+    funktion()  # Värm upp sidcachen
+    tider = []
+    for _ in range(upprepningar):
+        start = time.perf_counter()
+        resultat = funktion()
+        tider.append(time.perf_counter() - start)
+    ms = np.array(tider) * 1000
+    print(f"{namn:<58}{np.median(ms):>9.2f}{ms.max():>9.2f}  {resultat}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frågetider för scenariobiblioteket.")
+    parser.add_argument('--antal', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as katalog:
+        bibliotek = ScenarioBibliotek(os.path.join(katalog, "scenarier.sqlite"))
+        start = time.perf_counter()
+        fyll(bibliotek, args.antal)
+        print(f"{args.antal} scenarier sparade på {time.perf_counter() - start:.1f} s")
+
+        print(f"{'Fråga':<58}{'p50 ms':>9}{'max ms':>9}")
+        mat("lista skada, payback < 4 (första sidan, 50 rader)",
+            lambda: len(bibliotek.lista(calc='skada', max_payback=4, sortering='payback')[0]))
+        mat("lista skada, payback < 4, nyast först",
+            lambda: len(bibliotek.lista(calc='skada', max_payback=4)[0]))
+        _, markor = bibliotek.lista(calc='skada', max_payback=4, sortering='payback', antal=10_000)
+        mat("lista skada, payback < 4, sida efter 10 000 rader",
+            lambda: len(bibliotek.lista(calc='skada', max_payback=4, sortering='payback', efter=markor)[0]))
+        mat("lista temp, 500-600 lgh, sorterat på antal_lgh",
+            lambda: len(bibliotek.lista(calc='temp', min_lgh=500, max_lgh=600, sortering='antal_lgh')[0]))
+        mat("lista alla, skapade i mars 2024",
+            lambda: len(bibliotek.lista(fran='2024-03-01', till='2024-04-01')[0]))
+        mat("räkna skada, payback < 4",
+            lambda: bibliotek.rakna(calc='skada', max_payback=4), upprepningar=5)
+        mat("hämta ett scenario på id", lambda: bibliotek.hamta(args.antal // 2)[0])
+        bibliotek.stang()
+
+
+if __name__ == '__main__':
+    main()
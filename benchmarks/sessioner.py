@@ -0,0 +1,254 @@
+"""
+Lasttest med många samtidiga sessioner mot app.py och app_de.py, utan webbläsare.
+
+Varje session är en egen streamlit.testing.v1.AppTest och gör slumpade steg:
+byter kalkyl i radio_calc_selection, ändrar ett indatafält och skickar
+kalkylens formulär (temp_form/imd_form/skada_form) om appen har ett. Varje
+omkörning tidtas från det att sessionen vill köra tills omkörningen är klar.
+
+Två lägen:
+  process  (standard) en process per session, dvs. övre gränsen med en
+           serverprocess per kärna bakom en lastbalanserare.
+  trad     alla sessioner som trådar i en process, som i en Streamlit-server.
+           AppTest har en processgemensam låtsasruntime, så omkörningarna
+           släpps fram en i taget; det motsvarar en server där skripten är
+           Python-bundna och delar GIL. Latensen inkluderar kötiden.
+
+För varje antal samtidiga sessioner N rapporteras omkörningar/s, latens-
+percentiler, ren körtid och minnesökning per session. Minnet mäts som RSS
+efter gc.collect() och malloc_trim mot en baslinje tagen efter en
+uppvärmningssession; RSS har ungefär 1 MB brus, och en negativ skillnad
+visas som 0. Mättnadspunkten är det första N där genomströmningen inte
+längre ökar med minst 10 % jämfört med föregående N, eller där p95 överstiger
+--max-p95-ms. I läget trad körs omkörningarna en i taget, så genomströmningen
+kan inte växa med N; där gäller bara latensgränsen.
+Körs från repots rot:
+
+    python -m benchmarks.sessioner --sessioner 1 2 4 8 16 --steg 10
+    python -m benchmarks.sessioner --app app_de.py --lage trad --sessioner 1 2 4 --json resultat.json
+"""
+import argparse
+import ctypes
+import gc
+import json
+import multiprocessing
+import os
+import random
+import resource
+import threading
+import time
+
+import numpy as np
+from streamlit.testing.v1 import AppTest
+
+import kalkyl
+
+TIMEOUT = 300
+_korlas = threading.Lock()  # AppTest:s låtsasruntime är en singleton i processen
+
+
+def rss_mb():
+    """Processens aktuella RSS i MB (Linux /proc), annars högsta RSS hittills."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def frigor():
+    """gc.collect() och (glibc) malloc_trim, så att RSS visar levande minne och inte frigjorda sidor."""
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class Session:
+    """En simulerad användare. Alla omkörningar tidtas och sparas i `latenser` (sekunder)."""
+
+    def __init__(self, app, seed):
+        self.app = app
+        self.rng = random.Random(seed)
+        self.latenser = []
+        self.kortider = []
+        self.fel = []
+        self.at = AppTest.from_file(app, default_timeout=TIMEOUT)
+
+    def _kor(self, element=None):
+        start = time.perf_counter()
+        with _korlas:
+            borjan = time.perf_counter()
+            (element or self.at).run()
+            slut = time.perf_counter()
+        self.latenser.append(slut - start)
+        self.kortider.append(slut - borjan)
+        if self.at.exception:
+            self.fel.append(self.at.exception[0].value)
+
+    def starta(self):
+        self._kor()
+        self.byt_kalkyl()
+
+    def byt_kalkyl(self):
+        radio = self.at.radio(key='radio_calc_selection')
+        index = self.rng.randrange(1, len(kalkyl.CALC_KEY_LIST) + 1)  # Hoppa över "Välj"; kalkylerna ligger först
+        self.calc = kalkyl.CALC_KEY_LIST[index - 1]
+        self._kor(radio.set_value(radio.options[index]))
+
+    def redigera(self):
+        """Ändrar ett slumpat fält i kalkylens formulär (app.py) eller dess indata direkt (app_de.py)."""
+        formular = f'{self.calc}_form'
+        nycklar = set(kalkyl.SCENARIO_NYCKLAR[self.calc]) - set(kalkyl.GEMENSAMMA_NYCKLAR)
+        falt = [w for w in self.at.main.number_input if w.proto.form_id == formular]
+        falt = falt or [w for w in self.at.main.number_input if w.key in nycklar]
+        if not falt:
+            return
+        widget = self.rng.choice(falt)
+        varde = widget.value * self.rng.uniform(0.8, 1.2)
+        self._kor(widget.set_value(type(widget.value)(varde)))
+
+    def skicka(self):
+        """Klickar på formulärets skicka-knapp om appen har ett formulär för kalkylen."""
+        formular = f'{self.calc}_form'
+        for knapp in self.at.main.button:
+            if knapp.proto.form_id == formular and knapp.proto.is_form_submitter:
+                self._kor(knapp.click())
+                return
+
+    def steg(self):
+        if self.rng.random() < 0.3:
+            self.byt_kalkyl()
+        self.redigera()
+        self.skicka()
+
+
+def _kor_session(session, steg):
+    try:
+        session.starta()
+        for _ in range(steg):
+            session.steg()
+    except Exception as e:  # En trasig session ska inte stoppa mätningen
+        session.fel.append(repr(e))
+
+
+def _baslinje_mb(app):
+    """RSS efter en uppvärmningssession som besöker alla kalkyler (importer, cache_resource), och frigor()."""
+    at = AppTest.from_file(app, default_timeout=TIMEOUT).run()
+    radio = at.radio(key='radio_calc_selection')
+    for index in range(1, len(kalkyl.CALC_KEY_LIST) + 1):
+        radio.set_value(radio.options[index]).run()
+    del at, radio
+    frigor()
+    return rss_mb()
+
+
+def _session_i_process(app, seed, steg):
+    """Körs i en egen process: en session. Returnerar mätvärdena, processens minnesökning och körtiden."""
+    fore = _baslinje_mb(app)
+    session = Session(app, seed)
+    start = time.perf_counter()
+    _kor_session(session, steg)
+    tid = time.perf_counter() - start
+    frigor()
+    return session.latenser, session.kortider, session.fel, rss_mb() - fore, tid
+
+
+def kor_niva(app, antal, steg, seed, lage='process'):
+    """Kör `antal` samtidiga sessioner med `steg` steg var. Returnerar statistik för nivån."""
+    if lage == 'process':
+        with multiprocessing.get_context('spawn').Pool(antal) as pool:
+            delar = pool.starmap(_session_i_process, [(app, seed * 1000 + i, steg) for i in range(antal)])
+        tid = max(d[4] for d in delar)  # Utan processernas uppstart och importer
+        latenser = [l for d in delar for l in d[0]]
+        kortider = [k for d in delar for k in d[1]]
+        fel = [f for d in delar for f in d[2]]
+        mb_per_session = max(float(np.mean([d[3] for d in delar])), 0.0)
+    else:
+        fore = _baslinje_mb(app)
+        sessioner = [Session(app, seed * 1000 + i) for i in range(antal)]
+        tradar = [threading.Thread(target=_kor_session, args=(s, steg)) for s in sessioner]
+        start = time.perf_counter()
+        for t in tradar:
+            t.start()
+        for t in tradar:
+            t.join()
+        tid = time.perf_counter() - start
+        frigor()
+        mb_per_session = max(rss_mb() - fore, 0.0) / antal
+        latenser = [l for s in sessioner for l in s.latenser]
+        kortider = [k for s in sessioner for k in s.kortider]
+        fel = [f for s in sessioner for f in s.fel]
+
+    ms = np.array(latenser or [0.0]) * 1000
+    return {
+        'app': app,
+        'lage': lage,
+        'sessioner': antal,
+        'omkorningar': len(latenser),
+        'per_sekund': len(latenser) / tid if tid > 0 else 0.0,
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+        'kortid_p50_ms': float(np.percentile(np.array(kortider or [0.0]) * 1000, 50)),
+        'mb_per_session': mb_per_session,
+        'fel': len(fel),
+        'forsta_fel': fel[0] if fel else None,
+    }
+
+
+def mattnadspunkt(nivaer, max_p95_ms, genomstromning=True):
+    """
+    Första antalet sessioner där genomströmningen slutar växa (< 10 %) eller
+    p95 går över gränsen. Med `genomstromning=False` (läget trad) gäller bara latensgränsen.
+    """
+    for foregaende, niva in zip([None] + nivaer[:-1], nivaer):
+        if niva['p95_ms'] > max_p95_ms:
+            return niva['sessioner']
+        if genomstromning and foregaende is not None and niva['per_sekund'] < foregaende['per_sekund'] * 1.1:
+            return niva['sessioner']
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lasttest med samtidiga sessioner mot Streamlit-apparna.")
+    parser.add_argument('--app', nargs='+', default=['app.py', 'app_de.py'])
+    parser.add_argument('--sessioner', nargs='+', type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument('--lage', choices=('trad', 'process'), default='process',
+                        help="Sessioner som trådar i en process eller en process per session")
+    parser.add_argument('--steg', type=int, default=10, help="Steg per session (varje steg är 1-3 omkörningar)")
+    parser.add_argument('--max-p95-ms', type=float, default=1000.0, help="Latensgräns som räknas som mättnad")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="Spara alla nivåer som JSON")
+    args = parser.parse_args(argv)
+
+    resultat = {}
+    for app in args.app:
+        print(f"\n{app} ({args.lage})", flush=True)
+        print(f"{'N':>4}{'omk.':>7}{'omk/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'kört p50':>10}"
+              f"{'MB/sess':>9}{'fel':>5}", flush=True)
+        nivaer = []
+        for antal in args.sessioner:
+            niva = kor_niva(app, antal, args.steg, args.seed, args.lage)
+            nivaer.append(niva)
+            print(f"{antal:>4}{niva['omkorningar']:>7}{niva['per_sekund']:>9.1f}{niva['p50_ms']:>9.1f}"
+                  f"{niva['p95_ms']:>9.1f}{niva['p99_ms']:>9.1f}{niva['kortid_p50_ms']:>10.1f}"
+                  f"{niva['mb_per_session']:>9.2f}{niva['fel']:>5}", flush=True)
+            if niva['forsta_fel']:
+                print(f"     första fel: {niva['forsta_fel']}")
+        punkt = mattnadspunkt(nivaer, args.max_p95_ms, genomstromning=args.lage == 'process')
+        grans = f"p95 > {args.max_p95_ms:g} ms"
+        if args.lage == 'trad':
+            grans += "; omkörningarna körs en i taget, så genomströmningsregeln gäller inte i läget trad"
+        print(f"Mättnadspunkt ({grans}): {punkt if punkt is not None else f'> {args.sessioner[-1]}'} samtidiga sessioner")
+        resultat[app] = {'nivaer': nivaer, 'mattnadspunkt': punkt}
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultat, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
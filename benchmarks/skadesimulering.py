@@ -0,0 +1,46 @@
+"""
+Körtid och minnestopp för den stokastiska skadesimuleringen (skadesimulering.py).
+
+Simulerar skadekalkylens standardscenario för olika antal lägenheter och
+skriver skador per sekund, processens minnestopp och simulerat medel mot
+kalkylens väntevärde. Minnet ska bero på blockstorleken och antalet försök,
+inte på antalet skador. Körs från repots rot:
+
+    python -m benchmarks.skadesimulering --lagenheter 1000 100000 --forsok 10000
+"""
+import argparse
+import resource
+import time
+
+import kalkyl
+import portfolj
+import skadesimulering
+
+
+def minnestopp_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Körtid och minnestopp för skadesimulering.simulera.")
+    parser.add_argument('--lagenheter', nargs='+', type=int, default=[1_000, 100_000])
+    parser.add_argument('--forsok', type=int, default=10_000)
+    parser.add_argument('--ar', type=int, default=portfolj.AR)
+    parser.add_argument('--fordelning', choices=skadesimulering.SVANSFORDELNINGAR, default='lognormal')
+    parser.add_argument('--processer', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print(f"{'Lägenheter':>11}{'Skador (M)':>12}{'Tid (s)':>9}{'M skador/s':>12}{'Topp (MB)':>11}{'Medel/väntevärde':>18}{'VaR 99 %':>14}")
+    for lagenheter in args.lagenheter:
+        start = time.perf_counter()
+        resultat = skadesimulering.simulera({'antal_lgh_main': lagenheter}, args.forsok, args.ar, args.fordelning, seed=1,
+                                            processer=args.processer)
+        tid = time.perf_counter() - start
+        skador = resultat.forvantad / kalkyl.STANDARDVARDEN['kostnad_skada'] * args.forsok * args.ar
+        kvot = resultat.sammanfattning()['medel_utan'] / resultat.forvantad
+        print(f"{lagenheter:>11}{skador / 1e6:>12.1f}{tid:>9.2f}{skador / tid / 1e6:>12.1f}{minnestopp_mb():>11.0f}{kvot:>18.4f}"
+              f"{resultat.riskmatt().loc[0.99, 'var_utan']:>14,.0f}".replace(",", " "))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Beroendegraf för kalkylernas mellanled, med memoisering per nod.
+
+Varje nod är en funktion från kalkyl.py (eller kassaflode.py) vars indata är
+andra noder eller indatanycklar (löv). När grafen uppdateras med nya indata
+räknas bara noder om som ligger nedströms ett ändrat löv; blir en omräknad nod
+oförändrad stoppar spridningen där. Att ändra `lora_cost` räknar alltså om
+total_drift_ar, netto, payback och kassaflödet men inte total_kwh_fastighet
+eller besparing_energi_kr.
+
+Instrumenteringen i `senaste` visar vilka noder som räknades om respektive
+återanvändes vid senaste uppdateringen.
+"""
+import inspect
+import time
+
+import numpy as np
+
+import kalkyl
+import kassaflode
+
+
+class Nod:
+    """En beräknad nod. `beroenden` är namnen på indata i samma ordning som funktionens parametrar."""
+    __slots__ = ('namn', 'funktion', 'beroenden')
+
+    def __init__(self, namn, funktion, beroenden=None):
+        self.namn = namn
+        self.funktion = funktion
+        self.beroenden = tuple(beroenden) if beroenden is not None else tuple(inspect.signature(funktion).parameters)
+
+
+def _lika(a, b):
+    if a is b:
+        return True
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.shape(a) == np.shape(b) and bool(np.array_equal(a, b))
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+class Berakningsgraf:
+    """
+    Memoiserad beroendegraf. Noderna måste anges i en ordning där varje nods
+    beroenden kommer före noden själv (eller är löv).
+    """
+
+    def __init__(self, noder):
+        self.noder = list(noder)
+        namn = {nod.namn for nod in self.noder}
+        self.lov = sorted({b for nod in self.noder for b in nod.beroenden} - namn)
+        self.varden = {}
+        self.omrakningar = {nod.namn: 0 for nod in self.noder}
+        self.senaste = {'andrade_lov': [], 'omraknade': [], 'ateranvanda': [], 'tid_ms': 0.0}
+
+    def uppdatera(self, indata):
+        """
+        Sätter nya lövvärden (okända nycklar ignoreras) och räknar om det som
+        påverkas. Returnerar alla värden (löv och noder) som en ny dict.
+        """
+        start = time.perf_counter()
+        andrade = set()
+        for nyckel in self.lov:
+            if nyckel not in indata:
+                raise KeyError(f"indata saknar {nyckel!r}")
+            varde = indata[nyckel]
+            if nyckel not in self.varden or not _lika(self.varden[nyckel], varde):
+                self.varden[nyckel] = varde
+                andrade.add(nyckel)
+        andrade_lov = sorted(andrade)
+
+        omraknade, ateranvanda = [], []
+        for nod in self.noder:
+            if nod.namn in self.varden and andrade.isdisjoint(nod.beroenden):
+                ateranvanda.append(nod.namn)
+                continue
+            nytt = nod.funktion(*(self.varden[b] for b in nod.beroenden))
+            self.omrakningar[nod.namn] += 1
+            omraknade.append(nod.namn)
+            if nod.namn not in self.varden or not _lika(self.varden[nod.namn], nytt):
+                self.varden[nod.namn] = nytt
+                andrade.add(nod.namn)
+
+        self.senaste = {
+            'andrade_lov': andrade_lov,
+            'omraknade': omraknade,
+            'ateranvanda': ateranvanda,
+            'tid_ms': (time.perf_counter() - start) * 1000,
+        }
+        return dict(self.varden)
+
+
+def _arsfloden_nod(calc):
+    """Nod för kassaflödet per år (kassaflode.arsfloden) med mellanleden som indata i stället för att räkna om dem."""
+    prisdriven = kassaflode.PRISDRIVEN_BESPARING[calc]
+    ej_aterkommande = kassaflode.EJ_ATERKOMMANDE[calc]
+    antaganden = tuple(kassaflode.STANDARDANTAGANDEN)
+    beroenden = (('antal_lgh_main', 'uh_per_sensor') + ej_aterkommande
+                 + ('total_initial', 'total_drift_ar', 'total_besparing', prisdriven, 'horisont_ar') + antaganden)
+
+    def arsfloden(*argument):
+        v = dict(zip(beroenden, argument))
+        return kassaflode.arsfloden(
+            calc, v, int(v['horisont_ar']),
+            kassaflode.Antaganden.from_dict(v), v,
+        )[0]
+
+    return Nod('arsfloden', arsfloden, beroenden)
+
+
+_DRIFT = Nod('total_drift_ar', kalkyl.total_drift_ar, ('antal_lgh_main', 'uh_per_sensor', 'lora_cost', 'web_cost', 'app_cost'))
+_NETTO = Nod('netto', kalkyl.netto)
+_PAYBACK = Nod('payback', kalkyl.payback)
+
+NODER = {
+    'temp': (
+        _DRIFT,
+        Nod('total_initial', kalkyl.total_initial_temp),
+        Nod('total_kwh_fastighet', kalkyl.total_kwh_fastighet),
+        Nod('besparing_energi_kr', kalkyl.besparing_energi_kr),
+        Nod('besparing_underhall_kr', kalkyl.besparing_underhall_temp),
+        Nod('total_besparing', kalkyl.summa_besparing, ('besparing_energi_kr', 'besparing_underhall_kr')),
+        _NETTO,
+        _PAYBACK,
+        Nod('besparing_lgh_ar', kalkyl.besparing_lgh_ar),
+        _arsfloden_nod('temp'),
+    ),
+    'imd': (
+        _DRIFT,
+        Nod('total_initial', kalkyl.total_initial_imd),
+        Nod('besparing_vatten_kr', kalkyl.besparing_vatten_kr),
+        Nod('besparing_underhall_kr', kalkyl.besparing_underhall_imd),
+        Nod('total_besparing', kalkyl.summa_besparing, ('besparing_vatten_kr', 'besparing_underhall_kr')),
+        _NETTO,
+        _PAYBACK,
+        _arsfloden_nod('imd'),
+    ),
+    'skada': (
+        _DRIFT,
+        Nod('total_initial', kalkyl.total_initial_skada),
+        Nod('tot_skadekostnad_utan_iot', kalkyl.tot_skadekostnad_utan_iot),
+        Nod('besparing_skador_kr', kalkyl.besparing_skador_kr),
+        Nod('besparing_underhall_kr', kalkyl.besparing_underhall_skada),
+        Nod('total_besparing', kalkyl.summa_besparing, ('besparing_skador_kr', 'besparing_underhall_kr')),
+        _NETTO,
+        _PAYBACK,
+        _arsfloden_nod('skada'),
+    ),
+}
+
+
+def skapa_graf(calc, extra_noder=()):
+    """Ny graf för kalkylen. `extra_noder` läggs sist, t.ex. en figur som bygger på 'arsfloden'."""
+    return Berakningsgraf(NODER[calc] + tuple(extra_noder))
@@ -0,0 +1,151 @@
+"""
+Finansiella nyckeltal för många kassaflödesserier på en gång: NPV, diskonterad
+payback och IRR.
+
+En kassaflödesserie är en rad i en matris med form (scenarier, år + 1) där
+kolumn 0 är investeringen (negativ) och kolumn t är nettoflödet år t.
+IRR löses för alla rader samtidigt med Newton-steg som faller tillbaka på
+bisektion när steget hamnar utanför det aktuella intervallet; rader med
+konstant flöde löses med annuitetsformeln.
+"""
+import numpy as np
+
+STANDARD_RANTA = 5.0  # Kalkylränta i procent
+
+
+def kassaflodesserie(total_initial, netto, ar):
+    """Konstant nettoflöde i `ar` år efter investeringen, form (scenarier, ar + 1)."""
+    total_initial = np.atleast_1d(np.asarray(total_initial, dtype=float))
+    netto = np.atleast_1d(np.asarray(netto, dtype=float))
+    n = np.broadcast(total_initial, netto).shape[0]
+    floden = np.empty((n, ar + 1))
+    floden[:, 0] = -total_initial
+    floden[:, 1:] = netto[:, None]
+    return floden
+
+
+def _diskonteringsfaktorer(ranta, antal_perioder):
+    """(1 + r)^-t för t = 0..antal_perioder-1, form (scenarier eller 1, antal_perioder)."""
+    r = np.atleast_1d(np.asarray(ranta, dtype=float))[:, None]
+    return (1.0 + r) ** -np.arange(antal_perioder)
+
+
+def npv(floden, ranta_pct):
+    """Nuvärde per rad vid kalkylräntan `ranta_pct` (procent, skalär eller en per rad)."""
+    floden = np.atleast_2d(floden)
+    return np.sum(floden * _diskonteringsfaktorer(np.asarray(ranta_pct) / 100, floden.shape[1]), axis=1)
+
+
+def diskonterad_payback(floden, ranta_pct):
+    """
+    Antal år (med linjär interpolation inom året) tills det diskonterade
+    ackumulerade kassaflödet blir >= 0. NaN om det inte sker inom horisonten.
+    """
+    floden = np.atleast_2d(floden)
+    diskonterade = floden * _diskonteringsfaktorer(np.asarray(ranta_pct) / 100, floden.shape[1])
+    ackumulerat = np.cumsum(diskonterade, axis=1)
+    positiv = ackumulerat >= 0
+    nar = np.argmax(positiv, axis=1)
+    finns = positiv[np.arange(floden.shape[0]), nar]
+
+    rader = np.arange(floden.shape[0])
+    t = np.maximum(nar, 1)
+    fore = ackumulerat[rader, t - 1]
+    flode = diskonterade[rader, t]
+    andel = np.divide(-fore, flode, out=np.zeros_like(fore), where=flode > 0)
+    resultat = np.where(nar == 0, 0.0, t - 1 + andel)
+    return np.where(finns, resultat, np.nan)
+
+
+def _sok_rot(f_och_derivata, n, skala, lagst, hogst, tol, max_iter):
+    """
+    Newton-steg med bisektion som reserv, för n rader samtidigt.
+    `f_och_derivata(r, idx)` ger f och f' för raderna idx. NaN där f inte byter tecken i [lagst, hogst].
+    """
+    alla = np.arange(n)
+    lo = np.full(n, lagst)
+    hi = np.full(n, hogst)
+    f_lo, _ = f_och_derivata(lo, alla)
+    f_hi, _ = f_och_derivata(hi, alla)
+    giltig = np.sign(f_lo) * np.sign(f_hi) <= 0
+
+    r = np.where(giltig, 0.1, np.nan)
+    steg_fore = hi - lo
+    aktiv = giltig.copy()
+    for _ in range(max_iter):
+        if not aktiv.any():
+            break
+        idx = np.flatnonzero(aktiv)
+        f, df = f_och_derivata(r[idx], idx)
+        klar = np.abs(f) <= skala[idx]
+
+        # Behåll ett intervall där f byter tecken
+        samma_som_lo = np.sign(f) == np.sign(f_lo[idx])
+        lo[idx] = np.where(samma_som_lo, r[idx], lo[idx])
+        f_lo[idx] = np.where(samma_som_lo, f, f_lo[idx])
+        hi[idx] = np.where(samma_som_lo, hi[idx], r[idx])
+
+        # Bisektion om Newton hamnar utanför intervallet eller inte minst halverar steget
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = r[idx] - f / df
+        utanfor = ~np.isfinite(newton) | (newton < lo[idx]) | (newton > hi[idx])
+        utanfor |= np.abs(newton - r[idx]) > 0.5 * steg_fore[idx]
+        nytt = np.where(utanfor, (lo[idx] + hi[idx]) / 2, newton)
+        steg_fore[idx] = np.abs(nytt - r[idx])
+
+        klar |= (np.abs(nytt - r[idx]) < tol) | (hi[idx] - lo[idx] < tol)
+        r[idx] = np.where(np.abs(f) <= skala[idx], r[idx], nytt)
+        aktiv[idx[klar]] = False
+    return r
+
+
+def _annuitet(r, ar):
+    """Nuvärdet av 1 kr per år i `ar` år och dess derivata i r. Serieutveckling nära r = 0."""
+    nara_noll = np.abs(r) < 1e-6
+    r_saker = np.where(nara_noll, 1.0, r)
+    v_n = (1.0 + r_saker) ** -ar
+    a = (1.0 - v_n) / r_saker
+    da = (ar * v_n / (1.0 + r_saker) * r_saker - (1.0 - v_n)) / r_saker ** 2
+    a = np.where(nara_noll, ar - ar * (ar + 1) / 2 * r, a)
+    da = np.where(nara_noll, -ar * (ar + 1) / 2, da)
+    return a, da
+
+
+def irr(floden, lagst=-0.99, hogst=10.0, tol=1e-10, max_iter=100):
+    """
+    Internränta per rad (som andel, 0.12 = 12 %), vektoriserad.
+
+    Roten söks i [lagst, hogst]. Rader utan teckenbyte i intervallet (t.ex.
+    investeringar som aldrig betalar sig) får NaN. För vanliga serier med en
+    investering följd av positiva flöden är NPV(r) avtagande och roten unik.
+
+    Rader med samma flöde alla år (standardantagandena) löses med
+    annuitetsformeln, så att varje iteration bara kostar några operationer
+    per rad i stället för en per år.
+    """
+    floden = np.atleast_2d(np.asarray(floden, dtype=float))
+    n, perioder = floden.shape
+    skala = np.abs(floden).max(axis=1) * tol
+    r = np.full(n, np.nan)
+
+    konstant = np.all(floden[:, 1:] == floden[:, 1:2], axis=1) if perioder > 1 else np.zeros(n, dtype=bool)
+    if konstant.any():
+        investering, flode = floden[konstant, 0], floden[konstant, 1]
+
+        def annuitet(r, idx):
+            a, da = _annuitet(r, perioder - 1)
+            return investering[idx] + flode[idx] * a, flode[idx] * da
+
+        r[konstant] = _sok_rot(annuitet, int(konstant.sum()), skala[konstant], lagst, hogst, tol, max_iter)
+
+    if not konstant.all():
+        ovriga = floden[~konstant]
+        t = np.arange(perioder)
+
+        def allman(r, idx):
+            rabatt = (1.0 + r)[:, None] ** -t
+            rader = ovriga[idx]
+            return np.sum(rader * rabatt, axis=1), np.sum(-t * rader * rabatt / (1.0 + r)[:, None], axis=1)
+
+        r[~konstant] = _sok_rot(allman, len(ovriga), skala[~konstant], lagst, hogst, tol, max_iter)
+    return r
@@ -0,0 +1,225 @@
+"""
+Uppmätt energibesparing ur inomhustemperaturer: graddagsnormerad analys av timvärden.
+
+Timvärdena från temperaturgivarna (en per lägenhet, ca 8,7 miljoner rader per
+1 000 lägenheter och år) lagras som en matris timmar × lägenheter (float32) i
+en .npy-fil som öppnas minnesmappad. Analysen går igenom matrisen i block om
+`block_timmar` timmar, så att bara ett block i taget behöver ligga i minnet.
+
+Värmebehovet per lägenhet räknas som gradtimmar: summan av (inne - ute) under
+de timmar då utetemperaturen är under `grans` (eldningsgränsen). Om varje
+lägenhet som är varmare än `maltemp` sänks till måltemperaturen minskar
+gradtimmarna; den relativa minskningen gånger uppvärmningens andel av
+fastighetens energi ger en uppmätt `besparing_temp` i procent. En uppmätt
+förbrukning (kWh/m²) för samma år normalårskorrigeras med graddagarna till
+`kwh_kvm`.
+
+    serie = konvertera_csv("inne_2024.csv", "inne_2024")   # en gång, ger inne_2024/temp.npy
+    ute = las_utetemp("ute_2024.csv", serie)
+    analys = analysera(oppna("inne_2024"), ute, maltemp=21.0)
+    analys.scenario(uppmatt_kwh_kvm=142.0, graddagar_normalar=3800)
+
+Från kommandoraden:
+
+    python inomhustemp.py inne_2024.csv --ute ute_2024.csv --kwh-kvm 142 --graddagar-normalar 3800
+"""
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+BLOCK_RADER = 1_000_000       # CSV-rader per block vid konverteringen
+BLOCK_TIMMAR = 744             # Timmar per block i analysen (en månad)
+STANDARD_MALTEMP = 21.0        # °C
+STANDARD_GRANS = 17.0          # Eldningsgräns, samma bas som graddagar (°C)
+STANDARD_ANDEL_UPPVARMNING = 0.75  # Uppvärmningens andel av energin, resten är främst varmvatten (antagande)
+STANDARD_KOLUMNER = {'lgh': 'lgh', 'tid': 'tid', 'temp': 'temp'}
+_TIMME = np.timedelta64(1, 'h')
+
+
+@dataclass
+class Tempserie:
+    """Inomhustemperatur per timme och lägenhet. `temp` är normalt en minnesmappad array."""
+    temp: np.ndarray        # Form (timmar, lägenheter), NaN = saknat värde
+    start: np.datetime64    # Första timmen
+    lgh: list               # Lägenheternas etiketter, i kolumnordning
+
+    @property
+    def tider(self):
+        return self.start + np.arange(self.temp.shape[0]) * _TIMME
+
+
+@dataclass
+class Tempanalys:
+    """Resultat per lägenhet och för hela fastigheten."""
+    per_lgh: pd.DataFrame       # Index lgh: medeltemp, timmar_over_mal, sankning (°C), gradtimmar, besparing_pct
+    besparing_uppvarmning: float  # Relativ minskning av gradtimmarna (0-1)
+    graddagar: float            # Graddagar för mätåret (bas `grans`)
+    andel_uppvarmning: float
+
+    @property
+    def besparing_temp(self):
+        """Uppmätt besparing av fastighetens energi i procent (samma enhet som kalkylen)."""
+        return self.besparing_uppvarmning * self.andel_uppvarmning * 100
+
+    def kwh_kvm(self, uppmatt_kwh_kvm, graddagar_normalar=None):
+        """
+        Normalårskorrigerad förbrukning: uppvärmningsdelen av den uppmätta
+        förbrukningen skalas med graddagarna för ett normalår, resten lämnas.
+        """
+        if not graddagar_normalar or not self.graddagar:
+            return float(uppmatt_kwh_kvm)
+        faktor = self.andel_uppvarmning * graddagar_normalar / self.graddagar + (1 - self.andel_uppvarmning)
+        return float(uppmatt_kwh_kvm) * faktor
+
+    def scenario(self, uppmatt_kwh_kvm=None, graddagar_normalar=None):
+        """Uppmätta värden för temp-kalkylen."""
+        scenario = {'besparing_temp': self.besparing_temp}
+        if uppmatt_kwh_kvm is not None:
+            scenario['kwh_kvm'] = self.kwh_kvm(uppmatt_kwh_kvm, graddagar_normalar)
+        return scenario
+
+
+def _las_csv(kalla, kolumner, block):
+    kolumner = {**STANDARD_KOLUMNER, **(kolumner or {})}
+    namn_i_fil = {kolumner[k]: k for k in STANDARD_KOLUMNER}
+    for del_df in pd.read_csv(kalla, usecols=list(namn_i_fil), dtype={kolumner['lgh']: str, kolumner['temp']: float}, chunksize=block):
+        del_df = del_df.rename(columns=namn_i_fil)
+        yield del_df['lgh'].to_numpy(), pd.to_datetime(del_df['tid']).to_numpy().astype('datetime64[h]'), del_df['temp'].to_numpy()
+
+
+def konvertera_csv(kalla, katalog, kolumner=None, block=BLOCK_RADER):
+    """
+    Konverterar en lång CSV (lgh, tid, temp) till en minnesmappad matris i
+    `katalog` (temp.npy och serie.json). Filen läses två gånger i block: först
+    lägenheter och tidsintervall, sedan värdena. Flera värden samma timme: det
+    sista gäller. Returnerar den öppnade Tempserie.
+    """
+    index = {}
+    forsta = sista = None
+    for lgh, tid, _ in _las_csv(kalla, kolumner, block):
+        for etikett in pd.unique(lgh):
+            index.setdefault(str(etikett), len(index))
+        forsta = tid.min() if forsta is None else min(forsta, tid.min())
+        sista = tid.max() if sista is None else max(sista, tid.max())
+    if forsta is None:
+        raise ValueError("filen innehåller inga avläsningar")
+
+    os.makedirs(katalog, exist_ok=True)
+    timmar = int((sista - forsta) // _TIMME) + 1
+    temp = np.lib.format.open_memmap(os.path.join(katalog, 'temp.npy'), mode='w+', dtype=np.float32, shape=(timmar, len(index)))
+    temp[:] = np.nan
+    if hasattr(kalla, 'seek'):
+        kalla.seek(0)
+    for lgh, tid, varden in _las_csv(kalla, kolumner, block):
+        koder, unika = pd.factorize(lgh)
+        kolumn = np.fromiter((index[str(u)] for u in unika), dtype=np.int64, count=len(unika))[koder]
+        temp[(tid - forsta) // _TIMME, kolumn] = varden
+    temp.flush()
+    del temp
+    with open(os.path.join(katalog, 'serie.json'), 'w', encoding='utf-8') as f:
+        json.dump({'start': str(forsta), 'lgh': list(index)}, f, ensure_ascii=False)
+    return oppna(katalog)
+
+
+def oppna(katalog):
+    """Öppnar en konverterad serie minnesmappad (skrivskyddad)."""
+    with open(os.path.join(katalog, 'serie.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    temp = np.load(os.path.join(katalog, 'temp.npy'), mmap_mode='r')
+    return Tempserie(temp=temp, start=np.datetime64(meta['start'], 'h'), lgh=meta['lgh'])
+
+
+def las_utetemp(kalla, serie, tid='tid', temp='temp'):
+    """Utetemperatur per timme för seriens timmar ur en CSV (tid, temp). Luckor interpoleras."""
+    df = pd.read_csv(kalla, usecols=[tid, temp])
+    timme = pd.to_datetime(df[tid]).to_numpy().astype('datetime64[h]')
+    per_timme = pd.Series(df[temp].to_numpy(dtype=float)).groupby(timme).mean()
+    ute = per_timme.reindex(serie.tider).interpolate(limit_direction='both').to_numpy()
+    if np.isnan(ute).all():
+        raise ValueError("utetemperaturen täcker inte seriens tidsperiod")
+    return ute
+
+
+def analysera(serie, ute, maltemp=STANDARD_MALTEMP, grans=STANDARD_GRANS, andel_uppvarmning=STANDARD_ANDEL_UPPVARMNING,
+              block_timmar=BLOCK_TIMMAR):
+    """
+    Gradtimmar per lägenhet före och efter sänkning till `maltemp`, blockvis
+    över timmarna. `ute` är utetemperaturen per timme (samma längd som serien).
+    """
+    ute = np.asarray(ute, dtype=np.float32)
+    timmar, antal_lgh = serie.temp.shape
+    if ute.shape != (timmar,):
+        raise ValueError(f"utetemperaturen har {ute.size} timmar, serien {timmar}")
+
+    gradtimmar = np.zeros(antal_lgh)
+    gradtimmar_mal = np.zeros(antal_lgh)
+    summa_temp = np.zeros(antal_lgh)
+    eldningstimmar = np.zeros(antal_lgh)
+    over_mal = np.zeros(antal_lgh)
+    sankning = np.zeros(antal_lgh)
+    for start in range(0, timmar, block_timmar):
+        inne = np.asarray(serie.temp[start:start + block_timmar])  # Läser blocket från disk
+        u = ute[start:start + block_timmar, None]
+        giltig = ~np.isnan(inne) & (u < grans)
+        inne = np.where(giltig, inne, np.minimum(u, maltemp))  # Ogiltiga timmar bidrar inte till någon summa
+        sankt = np.minimum(inne, maltemp)
+        gradtimmar += np.maximum(inne - u, 0).sum(axis=0)
+        gradtimmar_mal += np.maximum(sankt - u, 0).sum(axis=0)
+        sankning += (inne - sankt).sum(axis=0)
+        summa_temp += np.where(giltig, inne, 0).sum(axis=0)
+        eldningstimmar += giltig.sum(axis=0)
+        over_mal += (giltig & (inne > maltemp)).sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        medeltemp = summa_temp / eldningstimmar
+        besparing_lgh = 1 - gradtimmar_mal / gradtimmar
+    # Lägenheter med olika många giltiga timmar vägs lika: gradtimmar per giltig timme
+    med_data = eldningstimmar > 0
+    per_timme = np.where(med_data, gradtimmar / np.maximum(eldningstimmar, 1), 0)
+    per_timme_mal = np.where(med_data, gradtimmar_mal / np.maximum(eldningstimmar, 1), 0)
+    besparing = 1 - per_timme_mal.sum() / per_timme.sum() if per_timme.sum() > 0 else 0.0
+
+    per_lgh = pd.DataFrame({
+        'medeltemp': medeltemp,
+        'timmar_over_mal': over_mal,
+        'sankning': sankning / np.maximum(eldningstimmar, 1),
+        'gradtimmar': gradtimmar,
+        'besparing_pct': besparing_lgh * 100,
+    }, index=pd.Index(serie.lgh, name='lgh'))
+    graddagar = float(np.maximum(grans - ute, 0).sum() / 24)
+    return Tempanalys(per_lgh=per_lgh, besparing_uppvarmning=float(besparing), graddagar=graddagar,
+                      andel_uppvarmning=float(andel_uppvarmning))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Uppmätt besparing_temp och kwh_kvm ur inomhustemperaturer per timme.")
+    parser.add_argument('indata', help="Lång CSV (lgh, tid, temp) eller katalog med en redan konverterad serie")
+    parser.add_argument('--ute', required=True, help="CSV med utetemperatur (tid, temp)")
+    parser.add_argument('--katalog', help="Katalog för den minnesmappade serien (standard: CSV-filens namn utan ändelse)")
+    parser.add_argument('--maltemp', type=float, default=STANDARD_MALTEMP)
+    parser.add_argument('--grans', type=float, default=STANDARD_GRANS)
+    parser.add_argument('--andel-uppvarmning', type=float, default=STANDARD_ANDEL_UPPVARMNING)
+    parser.add_argument('--kwh-kvm', type=float, help="Uppmätt förbrukning (kWh/m²) för samma år")
+    parser.add_argument('--graddagar-normalar', type=float, help="Graddagar för ett normalår på orten (bas --grans)")
+    parser.add_argument('-o', '--utdata', help="CSV-fil för resultatet per lägenhet")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.indata):
+        serie = oppna(args.indata)
+    else:
+        serie = konvertera_csv(args.indata, args.katalog or os.path.splitext(args.indata)[0])
+    analys = analysera(serie, las_utetemp(args.ute, serie), args.maltemp, args.grans, args.andel_uppvarmning)
+    if args.utdata:
+        analys.per_lgh.to_csv(args.utdata)
+    print(f"{serie.temp.shape[1]} lägenheter, {serie.temp.shape[0]} timmar, {analys.graddagar:.0f} graddagar.", file=sys.stderr)
+    print(json.dumps(analys.scenario(args.kwh_kvm, args.graddagar_normalar)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Jämförelse av upp till MAX_SCENARIER fastnålade scenarier sida vid sida.
+
+Scenarierna får gälla olika kalkyler ("sensor A mot sensor B" eller "temp mot
+imd mot skada"). De samlas i en tabell per kalkyl med en rad per scenario och
+räknas med portfolj.berakna_portfolj, så att alla scenarier för en kalkyl tas
+i ett vektoriserat svep inklusive kassaflöde år för år, NPV, IRR och
+diskonterad payback. Resultaten läggs tillbaka i fastnålningsordning.
+
+    fastnalda = lagg_till([], "Sensor A", 'temp', {'pris_sensor_temp': 400})
+    fastnalda = lagg_till(fastnalda, "Sensor B", 'temp', {'pris_sensor_temp': 650})
+    jamforelse = jamfor(fastnalda)
+    jamforelse.nyckeltal['payback']   # array, en per scenario
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+import finans
+import kalkyl
+import portfolj
+
+MAX_SCENARIER = 50
+NYCKELTAL = ('total_initial', 'total_besparing', 'total_drift_ar', 'netto', 'payback') + portfolj.FINANSNYCKLAR
+
+
+@dataclass
+class Jamforelse:
+    """Nyckeltal och ackumulerat kassaflöde per fastnålat scenario."""
+    namn: list
+    calcs: list
+    nyckeltal: dict         # Nyckeltal -> array med ett värde per scenario
+    kassaflode: np.ndarray  # Ackumulerat kassaflöde, form (scenarier, ar)
+
+    def som_dataframe(self):
+        """En rad per scenario med namn, kalkyl och nyckeltalen."""
+        import pandas as pd
+
+        return pd.DataFrame({'namn': self.namn, 'calc': self.calcs, **self.nyckeltal})
+
+
+def lagg_till(fastnalda, namn, calc, varden):
+    """
+    Ny lista med scenariot fastnålat sist. Bara kalkylens nycklar sparas.
+    Kastar ValueError om kalkylen är okänd eller listan redan är full.
+    """
+    if calc not in kalkyl.SCENARIO_NYCKLAR:
+        raise ValueError(f"okänd kalkyl: {calc!r}")
+    if len(fastnalda) >= MAX_SCENARIER:
+        raise ValueError(f"högst {MAX_SCENARIER} scenarier kan jämföras")
+    scenario = {k: float(varden.get(k, kalkyl.STANDARDVARDEN[k])) for k in kalkyl.SCENARIO_NYCKLAR[calc]}
+    return list(fastnalda) + [{'namn': namn, 'calc': calc, 'varden': scenario}]
+
+
+def jamfor(fastnalda, ar=portfolj.AR, ranta=finans.STANDARD_RANTA, antaganden=None):
+    """Beräknar alla fastnålade scenarier (dicts från lagg_till), ett svep per kalkyl."""
+    if len(fastnalda) > MAX_SCENARIER:
+        raise ValueError(f"högst {MAX_SCENARIER} scenarier kan jämföras")
+    n = len(fastnalda)
+    calcs = [s['calc'] for s in fastnalda]
+    nyckeltal = {k: np.zeros(n) for k in NYCKELTAL}
+    kassaflode = np.zeros((n, ar))
+    for calc in kalkyl.CALC_KEY_LIST:
+        index = np.flatnonzero(np.asarray(calcs, dtype=object) == calc)
+        if index.size == 0:
+            continue
+        tabell = {k: np.array([fastnalda[i]['varden'][k] for i in index], dtype=float) for k in kalkyl.SCENARIO_NYCKLAR[calc]}
+        resultat = portfolj.berakna_portfolj(tabell, (calc,), ar, ranta=ranta, antaganden=antaganden, med_irr=True)
+        for k in NYCKELTAL:
+            nyckeltal[k][index] = resultat.resultat[calc][k]
+        kassaflode[index] = resultat.kassaflode[calc]
+    return Jamforelse(namn=[s['namn'] for s in fastnalda], calcs=calcs, nyckeltal=nyckeltal, kassaflode=kassaflode)
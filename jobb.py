@@ -0,0 +1,251 @@
+"""
+Bakgrundsjobb: långa beräkningar körs utanför Streamlit-omkörningen.
+
+`Jobbko.skicka` sparar jobbets indata på disk och returnerar ett jobb-id
+direkt. Jobbet körs i en processpool med ett begränsat antal arbetare som
+delas av alla sessioner i serverprocessen. Status, förlopp och resultat
+ligger i en katalog (SQLite för status, pickle-filer för indata och
+resultat), så att sidan kan fråga efter status vid varje omkörning och jobb
+överlever att sidan laddas om. Jobb som var köade eller vars arbetare
+dog när servern stängdes körs om vid nästa start.
+
+Identiska indata ger samma jobb: ett tidigare jobb med samma typ och indata
+återanvänds i stället för att räknas igen (se `omstart` i `Jobbko.skicka`).
+
+    ko = Jobbko("iot_jobb")
+    jobb_id = ko.skicka('montecarlo', dict(calc='temp', scenario={}, fordelningar=f, antal=10_000_000))
+    ko.status(jobb_id)['status']   # 'köad', 'körs', 'klar', 'fel' eller 'avbruten'
+    ko.resultat(jobb_id)           # MonteCarloResultat när jobbet är klart
+
+Antal arbetare styrs med IOT_JOBB_ARBETARE (standard 2).
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import montecarlo
+import parallell
+import skadesimulering
+
+# Jobbtyp -> funktion. Anropas med jobbets indata som nyckelordsargument samt
+# processer=1, vid_delresultat och avbryt (arbetarna är själva poolprocesser).
+JOBBTYPER = {
+    'montecarlo': montecarlo.simulera,
+    'portfolj': parallell.berakna_portfolj,
+    'skadesimulering': skadesimulering.simulera,
+}
+VANTANDE = ('köad', 'körs')
+KOLUMNER = ('id', 'typ', 'etikett', 'status', 'forlopp', 'meddelande', 'skapad', 'startad', 'klar')
+UPPDATERA_S = 0.5  # Hur ofta en arbetare skriver förlopp och läser avbrytflaggan
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobb (
+    id TEXT PRIMARY KEY,
+    typ TEXT NOT NULL,
+    nyckel TEXT NOT NULL,      -- Hash av typ och indata, för återanvändning
+    etikett TEXT NOT NULL DEFAULT '',  -- Kort beskrivning för listan
+    status TEXT NOT NULL,
+    forlopp REAL NOT NULL DEFAULT 0,
+    meddelande TEXT,
+    avbryt INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER,               -- Arbetarprocessen medan jobbet körs
+    skapad TEXT NOT NULL,      -- UTC, 'YYYY-MM-DD HH:MM:SS'
+    startad TEXT,
+    klar TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobb_nyckel ON jobb (nyckel, status);
+CREATE INDEX IF NOT EXISTS ix_jobb_skapad ON jobb (skapad);
+"""
+
+
+def _nu():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _anslut(katalog):
+    db = sqlite3.connect(os.path.join(katalog, 'jobb.sqlite'), check_same_thread=False, timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+def _fil(katalog, jobb_id, slag):
+    return os.path.join(katalog, f"{jobb_id}.{slag}.pkl")
+
+
+def _skriv_fil(sokvag, data):
+    """Skriver atomiskt, så att en läsare aldrig ser en halvskriven fil."""
+    tillfallig = f"{sokvag}.{os.getpid()}.tmp"
+    with open(tillfallig, 'wb') as f:
+        f.write(data)
+    os.replace(tillfallig, sokvag)
+
+
+def _lever(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _kor_jobb(katalog, jobb_id):
+    """Arbetare: kör ett köat jobb och skriver resultat och status. Kastar aldrig."""
+    db = _anslut(katalog)
+    try:
+        with db:
+            tagen = db.execute("UPDATE jobb SET status = 'körs', startad = ?, pid = ? WHERE id = ? AND status = 'köad'",
+                               (_nu(), os.getpid(), jobb_id)).rowcount
+        if not tagen:
+            return  # Avbrutet medan det var köat, eller redan taget av en annan arbetare
+        typ, = db.execute("SELECT typ FROM jobb WHERE id = ?", (jobb_id,)).fetchone()
+        with open(_fil(katalog, jobb_id, 'indata'), 'rb') as f:
+            argument = pickle.load(f)
+
+        senast = 0.0
+
+        def vid_delresultat(klara, totalt, _):
+            nonlocal senast
+            if time.monotonic() - senast >= UPPDATERA_S or klara == totalt:
+                senast = time.monotonic()
+                with db:
+                    db.execute("UPDATE jobb SET forlopp = ? WHERE id = ?", (klara / totalt, jobb_id))
+
+        def avbryt():
+            return bool(db.execute("SELECT avbryt FROM jobb WHERE id = ?", (jobb_id,)).fetchone()[0])
+
+        try:
+            resultat = JOBBTYPER[typ](**argument, processer=1, vid_delresultat=vid_delresultat, avbryt=avbryt)
+        except parallell.Avbruten as e:
+            status, meddelande = 'avbruten', str(e)
+        except Exception as e:
+            status, meddelande = 'fel', f"{type(e).__name__}: {e}"
+        else:
+            _skriv_fil(_fil(katalog, jobb_id, 'resultat'), pickle.dumps(resultat, protocol=pickle.HIGHEST_PROTOCOL))
+            status, meddelande = 'klar', None
+        with db:
+            db.execute("UPDATE jobb SET status = ?, meddelande = ?, forlopp = CASE WHEN ? = 'klar' THEN 1 ELSE forlopp END, "
+                       "klar = ?, pid = NULL WHERE id = ?", (status, meddelande, status, _nu(), jobb_id))
+    except Exception as e:
+        with db:
+            db.execute("UPDATE jobb SET status = 'fel', meddelande = ?, klar = ?, pid = NULL WHERE id = ?",
+                       (f"{type(e).__name__}: {e}", _nu(), jobb_id))
+    finally:
+        db.close()
+
+
+class Jobbko:
+    """
+    Jobbkö med status på disk i `katalog` och en egen pool med `arbetare`
+    processer. Trådsäker; en instans per serverprocess (st.cache_resource).
+    """
+
+    def __init__(self, katalog, arbetare=None):
+        self.katalog = katalog
+        self.arbetare = arbetare or max(int(os.environ.get('IOT_JOBB_ARBETARE') or 2), 1)
+        os.makedirs(katalog, exist_ok=True)
+        self._las = threading.Lock()
+        self._db = _anslut(katalog)
+        self._db.executescript(_SCHEMA)
+        self._pool = None
+        self._aterstall()
+
+    def _hamta_pool(self):
+        if self._pool is None:
+            self._pool = parallell.starta_pool(self.arbetare)
+        return self._pool
+
+    def _aterstall(self):
+        """Köar om jobb vars arbetare inte längre finns och startar alla köade jobb."""
+        with self._las, self._db:
+            for jobb_id, pid in self._db.execute("SELECT id, pid FROM jobb WHERE status = 'körs'").fetchall():
+                if pid is None or not _lever(pid):
+                    self._db.execute("UPDATE jobb SET status = 'köad', forlopp = 0, pid = NULL WHERE id = ?", (jobb_id,))
+            koade = [r[0] for r in self._db.execute("SELECT id FROM jobb WHERE status = 'köad' ORDER BY skapad")]
+        for jobb_id in koade:
+            self._starta(jobb_id)
+
+    def _starta(self, jobb_id):
+        self._hamta_pool().apply_async(_kor_jobb, (self.katalog, jobb_id))
+
+    def skicka(self, typ, argument, etikett='', omstart=False):
+        """
+        Köar ett jobb och returnerar dess id, eller id för ett befintligt jobb
+        med samma indata. Med `omstart` räknas ett avbrutet eller misslyckat
+        jobb om i stället för att återanvändas.
+        """
+        if typ not in JOBBTYPER:
+            raise ValueError(f"Okänd jobbtyp: {typ}")
+        data = pickle.dumps(argument, protocol=pickle.HIGHEST_PROTOCOL)
+        nyckel = hashlib.sha256(typ.encode() + b'\0' + data).hexdigest()
+        with self._las:
+            statusar = VANTANDE + ('klar',) if omstart else VANTANDE + ('klar', 'fel', 'avbruten')
+            befintligt = self._db.execute(
+                f"SELECT id FROM jobb WHERE nyckel = ? AND status IN ({', '.join('?' * len(statusar))}) ORDER BY rowid DESC LIMIT 1",
+                (nyckel, *statusar)).fetchone()
+            if befintligt is not None:
+                return befintligt[0]
+            jobb_id = uuid.uuid4().hex[:12]
+            _skriv_fil(_fil(self.katalog, jobb_id, 'indata'), data)
+            with self._db:
+                self._db.execute("INSERT INTO jobb (id, typ, etikett, nyckel, status, skapad) VALUES (?, ?, ?, ?, 'köad', ?)",
+                                 (jobb_id, typ, etikett, nyckel, _nu()))
+        self._starta(jobb_id)
+        return jobb_id
+
+    def status(self, jobb_id):
+        """Jobbets rad som dict, eller None om jobbet inte finns."""
+        with self._las:
+            rad = self._db.execute(f"SELECT {', '.join(KOLUMNER)} FROM jobb WHERE id = ?", (jobb_id,)).fetchone()
+        return dict(zip(KOLUMNER, rad)) if rad is not None else None
+
+    def lista(self, antal=20):
+        """De senaste jobben, nyast först."""
+        with self._las:
+            rader = self._db.execute(f"SELECT {', '.join(KOLUMNER)} FROM jobb ORDER BY skapad DESC, rowid DESC LIMIT ?",
+                                     (antal,)).fetchall()
+        return [dict(zip(KOLUMNER, rad)) for rad in rader]
+
+    def indata(self, jobb_id):
+        """Jobbets indata (argumenten till jobbfunktionen)."""
+        with open(_fil(self.katalog, jobb_id, 'indata'), 'rb') as f:
+            return pickle.load(f)
+
+    def resultat(self, jobb_id):
+        """Resultatet av ett klart jobb, annars None."""
+        try:
+            with open(_fil(self.katalog, jobb_id, 'resultat'), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def avbryt(self, jobb_id):
+        """Köade jobb avbryts direkt; pågående stoppas av arbetaren vid nästa block."""
+        with self._las, self._db:
+            self._db.execute("UPDATE jobb SET status = 'avbruten', klar = ? WHERE id = ? AND status = 'köad'", (_nu(), jobb_id))
+            self._db.execute("UPDATE jobb SET avbryt = 1 WHERE id = ? AND status = 'körs'", (jobb_id,))
+
+    def ta_bort(self, jobb_id):
+        """Tar bort ett jobb som inte längre väntar, med indata och resultat."""
+        with self._las, self._db:
+            borttagen = self._db.execute("DELETE FROM jobb WHERE id = ? AND status NOT IN (?, ?)", (jobb_id, *VANTANDE)).rowcount
+        if borttagen:
+            for slag in ('indata', 'resultat'):
+                try:
+                    os.remove(_fil(self.katalog, jobb_id, slag))
+                except FileNotFoundError:
+                    pass
+        return bool(borttagen)
+
+    def stang(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        self._db.close()
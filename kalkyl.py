@@ -0,0 +1,348 @@
+"""
+Beräkningskärna för IoT ROI-kalkylatorn.
+
+Modulen är ren Python utan beroenden till streamlit, plotly eller pandas och kan
+därför importeras direkt av batchjobb och workers. Formlerna i `formler_*` är
+skrivna med vanlig aritmetik och fungerar både på skalärer och NumPy-arrayer.
+"""
+from dataclasses import asdict, dataclass, fields
+from typing import ClassVar, Mapping
+
+# --- KONSTANTER OCH STANDARDVÄRDEN ---
+CALC_KEY_LIST = ("temp", "imd", "skada")
+
+# Samma nycklar och startvärden som st.session_state i app.py/app_de.py
+STANDARDVARDEN = {
+    'antal_lgh_main': 1000,
+    'uh_per_sensor': 100,
+    'lora_cost': 75,
+    'web_cost': 50,
+    'app_cost': 5000,
+
+    'pris_sensor_temp': 688,
+    'pris_install_temp': 409,
+    'startkostnad_temp': 27500,
+    'kvm_snitt': 67,
+    'kwh_kvm': 130.6,
+    'pris_kwh': 1.02,
+    'besparing_temp': 6.0,
+    'uh_besparing_temp': 200,
+
+    'pris_sensor_imd': 1875,
+    'pris_install_imd': 459,
+    'besparing_lgh_vatten': 500,
+    'besparing_lgh_uh_imd': 200,
+
+    'pris_sensor_skada': 714.42,
+    'pris_install_skada': 523,
+    'kostnad_skada': 70000,
+    'frekvens_skada': 50,
+    'besparing_skada_pct': 60.0,
+    'uh_besparing_skada_lgh': 171,
+}
+
+GEMENSAMMA_NYCKLAR = ('antal_lgh_main', 'uh_per_sensor', 'lora_cost', 'web_cost', 'app_cost')
+
+# Nycklarna som sparas i scenariofilerna (iot_<kalkyl>_scenario.json), i samma ordning
+SCENARIO_NYCKLAR = {
+    'temp': GEMENSAMMA_NYCKLAR + (
+        'pris_sensor_temp', 'pris_install_temp', 'startkostnad_temp', 'kvm_snitt',
+        'kwh_kvm', 'pris_kwh', 'besparing_temp', 'uh_besparing_temp',
+    ),
+    'imd': GEMENSAMMA_NYCKLAR + (
+        'pris_sensor_imd', 'pris_install_imd', 'besparing_lgh_vatten', 'besparing_lgh_uh_imd',
+    ),
+    'skada': GEMENSAMMA_NYCKLAR + (
+        'pris_sensor_skada', 'pris_install_skada', 'kostnad_skada', 'frekvens_skada',
+        'besparing_skada_pct', 'uh_besparing_skada_lgh',
+    ),
+}
+
+# Nycklar som bara finns i en kalkyl (används för att känna igen scenariofiler)
+_UNIKA_NYCKLAR = {calc: frozenset(SCENARIO_NYCKLAR[calc]) - frozenset(GEMENSAMMA_NYCKLAR) for calc in CALC_KEY_LIST}
+
+RESERV_SENSOR_TEMP = 1.01  # 1% reserv på temp-sensorer
+RESERV_MATARE_IMD = 5      # Antal extra mätare som köps in i reserv
+
+
+# --- FORMLER (fungerar på skalärer och arrayer) ---
+# Varje mellanled är en egen funktion vars parametrar heter som indatanycklarna
+# eller mellanleden de bygger på. formler_* sätter ihop dem; berakningsgraf.py
+# använder samma funktioner som noder i en beroendegraf.
+
+def total_drift_ar(antal_lgh, uh_per_sensor, lora_cost, web_cost, app_cost):
+    """Total årlig driftskostnad för fastigheten (används i alla kalkyler)."""
+    total_drift_ar_per_sensor = uh_per_sensor + lora_cost + web_cost
+    return (antal_lgh * total_drift_ar_per_sensor) + app_cost
+
+
+def _drift(v):
+    return total_drift_ar(v['antal_lgh_main'], v['uh_per_sensor'], v['lora_cost'], v['web_cost'], v['app_cost'])
+
+
+def summa_besparing(prisdriven_besparing, besparing_underhall_kr):
+    return prisdriven_besparing + besparing_underhall_kr
+
+
+def netto(total_besparing, total_drift_ar):
+    return total_besparing - total_drift_ar
+
+
+def total_initial_temp(antal_lgh_main, pris_sensor_temp, pris_install_temp, startkostnad_temp):
+    return antal_lgh_main * (pris_sensor_temp * RESERV_SENSOR_TEMP + pris_install_temp) + startkostnad_temp
+
+
+def total_kwh_fastighet(antal_lgh_main, kvm_snitt, kwh_kvm):
+    return antal_lgh_main * kvm_snitt * kwh_kvm
+
+
+def besparing_energi_kr(total_kwh_fastighet, pris_kwh, besparing_temp):
+    return total_kwh_fastighet * pris_kwh * (besparing_temp / 100)
+
+
+def besparing_underhall_temp(antal_lgh_main, uh_besparing_temp):
+    return antal_lgh_main * uh_besparing_temp
+
+
+def besparing_lgh_ar(kvm_snitt, kwh_kvm, pris_kwh, besparing_temp):
+    """KPI: Brutto energibesparing/lgh/år."""
+    return kvm_snitt * kwh_kvm * pris_kwh * (besparing_temp / 100)
+
+
+def total_initial_imd(antal_lgh_main, pris_sensor_imd, pris_install_imd):
+    return antal_lgh_main * (pris_sensor_imd + pris_install_imd) + (RESERV_MATARE_IMD * pris_sensor_imd)
+
+
+def besparing_vatten_kr(antal_lgh_main, besparing_lgh_vatten):
+    return antal_lgh_main * besparing_lgh_vatten
+
+
+def besparing_underhall_imd(antal_lgh_main, besparing_lgh_uh_imd):
+    return antal_lgh_main * besparing_lgh_uh_imd
+
+
+def total_initial_skada(antal_lgh_main, pris_sensor_skada, pris_install_skada):
+    return antal_lgh_main * (pris_sensor_skada + pris_install_skada)
+
+
+def tot_skadekostnad_utan_iot(antal_lgh_main, frekvens_skada, kostnad_skada):
+    return (antal_lgh_main / 1000) * (frekvens_skada * kostnad_skada)
+
+
+def besparing_skador_kr(tot_skadekostnad_utan_iot, besparing_skada_pct):
+    return tot_skadekostnad_utan_iot * (besparing_skada_pct / 100)
+
+
+def besparing_underhall_skada(antal_lgh_main, uh_besparing_skada_lgh):
+    return antal_lgh_main * uh_besparing_skada_lgh
+
+
+def formler_temp(v):
+    """Temperatur & Energi: alla mellanled och nyckeltal utom payback."""
+    kwh = total_kwh_fastighet(v['antal_lgh_main'], v['kvm_snitt'], v['kwh_kvm'])
+    energi = besparing_energi_kr(kwh, v['pris_kwh'], v['besparing_temp'])
+    underhall = besparing_underhall_temp(v['antal_lgh_main'], v['uh_besparing_temp'])
+    besparing = summa_besparing(energi, underhall)
+    drift = _drift(v)
+    return {
+        'total_initial': total_initial_temp(v['antal_lgh_main'], v['pris_sensor_temp'], v['pris_install_temp'], v['startkostnad_temp']),
+        'total_besparing': besparing,
+        'total_drift_ar': drift,
+        'netto': netto(besparing, drift),
+        'total_kwh_fastighet': kwh,
+        'besparing_energi_kr': energi,
+        'besparing_underhall_kr': underhall,
+        'besparing_lgh_ar': besparing_lgh_ar(v['kvm_snitt'], v['kwh_kvm'], v['pris_kwh'], v['besparing_temp']),
+    }
+
+
+def formler_imd(v):
+    """IMD Vattenförbrukning: alla mellanled och nyckeltal utom payback."""
+    vatten = besparing_vatten_kr(v['antal_lgh_main'], v['besparing_lgh_vatten'])
+    underhall = besparing_underhall_imd(v['antal_lgh_main'], v['besparing_lgh_uh_imd'])
+    besparing = summa_besparing(vatten, underhall)
+    drift = _drift(v)
+    return {
+        'total_initial': total_initial_imd(v['antal_lgh_main'], v['pris_sensor_imd'], v['pris_install_imd']),
+        'total_besparing': besparing,
+        'total_drift_ar': drift,
+        'netto': netto(besparing, drift),
+        'besparing_vatten_kr': vatten,
+        'besparing_underhall_kr': underhall,
+    }
+
+
+def formler_skada(v):
+    """Vattenskadeskydd: alla mellanled och nyckeltal utom payback."""
+    skadekostnad = tot_skadekostnad_utan_iot(v['antal_lgh_main'], v['frekvens_skada'], v['kostnad_skada'])
+    skador = besparing_skador_kr(skadekostnad, v['besparing_skada_pct'])
+    underhall = besparing_underhall_skada(v['antal_lgh_main'], v['uh_besparing_skada_lgh'])
+    besparing = summa_besparing(skador, underhall)
+    drift = _drift(v)
+    return {
+        'total_initial': total_initial_skada(v['antal_lgh_main'], v['pris_sensor_skada'], v['pris_install_skada']),
+        'total_besparing': besparing,
+        'total_drift_ar': drift,
+        'netto': netto(besparing, drift),
+        'tot_skadekostnad_utan_iot': skadekostnad,
+        'besparing_skador_kr': skador,
+        'besparing_underhall_kr': underhall,
+    }
+
+
+FORMLER = {
+    'temp': formler_temp,
+    'imd': formler_imd,
+    'skada': formler_skada,
+}
+
+
+def payback(total_initial, netto):
+    """Payback-tid i år. 0 betyder att investeringen aldrig betalar sig (visas som N/A)."""
+    return total_initial / netto if netto > 0 else 0
+
+
+# --- TYPADE INDATA ---
+
+@dataclass(frozen=True)
+class GemensammaIndata:
+    """Gemensamma driftskostnader från sidofältet."""
+    antal_lgh_main: int = STANDARDVARDEN['antal_lgh_main']
+    uh_per_sensor: float = STANDARDVARDEN['uh_per_sensor']
+    lora_cost: float = STANDARDVARDEN['lora_cost']
+    web_cost: float = STANDARDVARDEN['web_cost']
+    app_cost: float = STANDARDVARDEN['app_cost']
+
+    calc: ClassVar[str] = ""
+
+    @classmethod
+    def from_dict(cls, data: Mapping):
+        """Skapar indata från en scenario-dict. Okända nycklar ignoreras, saknade får standardvärden."""
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class TempIndata(GemensammaIndata):
+    pris_sensor_temp: float = STANDARDVARDEN['pris_sensor_temp']
+    pris_install_temp: float = STANDARDVARDEN['pris_install_temp']
+    startkostnad_temp: float = STANDARDVARDEN['startkostnad_temp']
+    kvm_snitt: float = STANDARDVARDEN['kvm_snitt']
+    kwh_kvm: float = STANDARDVARDEN['kwh_kvm']
+    pris_kwh: float = STANDARDVARDEN['pris_kwh']
+    besparing_temp: float = STANDARDVARDEN['besparing_temp']
+    uh_besparing_temp: float = STANDARDVARDEN['uh_besparing_temp']
+
+    calc: ClassVar[str] = "temp"
+
+
+@dataclass(frozen=True)
+class ImdIndata(GemensammaIndata):
+    pris_sensor_imd: float = STANDARDVARDEN['pris_sensor_imd']
+    pris_install_imd: float = STANDARDVARDEN['pris_install_imd']
+    besparing_lgh_vatten: float = STANDARDVARDEN['besparing_lgh_vatten']
+    besparing_lgh_uh_imd: float = STANDARDVARDEN['besparing_lgh_uh_imd']
+
+    calc: ClassVar[str] = "imd"
+
+
+@dataclass(frozen=True)
+class SkadaIndata(GemensammaIndata):
+    pris_sensor_skada: float = STANDARDVARDEN['pris_sensor_skada']
+    pris_install_skada: float = STANDARDVARDEN['pris_install_skada']
+    kostnad_skada: float = STANDARDVARDEN['kostnad_skada']
+    frekvens_skada: float = STANDARDVARDEN['frekvens_skada']
+    besparing_skada_pct: float = STANDARDVARDEN['besparing_skada_pct']
+    uh_besparing_skada_lgh: float = STANDARDVARDEN['uh_besparing_skada_lgh']
+
+    calc: ClassVar[str] = "skada"
+
+
+INDATA_KLASSER = {
+    'temp': TempIndata,
+    'imd': ImdIndata,
+    'skada': SkadaIndata,
+}
+
+
+# --- TYPADE RESULTAT ---
+
+@dataclass(frozen=True)
+class Resultat:
+    total_initial: float
+    total_besparing: float
+    total_drift_ar: float
+    netto: float
+    payback: float
+
+    def as_dict(self):
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class TempResultat(Resultat):
+    total_kwh_fastighet: float
+    besparing_energi_kr: float
+    besparing_underhall_kr: float
+    besparing_lgh_ar: float
+
+
+@dataclass(frozen=True)
+class ImdResultat(Resultat):
+    besparing_vatten_kr: float
+    besparing_underhall_kr: float
+
+
+@dataclass(frozen=True)
+class SkadaResultat(Resultat):
+    tot_skadekostnad_utan_iot: float
+    besparing_skador_kr: float
+    besparing_underhall_kr: float
+
+
+RESULTAT_KLASSER = {
+    'temp': TempResultat,
+    'imd': ImdResultat,
+    'skada': SkadaResultat,
+}
+
+
+# --- BERÄKNING ---
+
+def _berakna(calc, indata):
+    varden = FORMLER[calc](indata.as_dict())
+    return RESULTAT_KLASSER[calc](payback=payback(varden['total_initial'], varden['netto']), **varden)
+
+
+def berakna_temp(indata: TempIndata) -> TempResultat:
+    """Beräknar ROI för Temperatur & Energi."""
+    return _berakna('temp', indata)
+
+
+def berakna_imd(indata: ImdIndata) -> ImdResultat:
+    """Beräknar ROI för IMD Vattenförbrukning."""
+    return _berakna('imd', indata)
+
+
+def berakna_skada(indata: SkadaIndata) -> SkadaResultat:
+    """Beräknar ROI för Vattenskadeskydd."""
+    return _berakna('skada', indata)
+
+
+def berakna(calc: str, scenario: Mapping) -> Resultat:
+    """Beräknar en kalkyl direkt från en scenario-dict (t.ex. en sparad JSON-fil)."""
+    if calc not in INDATA_KLASSER:
+        raise ValueError(f"Okänd kalkyl: {calc!r} (giltiga: {', '.join(CALC_KEY_LIST)})")
+    return _berakna(calc, INDATA_KLASSER[calc].from_dict(scenario))
+
+
+def identifiera_kalkyl(scenario: Mapping):
+    """Gissar kalkyltyp från nycklarna i en scenario-dict. Returnerar None om ingen matchar."""
+    if scenario.get('calc') in INDATA_KLASSER:
+        return scenario['calc']
+    for calc in CALC_KEY_LIST:
+        if not _UNIKA_NYCKLAR[calc].isdisjoint(scenario.keys()):
+            return calc
+    return None
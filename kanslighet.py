@@ -0,0 +1,78 @@
+"""
+Känslighetsanalys (tornado) för en kalkyl.
+
+Varje indata störs med ±steg procent, en i taget, och alla störningar
+utvärderas som en enda vektoriserad batch med formlerna i kalkyl.py.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+import kalkyl
+import portfolj
+
+
+@dataclass
+class KanslighetResultat:
+    """En rad per störning: vilken nyckel, signerat steg i procent och utfallet."""
+    calc: str
+    bas: dict
+    bas_netto: float
+    bas_payback: float
+    nyckel: np.ndarray
+    steg: np.ndarray
+    varde: np.ndarray
+    netto: np.ndarray
+    payback: np.ndarray   # NaN där investeringen aldrig betalar sig
+
+    def tornado(self, steg, matt='netto'):
+        """
+        Rader för tornadodiagrammet vid ±steg, sorterade efter störst utslag först.
+        Varje rad är (nyckel, utfall vid -steg, utfall vid +steg).
+        """
+        utfall = self.netto if matt == 'netto' else self.payback
+        bas = self.bas_netto if matt == 'netto' else self.bas_payback
+        rader = []
+        for nyckel in dict.fromkeys(self.nyckel):
+            minus = utfall[(self.nyckel == nyckel) & np.isclose(self.steg, -steg)]
+            plus = utfall[(self.nyckel == nyckel) & np.isclose(self.steg, steg)]
+            if minus.size and plus.size:
+                rader.append((nyckel, float(minus[0]), float(plus[0])))
+        return sorted(rader, key=lambda r: -np.nan_to_num(max(abs(r[1] - bas), abs(r[2] - bas)), nan=np.inf))
+
+
+def berakna_kanslighet(calc, scenario, steg_pct=(10.0,), nycklar=None):
+    """
+    Stör varje nyckel i `nycklar` (standard: alla kalkylens indata inkl. sidofältet)
+    med -steg och +steg för varje steg i `steg_pct`, och beräknar allt i ett svep.
+    """
+    bas = kalkyl.INDATA_KLASSER[calc].from_dict(scenario).as_dict()
+    nycklar = list(kalkyl.SCENARIO_NYCKLAR[calc] if nycklar is None else nycklar)
+    signerade_steg = np.array([s for steg in steg_pct for s in (-steg, steg)], dtype=float)
+
+    # Rad 0 är basfallet, därefter ett block per nyckel med alla signerade steg
+    n = 1 + len(nycklar) * signerade_steg.size
+    rad_nyckel = np.array([''] + [k for k in nycklar for _ in signerade_steg], dtype=object)
+    rad_steg = np.concatenate([[0.0], np.tile(signerade_steg, len(nycklar))])
+
+    kolumner = {k: np.full(n, float(v)) for k, v in bas.items()}
+    for i, nyckel in enumerate(nycklar):
+        block = slice(1 + i * signerade_steg.size, 1 + (i + 1) * signerade_steg.size)
+        kolumner[nyckel][block] *= 1 + signerade_steg / 100
+
+    varden = portfolj.berakna_vektor(calc, kolumner)
+    netto = np.broadcast_to(np.asarray(varden['netto'], dtype=float), (n,))
+    payback = np.where(varden['payback'] > 0, varden['payback'], np.nan)
+    rad_varde = np.array([kolumner[k][i] if k else np.nan for i, k in enumerate(rad_nyckel)])
+
+    return KanslighetResultat(
+        calc=calc,
+        bas=bas,
+        bas_netto=float(netto[0]),
+        bas_payback=float(payback[0]),
+        nyckel=rad_nyckel[1:],
+        steg=rad_steg[1:],
+        varde=rad_varde[1:],
+        netto=netto[1:],
+        payback=payback[1:],
+    )
@@ -0,0 +1,104 @@
+"""
+År-för-år-kassaflöden för många scenarier på en gång.
+
+Kalkylerna i kalkyl.py ger ett konstant nettoflöde per år. Här byggs i stället
+hela matrisen (scenarier, år + 1) där kolumn 0 är investeringen och varje år
+kan skilja sig: energi-/vattenpriset och driftkostnaderna räknas upp årligen,
+batterier (uh_per_sensor) kan bytas i cykler i stället för jämnt varje år och
+sensorerna köps om när de når sin livslängd. Med standardantagandena blir
+flödet exakt det konstanta nettot från kalkylerna.
+"""
+from dataclasses import asdict, dataclass, fields
+
+import numpy as np
+
+import kalkyl
+
+# Besparingen som följer energipriset (pris_kwh) respektive vatten- och skadekostnaderna
+PRISDRIVEN_BESPARING = {
+    'temp': 'besparing_energi_kr',
+    'imd': 'besparing_vatten_kr',
+    'skada': 'besparing_skador_kr',
+}
+
+# Engångskostnader som inte upprepas när sensorerna byts ut
+EJ_ATERKOMMANDE = {
+    'temp': ('startkostnad_temp',),
+    'imd': (),
+    'skada': (),
+}
+
+
+@dataclass(frozen=True)
+class Antaganden:
+    """Antaganden för kassaflödet över tid. Fälten kan vara skalärer eller en array per scenario."""
+    prisokning_pct: float = 0.0     # Årlig ökning av energi-/vatten-/skadekostnaden (%)
+    kostnadsokning_pct: float = 0.0  # Årlig ökning av drift- och underhållskostnader (%)
+    batteribyte_ar: int = 0         # Batterier byts vart N:e år (N * uh_per_sensor per byte). 0 = jämnt varje år
+    livslangd_ar: int = 0           # Sensorerna köps om efter N år (utan projektstart). 0 = håller hela perioden
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+    def as_dict(self):
+        return asdict(self)
+
+
+STANDARDANTAGANDEN = Antaganden().as_dict()
+
+
+def _kolumn(varde):
+    """Skalär eller array per scenario -> form (scenarier eller 1, 1) för broadcast mot åren."""
+    return np.atleast_1d(np.asarray(varde, dtype=float))[:, None]
+
+
+def arsfloden(calc, kolumner, ar, antaganden=None, varden=None):
+    """
+    Kassaflöde per scenario och år, form (scenarier, ar + 1).
+
+    `kolumner` är kalkylens indata (skalärer eller arrayer, som till
+    kalkyl.FORMLER). `varden` kan skickas med om formlerna redan är körda.
+    """
+    antaganden = antaganden or Antaganden()
+    varden = kalkyl.FORMLER[calc](kolumner) if varden is None else varden
+    t = np.arange(1, ar + 1, dtype=float)
+
+    prisfaktor = (1 + _kolumn(antaganden.prisokning_pct) / 100) ** (t - 1)
+    kostnadsfaktor = (1 + _kolumn(antaganden.kostnadsokning_pct) / 100) ** (t - 1)
+
+    # Batterikostnaden ingår i total_drift_ar som antal_lgh * uh_per_sensor per år
+    batteri_ar = _kolumn(kolumner['antal_lgh_main']) * _kolumn(kolumner['uh_per_sensor'])
+    ovrig_drift = _kolumn(varden['total_drift_ar']) - batteri_ar
+    prisdriven = _kolumn(varden[PRISDRIVEN_BESPARING[calc]])
+    ovrig_besparing = _kolumn(varden['total_besparing']) - prisdriven
+
+    # Sensorbyte: år livslangd, 2 * livslangd, ... (0 = aldrig)
+    livslangd = _kolumn(antaganden.livslangd_ar)
+    bytesar = (livslangd > 0) & (np.mod(t, np.where(livslangd > 0, livslangd, 1)) == 0)
+
+    # Batteribyte i cykler; nya sensorer levereras med nya batterier så cykeln börjar om
+    cykel = _kolumn(antaganden.batteribyte_ar)
+    ar_sedan_byte = np.where(livslangd > 0, np.mod(t - 1, np.where(livslangd > 0, livslangd, 1)) + 1, t)
+    batteribyte = (cykel > 0) & (np.mod(ar_sedan_byte, np.where(cykel > 0, cykel, 1)) == 0) & ~bytesar
+    batterikostnad = np.where(cykel > 0, batteri_ar * cykel * batteribyte, batteri_ar)
+
+    aterinvestering = _kolumn(varden['total_initial'])
+    for nyckel in EJ_ATERKOMMANDE[calc]:
+        aterinvestering = aterinvestering - _kolumn(kolumner[nyckel])
+
+    netto = (prisdriven * prisfaktor
+             + (ovrig_besparing - ovrig_drift - batterikostnad) * kostnadsfaktor
+             - aterinvestering * bytesar)
+
+    total_initial = np.atleast_1d(np.asarray(varden['total_initial'], dtype=float))
+    n = np.broadcast_shapes(total_initial.shape, netto.shape[:1])[0]
+    floden = np.empty((n, ar + 1))
+    floden[:, 0] = -total_initial
+    floden[:, 1:] = netto
+    return floden
+
+
+def ackumulerat(floden):
+    """Ackumulerat kassaflöde vid slutet av år 1..ar, form (scenarier, ar)."""
+    return np.cumsum(floden, axis=1)[:, 1:]
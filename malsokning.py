@@ -0,0 +1,157 @@
+"""
+Målsökning: vilket värde på en indata ger en viss payback, netto, NPV eller IRR?
+
+    "Vilket sensorpris ger 3 års payback för 1000 lägenheter?"
+    los_scenario('temp', scenario, 'pris_sensor_temp', 'payback', 3.0)
+
+Alla mål skrivs om till en residual r(x) som är noll vid målet. Payback P
+blir total_initial - P * netto och IRR i blir NPV vid räntan i, så för
+kalkylerna i kalkyl.py och kassaflode.py är r(x) affin i varje enskild indata
+och löses i sluten form från två utvärderingar. En tredje punkt kontrollerar
+linjäriteten per rad; rader där den inte håller (t.ex. diskonterad payback)
+löses med vektoriserad bisektion. Allt körs på arrayer, så samma fråga kan
+ställas för en hel portfölj på en gång.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+import finans
+import kalkyl
+import kassaflode
+import portfolj
+
+MAL = ('payback', 'netto', 'npv', 'irr', 'diskonterad_payback')
+PROCENTNYCKLAR = ('besparing_temp', 'besparing_skada_pct')  # Kan inte lösas över 100 %
+
+
+@dataclass
+class Malsokning:
+    """Resultat per rad. `varde` är NaN där målet inte går att nå inom gränserna."""
+    calc: str
+    variabel: str
+    mal: str
+    malvarde: float
+    varde: np.ndarray
+    uppnatt: np.ndarray  # Målmåttet vid det lösta värdet
+    sluten: np.ndarray   # True där den slutna formen användes, False där bisektion behövdes
+
+
+def _med_varde(kolumner, variabel, x):
+    kopia = dict(kolumner)
+    kopia[variabel] = x
+    return kopia
+
+
+def _floden(calc, kolumner, varden, ar, antaganden):
+    return kassaflode.arsfloden(calc, kolumner, ar, antaganden, varden)
+
+
+def mattvarde(calc, kolumner, mal, ar=portfolj.AR, ranta=finans.STANDARD_RANTA, antaganden=None):
+    """Målmåttet per rad. IRR i procent, payback 0 = aldrig, diskonterad payback NaN = inte inom horisonten."""
+    varden = kalkyl.FORMLER[calc](kolumner)
+    if mal == 'payback':
+        return portfolj.payback_vektor(varden['total_initial'], varden['netto'])
+    if mal == 'netto':
+        return np.asarray(varden['netto'], dtype=float)
+    floden = _floden(calc, kolumner, varden, ar, antaganden)
+    if mal == 'npv':
+        return finans.npv(floden, ranta)
+    if mal == 'irr':
+        return finans.irr(floden) * 100
+    return finans.diskonterad_payback(floden, ranta)
+
+
+def _residual(calc, kolumner, mal, malvarde, ar, ranta, antaganden):
+    varden = kalkyl.FORMLER[calc](kolumner)
+    if mal == 'payback':
+        return np.asarray(varden['total_initial'] - malvarde * varden['netto'], dtype=float)
+    if mal == 'netto':
+        return np.asarray(varden['netto'] - malvarde, dtype=float)
+    floden = _floden(calc, kolumner, varden, ar, antaganden)
+    if mal == 'npv':
+        return finans.npv(floden, ranta) - malvarde
+    if mal == 'irr':
+        return finans.npv(floden, malvarde)
+    disk = finans.diskonterad_payback(floden, ranta)
+    return np.where(np.isnan(disk), np.inf, disk - malvarde)
+
+
+def los(calc, kolumner, variabel, mal, malvarde, ar=portfolj.AR, ranta=finans.STANDARD_RANTA, antaganden=None,
+        lagst=0.0, hogst=None, tol=1e-7, max_iter=100):
+    """
+    Löser `variabel` så att `mal` blir `malvarde` för varje rad i `kolumner`
+    (kalkylens indata som arrayer med samma längd, se portfolj.kolumner_fran_tabell).
+
+    Lösningen söks i [lagst, hogst]. `hogst` är som standard 100 för procentsatser
+    och obegränsad för den slutna formen; bisektionen söker då upp till tio
+    gånger det nuvarande värdet.
+    """
+    if mal not in MAL:
+        raise ValueError(f"okänt mål: {mal!r} (giltiga: {', '.join(MAL)})")
+    if variabel not in kalkyl.SCENARIO_NYCKLAR[calc]:
+        raise ValueError(f"{variabel!r} är inte en indata i {calc}-kalkylen")
+    if mal in ('payback', 'diskonterad_payback') and malvarde <= 0:
+        raise ValueError("mål-payback måste vara större än 0")
+    if hogst is None and variabel in PROCENTNYCKLAR:
+        hogst = 100.0
+
+    n = portfolj.antal_rader(kolumner)
+    x0 = np.broadcast_to(np.asarray(kolumner[variabel], dtype=float), (n,)).copy()
+    steg = np.maximum(np.abs(x0), 1.0)
+
+    def r(x):
+        return np.broadcast_to(_residual(calc, _med_varde(kolumner, variabel, x), mal, malvarde, ar, ranta, antaganden), (n,))
+
+    # Sluten form: r(x) = r0 + k * (x - x0) om tre punkter ligger på en linje
+    r0, r1, r2 = r(x0), r(x0 + steg), r(x0 + 2.5 * steg)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        k = (r1 - r0) / steg
+        skala = np.abs(r0) + np.abs(r1) + np.abs(r2)
+        linjar = np.isfinite(skala) & (np.abs(r0 + 2.5 * steg * k - r2) <= 1e-9 * np.maximum(skala, 1.0))
+        varde = np.where(k != 0, x0 - r0 / k, np.where(r0 == 0, x0, np.nan))
+    varde = np.where(linjar, varde, np.nan)
+
+    # Bisektion för rader där residualen inte är affin
+    bisekt = ~linjar
+    if bisekt.any():
+        lo = np.full(n, float(lagst))
+        hi = np.full(n, float(hogst)) if hogst is not None and np.isfinite(hogst) else np.maximum(10 * np.abs(x0), 1.0)
+        r_lo, r_hi = r(lo), r(hi)
+        tecken_lo = np.sign(r_lo)
+        bracket = bisekt & (tecken_lo != np.sign(r_hi)) & ~np.isnan(r_lo) & ~np.isnan(r_hi)
+        aktiv = bracket.copy()
+        for _ in range(max_iter):
+            if not aktiv.any():
+                break
+            mitt = 0.5 * (lo + hi)
+            samma = np.sign(r(mitt)) == tecken_lo
+            lo = np.where(aktiv & samma, mitt, lo)
+            hi = np.where(aktiv & ~samma, mitt, hi)
+            aktiv &= (hi - lo) > tol * np.maximum(np.abs(hi), 1.0)
+        varde = np.where(bracket, 0.5 * (lo + hi), varde)
+
+    if lagst is not None:
+        varde = np.where(varde < lagst, np.nan, varde)
+    if hogst is not None:
+        varde = np.where(varde > hogst, np.nan, varde)
+
+    losta = np.where(np.isnan(varde), x0, varde)
+    uppnatt = mattvarde(calc, _med_varde(kolumner, variabel, losta), mal, ar, ranta, antaganden)
+    uppnatt = np.where(np.isnan(varde), np.nan, np.broadcast_to(uppnatt, (n,)))
+    if mal == 'payback':
+        varde = np.where(uppnatt > 0, varde, np.nan)  # Målet kräver positivt netto
+    return Malsokning(calc, variabel, mal, malvarde, varde, uppnatt, linjar)
+
+
+def los_scenario(calc, scenario, variabel, mal, malvarde, **kwargs):
+    """Målsökning för ett enda scenario (dict). Returnerar (värde, uppnått mått), NaN om målet inte går att nå."""
+    kolumner = {k: np.array([float(v)]) for k, v in kalkyl.INDATA_KLASSER[calc].from_dict(scenario).as_dict().items()}
+    resultat = los(calc, kolumner, variabel, mal, malvarde, **kwargs)
+    return float(resultat.varde[0]), float(resultat.uppnatt[0])
+
+
+def los_portfolj(calc, tabell, variabel, mal, malvarde, standard=None, **kwargs):
+    """Samma fråga för varje fastighet i en portfölj (DataFrame eller dict med kolumner)."""
+    kolumner = portfolj.kolumner_fran_tabell(calc, tabell, standard=standard)
+    return los(calc, kolumner, variabel, mal, malvarde, **kwargs)
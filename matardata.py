@@ -0,0 +1,183 @@
+"""
+Uppmätt IMD-besparing ur mätardata: strömmande inläsning av stora CSV- och Parquet-filer.
+
+Filerna har en rad per avläsning med lägenhet, tidpunkt och förbrukning (m³)
+sedan föregående avläsning. De läses i block om `block` rader, så att
+minnesåtgången beror på antalet lägenheter och perioder, inte på filens
+storlek. Varje block grupperas vektoriserat (pandas groupby) per lägenhet och
+fas (före/efter installationen) och per period, och delsummorna slås ihop
+löpande.
+
+Förbrukningen per lägenhet och fas räknas om till m³ per år utifrån den
+tid avläsningarna täcker. Skillnaden före/efter gånger vattenpriset ger den
+uppmätta besparingen per lägenhet och år, som kan ersätta det antagna
+`besparing_lgh_vatten` i IMD-kalkylen. Jämför helst lika långa perioder
+över samma årstider, eftersom förbrukningen varierar över året.
+
+    resultat = las_matardata("matare_2023_2024.csv", brytdatum="2024-01-01")
+    resultat.scenario()   # {'besparing_lgh_vatten': ...}
+
+Från kommandoraden (filer som är för stora för att laddas upp i appen):
+
+    python matardata.py matare.parquet --brytdatum 2024-01-01 -o per_lgh.csv
+"""
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+BLOCK = 1_000_000            # Rader per block
+STANDARD_PRIS_M3 = 50.0      # kr per m³ vatten inkl. avlopp och uppvärmning av varmvatten (antagande)
+STANDARD_KOLUMNER = {'lgh': 'lgh', 'tid': 'tid', 'm3': 'm3'}
+FASER = ('fore', 'efter')
+PERIODER = ('D', 'M', 'Y')   # Dag, månad, år (NumPy-enheter)
+_SEKUNDER_PER_AR = 365.0 * 86400.0
+
+
+@dataclass
+class Matarresultat:
+    """Uppmätt förbrukning och besparing per lägenhet och sammanställning per period."""
+    per_lgh: pd.DataFrame      # Index lgh: fore_m3_ar, efter_m3_ar, besparing_m3_ar, besparing_kr_ar
+    per_period: pd.DataFrame   # Kolumner period, fas, m3, antal_lgh
+    antal_rader: int
+    pris_m3: float
+
+    @property
+    def jamforda(self):
+        """Lägenheter med mätvärden både före och efter."""
+        return self.per_lgh.dropna(subset=['besparing_kr_ar'])
+
+    @property
+    def besparing_lgh_vatten(self):
+        """Medelbesparing i kr per lägenhet och år, över lägenheter med mätvärden både före och efter."""
+        jamforda = self.jamforda
+        return float(jamforda['besparing_kr_ar'].mean()) if len(jamforda) else 0.0
+
+    def scenario(self):
+        """Uppmätta värden för IMD-kalkylen."""
+        return {'besparing_lgh_vatten': self.besparing_lgh_vatten}
+
+
+def _filtyp(sokvag, filtyp):
+    if filtyp is None:
+        namn = sokvag if isinstance(sokvag, str) else getattr(sokvag, 'name', '')
+        filtyp = os.path.splitext(namn)[1].lstrip('.').lower()
+    if filtyp not in ('csv', 'parquet'):
+        raise ValueError(f"okänd filtyp: {filtyp!r} (csv eller parquet)")
+    return filtyp
+
+
+def las_block(kalla, kolumner=None, block=BLOCK, filtyp=None):
+    """Ger filens rader som DataFrames om högst `block` rader med kolumnerna lgh, tid och m3."""
+    kolumner = {**STANDARD_KOLUMNER, **(kolumner or {})}
+    namn_i_fil = {kolumner[k]: k for k in STANDARD_KOLUMNER}
+    if _filtyp(kalla, filtyp) == 'csv':
+        delar = pd.read_csv(kalla, usecols=list(namn_i_fil), dtype={kolumner['lgh']: str, kolumner['m3']: float},
+                            chunksize=block)
+    else:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet-filer kräver paketet pyarrow (pip install pyarrow)") from None
+        delar = (b.to_pandas() for b in pq.ParquetFile(kalla).iter_batches(batch_size=block, columns=list(namn_i_fil)))
+    for del_df in delar:
+        del_df = del_df.rename(columns=namn_i_fil)
+        del_df['tid'] = pd.to_datetime(del_df['tid'])
+        yield del_df
+
+
+def _lgh_koder(lgh, index):
+    """Globala heltalskoder för lägenheterna i blocket; `index` (etikett -> kod) växer med nya lägenheter."""
+    koder, unika = pd.factorize(lgh)
+    globala = np.fromiter((index.setdefault(str(u), len(index)) for u in unika), dtype=np.int64, count=len(unika))
+    return globala[koder]
+
+
+def _sla_ihop(delar, summor):
+    """Slår ihop delaggregat med samma nyckel (summor summeras, första/sista tas som min/max)."""
+    alla = pd.concat(delar)
+    agg = {k: 'sum' for k in summor}
+    if 'forsta' in alla:
+        agg.update(forsta='min', sista='max')
+    return alla.groupby(level=list(range(alla.index.nlevels))).agg(agg)
+
+
+def las_matardata(kalla, brytdatum, kolumner=None, pris_m3=STANDARD_PRIS_M3, period='M', block=BLOCK, filtyp=None):
+    """
+    Läser mätardata i block och beräknar förbrukning före och efter `brytdatum`
+    (installationen av IMD) per lägenhet, samt summor per `period` (se
+    PERIODER). `kolumner` mappar lgh/tid/m3 till kolumnnamnen i filen om de
+    skiljer sig.
+    """
+    if period not in PERIODER:
+        raise ValueError(f"okänd period: {period!r} ({', '.join(PERIODER)})")
+    brytdatum = np.datetime64(pd.Timestamp(brytdatum).to_datetime64(), 's')
+    index = {}
+    per_lgh = per_period = None
+    antal_rader = 0
+    for del_df in las_block(kalla, kolumner, block, filtyp):
+        antal_rader += len(del_df)
+        lgh = _lgh_koder(del_df['lgh'].to_numpy(), index)
+        tid = del_df['tid'].to_numpy().astype('datetime64[s]')
+        fas = (tid >= brytdatum).astype(np.int64)
+        m3 = del_df['m3'].to_numpy(dtype=float)
+        # Heltalsnycklar (lägenhet, fas) resp. (lägenhet, period, fas) grupperas snabbare än text
+        lgh_del = pd.DataFrame({'m3': m3, 'antal': 1, 'forsta': tid.astype(np.int64), 'sista': tid.astype(np.int64)},
+                               index=lgh * 2 + fas)
+        period_nr = tid.astype(f'datetime64[{period}]').astype(np.int64)
+        period_del = pd.DataFrame({'m3': m3}, index=pd.MultiIndex.from_arrays([lgh, period_nr, fas]))
+        # Delaggregaten hålls hopslagna, så minnet växer med antalet nycklar och inte med antalet block
+        per_lgh = _sla_ihop([lgh_del] if per_lgh is None else [per_lgh, lgh_del], ('m3', 'antal'))
+        per_period = _sla_ihop([period_del] if per_period is None else [per_period, period_del], ('m3',))
+    if not antal_rader:
+        raise ValueError("filen innehåller inga avläsningar")
+
+    etiketter = np.array(list(index), dtype=object)
+    # n avläsningar med jämnt intervall spänner över (n - 1) intervall men täcker n
+    tackning_s = (per_lgh['sista'] - per_lgh['forsta']) * per_lgh['antal'] / (per_lgh['antal'] - 1).where(per_lgh['antal'] > 1)
+    m3_ar = (per_lgh['m3'] / tackning_s * _SEKUNDER_PER_AR).to_numpy()
+    nycklar = per_lgh.index.to_numpy()
+    per_fas = np.full((len(etiketter), len(FASER)), np.nan)
+    per_fas[nycklar // 2, nycklar % 2] = m3_ar
+    tabell = pd.DataFrame(per_fas, index=pd.Index(etiketter, name='lgh'), columns=[f"{fas}_m3_ar" for fas in FASER])
+    tabell['besparing_m3_ar'] = tabell['fore_m3_ar'] - tabell['efter_m3_ar']
+    tabell['besparing_kr_ar'] = tabell['besparing_m3_ar'] * pris_m3
+
+    lgh_nr, period_nr, fas = (per_period.index.get_level_values(i).to_numpy() for i in range(3))
+    perioder = pd.DataFrame({
+        'period': np.asarray(period_nr, dtype=f'datetime64[{period}]'),
+        'fas': np.asarray(FASER)[fas],
+        'm3': per_period['m3'].to_numpy(),
+        'lgh': lgh_nr,
+    }).groupby(['period', 'fas']).agg(m3=('m3', 'sum'), antal_lgh=('lgh', 'nunique')).reset_index()
+    return Matarresultat(per_lgh=tabell, per_period=perioder, antal_rader=antal_rader, pris_m3=float(pris_m3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Uppmätt IMD-besparing per lägenhet ur mätardata (CSV eller Parquet).")
+    parser.add_argument('indata', help="CSV- eller Parquet-fil med en rad per avläsning")
+    parser.add_argument('--brytdatum', required=True, help="Datum då IMD installerades (ÅÅÅÅ-MM-DD)")
+    parser.add_argument('--pris-m3', type=float, default=STANDARD_PRIS_M3, help="Vattenpris i kr per m³")
+    parser.add_argument('--period', choices=PERIODER, default='M', help="Period för sammanställningen")
+    parser.add_argument('--block', type=int, default=BLOCK, help="Rader per block")
+    for nyckel, standard in STANDARD_KOLUMNER.items():
+        parser.add_argument(f'--kolumn-{nyckel}', default=standard, help=f"Kolumnnamn för {nyckel} i filen")
+    parser.add_argument('-o', '--utdata', help="CSV-fil för resultatet per lägenhet")
+    args = parser.parse_args(argv)
+
+    kolumner = {nyckel: getattr(args, f'kolumn_{nyckel}') for nyckel in STANDARD_KOLUMNER}
+    resultat = las_matardata(args.indata, args.brytdatum, kolumner, args.pris_m3, args.period, args.block)
+    if args.utdata:
+        resultat.per_lgh.to_csv(args.utdata)
+    print(f"{resultat.antal_rader} avläsningar, {len(resultat.jamforda)} av {len(resultat.per_lgh)} lägenheter "
+          f"har mätvärden både före och efter.", file=sys.stderr)
+    print(json.dumps(resultat.scenario()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
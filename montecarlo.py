@@ -0,0 +1,175 @@
+"""
+Monte Carlo-simulering av osäkra indata (t.ex. besparing_temp, pris_kwh, frekvens_skada).
+
+Varje osäker nyckel får en Fordelning. Dragningarna görs i block med NumPy och
+resultaten ackumuleras i histogram och räknare, så minnesåtgången beror på
+blockstorleken och inte på det totala antalet dragningar. Blocken är
+oberoende och kan köras i en processpool (parallell.py).
+
+Kassaflödet per dragning byggs år för år med kassaflode.arsfloden över vald
+kalkylperiod och med samma antaganden (prisökning, batteri- och sensorbyten)
+som kalkylens kassaflödesgraf, så att osäkerhetsbandet och sannolikheten för
+break-even stämmer med grafen. Payback-percentilerna avser kalkylens payback
+(investering / årligt netto).
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import kalkyl
+import kassaflode
+import parallell
+import portfolj
+
+FORDELNINGSTYPER = ("triangel", "likformig", "normal", "lognormal")
+
+PERCENTILER = (10, 50, 90)
+
+
+@dataclass(frozen=True)
+class Fordelning:
+    """
+    En sannolikhetsfördelning för en indatanyckel.
+
+    triangel: (min, typvärde, max), likformig: (min, max),
+    normal: (medel, std), lognormal: (medel, std) på ursprunglig skala.
+    `golv` klipper dragningar nedåt (standard 0, inga negativa priser/andelar).
+    """
+    typ: str
+    parametrar: tuple
+    golv: float = 0.0
+
+    def __post_init__(self):
+        if self.typ not in FORDELNINGSTYPER:
+            raise ValueError(f"Okänd fördelning: {self.typ!r} (giltiga: {', '.join(FORDELNINGSTYPER)})")
+
+    @classmethod
+    def kring(cls, typ, varde, spridning_pct):
+        """Fördelning runt ett punktvärde med ±spridning_pct. För normal motsvarar ±spridningen ca 2 std."""
+        d = abs(varde) * spridning_pct / 100
+        if typ == "triangel":
+            return cls(typ, (varde - d, varde, varde + d))
+        if typ == "likformig":
+            return cls(typ, (varde - d, varde + d))
+        return cls(typ, (varde, d / 2))
+
+    def dra(self, rng, n):
+        p = self.parametrar
+        if self.typ == "triangel":
+            lo, mode, hi = p
+            varden = rng.triangular(lo, mode, hi, n) if hi > lo else np.full(n, float(mode))
+        elif self.typ == "likformig":
+            varden = rng.uniform(p[0], p[1], n)
+        elif self.typ == "normal":
+            varden = rng.normal(p[0], p[1], n)
+        else:
+            medel, std = p
+            if medel <= 0:
+                return np.zeros(n)
+            sigma2 = np.log1p((std / medel) ** 2)
+            varden = rng.lognormal(np.log(medel) - sigma2 / 2, np.sqrt(sigma2), n)
+        return np.maximum(varden, self.golv) if self.golv is not None else varden
+
+
+@dataclass
+class MonteCarloResultat:
+    antal: int
+    seed: object
+    ar: int
+    payback_percentiler: dict
+    sannolikhet_break_even: np.ndarray   # Andel dragningar med ack. kassaflöde >= 0, per år 1..ar
+    andel_aldrig: float                  # Andel dragningar med netto <= 0
+    netto_medel: float
+    netto_std: float
+    urval_kassaflode: np.ndarray = field(repr=False)   # Ackumulerat kassaflöde för urvalet, form (urval, ar)
+
+    def kassaflode_percentiler(self, percentiler=PERCENTILER):
+        """Percentiler för ackumulerat kassaflöde per år, beräknade på det sparade urvalet."""
+        return {p: np.percentile(self.urval_kassaflode, p, axis=0) for p in percentiler}
+
+
+def _percentil_fran_histogram(antal_per_bin, kanter, antal_totalt, p):
+    """Percentil ur ett histogram. Dragningar utanför histogrammet (aldrig lönsamma) räknas som oändliga."""
+    mal = int(np.ceil(p / 100 * antal_totalt))
+    kumulativ = np.cumsum(antal_per_bin)
+    if mal == 0 or kumulativ.size == 0 or kumulativ[-1] < mal:
+        return float('inf') if mal else 0.0
+    return round(float(kanter[np.searchsorted(kumulativ, mal) + 1]), 6)
+
+
+def _simulera_block(calc, fasta, fordelningar, m, seed, kanter, ar, antaganden, ta_urval):
+    """Ett block med `m` dragningar och egen slumpström. Returnerar räknare och summor som kan slås ihop."""
+    rng = np.random.default_rng(seed)
+    kolumner = dict(fasta)
+    for nyckel, fordelning in fordelningar.items():
+        kolumner[nyckel] = fordelning.dra(rng, m)
+
+    varden = kalkyl.FORMLER[calc](kolumner)
+    total_initial = np.broadcast_to(np.asarray(varden['total_initial'], dtype=float), (m,))
+    netto = np.broadcast_to(np.asarray(varden['netto'], dtype=float), (m,))
+    payback = portfolj.payback_vektor(total_initial, netto)
+    lonsam = netto > 0
+    floden = np.broadcast_to(kassaflode.arsfloden(calc, kolumner, ar, antaganden, varden), (m, ar + 1))
+    ackumulerat = kassaflode.ackumulerat(floden)
+    return {
+        'antal': m,
+        'antal_per_bin': np.histogram(payback[lonsam], bins=kanter)[0].astype(np.int64),
+        'aldrig': m - int(np.count_nonzero(lonsam)),
+        'break_even': np.count_nonzero(ackumulerat >= 0, axis=0),
+        'netto_summa': float(netto.sum()),
+        'netto_kvadratsumma': float(np.square(netto).sum()),
+        'urval_kassaflode': ackumulerat[:ta_urval].copy(),
+    }
+
+
+def _sla_ihop(a, b):
+    summa = {k: a[k] + b[k] for k in ('antal', 'antal_per_bin', 'aldrig', 'break_even', 'netto_summa', 'netto_kvadratsumma')}
+    summa['urval_kassaflode'] = np.concatenate([a['urval_kassaflode'], b['urval_kassaflode']])
+    return summa
+
+
+def simulera(calc, scenario, fordelningar, antal=1_000_000, seed=None, block=100_000,
+             ar=portfolj.AR, antaganden=None, max_payback=50.0, upplosning=0.01, urval=10_000,
+             processer=1, vid_delresultat=None, avbryt=None):
+    """
+    Kör `antal` dragningar för kalkylen `calc`.
+
+    `scenario` ger punktvärden (saknade nycklar får standardvärden) och
+    `fordelningar` mappar nyckel -> Fordelning. Payback-percentilerna har
+    upplösningen `upplosning` år upp till `max_payback`; längre payback
+    räknas som att investeringen inte går jämnt ut. Kassaflödet byggs över
+    `ar` år med `antaganden` (kassaflode.Antaganden, standard: inga).
+
+    Varje block får en egen slumpström från `seed`, så resultatet är detsamma
+    oavsett om blocken körs här eller i `processer` > 1 processer (parallell.py).
+    `vid_delresultat(klara, totalt, delsummor)` anropas efter varje block och
+    `avbryt()` kan stoppa körningen (parallell.Avbruten).
+    """
+    okanda = set(fordelningar) - set(kalkyl.SCENARIO_NYCKLAR[calc])
+    if okanda:
+        raise ValueError(f"Nycklar som inte hör till {calc}-kalkylen: {', '.join(sorted(okanda))}")
+
+    fasta = kalkyl.INDATA_KLASSER[calc].from_dict(scenario).as_dict()
+    kanter = np.arange(0.0, max_payback + upplosning, upplosning)
+    starter = range(0, antal, block)
+    fron = np.random.SeedSequence(seed).spawn(len(starter))
+    uppgifter = [
+        (calc, fasta, fordelningar, min(block, antal - start), fro, kanter, ar, antaganden, max(min(urval - start, block), 0))
+        for start, fro in zip(starter, fron)
+    ]
+
+    summa = parallell.kor(_simulera_block, uppgifter, _sla_ihop, processer, vid_delresultat, avbryt)
+
+    medel = summa['netto_summa'] / antal
+    varians = max(summa['netto_kvadratsumma'] / antal - medel ** 2, 0.0)
+    return MonteCarloResultat(
+        antal=antal,
+        seed=seed,
+        ar=ar,
+        payback_percentiler={p: _percentil_fran_histogram(summa['antal_per_bin'], kanter, antal, p) for p in PERCENTILER},
+        sannolikhet_break_even=summa['break_even'] / antal,
+        andel_aldrig=summa['aldrig'] / antal,
+        netto_medel=medel,
+        netto_std=float(np.sqrt(varians)),
+        urval_kassaflode=summa['urval_kassaflode'],
+    )
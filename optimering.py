@@ -0,0 +1,198 @@
+"""
+Budgetoptimering: vilka fastigheter ska få vilken lösning inom en investeringsbudget?
+
+Varje fastighet har ett antal alternativ (ingen lösning, temp, imd, skada och
+om så önskas kombinationer av dem) med investering (total_initial) och NPV
+från portfolj.berakna_portfolj. Att välja högst ett alternativ per fastighet
+så att summa NPV maximeras inom budgeten är ett knapsackproblem med
+flervalsgrupper (MCKP).
+
+Lösningen följer den klassiska LP-relaxationen: för varje fastighet tas den
+övre konvexa höljet av (investering, NPV) fram, höljets steg sorteras efter
+NPV per investerad krona och tas girigt. Det första steget som inte får plats
+ger en övre gräns (LP-optimum), så att optimalitetsgapet kan redovisas. Sedan
+fylls resterande budget med steg och uppgraderingar som fortfarande får plats.
+"""
+import itertools
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+import finans
+import kalkyl
+import portfolj
+
+INGEN = 'ingen'
+
+
+@dataclass
+class Optimering:
+    """Valt alternativ per fastighet och nyckeltal för lösningen."""
+    alternativ: tuple       # Namn på alternativen, index 0 är INGEN
+    val: np.ndarray         # Index i `alternativ` per fastighet
+    capex: np.ndarray       # Investering per fastighet och alternativ, form (fastigheter, alternativ)
+    npv: np.ndarray         # NPV per fastighet och alternativ, samma form
+    budget: float
+    summa_capex: float
+    summa_npv: float
+    ovre_grans: float       # LP-relaxationens optimum, ingen lösning kan vara bättre
+    tid_ms: float
+
+    @property
+    def gap(self):
+        """Relativt optimalitetsgap mot LP-gränsen (0 = bevisat optimalt)."""
+        return (self.ovre_grans - self.summa_npv) / self.ovre_grans if self.ovre_grans > 0 else 0.0
+
+    def valda(self):
+        """Namnet på valt alternativ per fastighet."""
+        return np.asarray(self.alternativ, dtype=object)[self.val]
+
+    def antal_per_alternativ(self):
+        antal = np.bincount(self.val, minlength=len(self.alternativ))
+        return {namn: int(a) for namn, a in zip(self.alternativ, antal)}
+
+
+def alternativ_matris(resultat, calcs=kalkyl.CALC_KEY_LIST, kombinationer=True):
+    """
+    Investering och NPV per fastighet och alternativ ur ett PortfoljResultat.
+    Kombinationer summerar kalkylerna (varje lösning har sin egen plattformsavgift).
+    """
+    grupper = [()]
+    for antal in range(1, (len(calcs) if kombinationer else 1) + 1):
+        grupper.extend(itertools.combinations(calcs, antal))
+    capex = np.zeros((resultat.n, len(grupper)))
+    npv = np.zeros((resultat.n, len(grupper)))
+    for j, grupp in enumerate(grupper):
+        for calc in grupp:
+            capex[:, j] += resultat.resultat[calc]['total_initial']
+            npv[:, j] += resultat.resultat[calc]['npv']
+    namn = tuple('+'.join(g) if g else INGEN for g in grupper)
+    return namn, capex, npv
+
+
+def _holje(capex, npv):
+    """
+    Stegen längs varje fastighets övre konvexa hölje, från (0, 0) och så länge
+    lutningen är positiv. Returnerar arrayer (fastighet, nivå, från, till, dcapex, dnpv).
+    """
+    n, m = capex.shape
+    rader = np.arange(n)
+    nu = np.zeros(n, dtype=int)  # Alternativ 0 är INGEN med (0, 0)
+    steg = []
+    for niva in range(m):
+        c0 = capex[rader, nu][:, None]
+        v0 = npv[rader, nu][:, None]
+        dc = capex - c0
+        dv = npv - v0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lutning = np.where(dc > 0, dv / dc, -np.inf)
+        # Största lutning; vid lika lutning det dyraste alternativet (hoppar över mellanpunkter på linjen)
+        basta = np.max(lutning, axis=1)
+        kandidat = (lutning == basta[:, None]) & np.isfinite(lutning)
+        nasta = np.where(kandidat, capex, -np.inf).argmax(axis=1)
+        fortsatt = basta > 0
+        if not fortsatt.any():
+            break
+        f = rader[fortsatt]
+        steg.append((f, np.full(f.size, niva), nu[f], nasta[f],
+                     capex[f, nasta[f]] - capex[f, nu[f]], npv[f, nasta[f]] - npv[f, nu[f]]))
+        nu = np.where(fortsatt, nasta, nu)
+    if not steg:
+        tom = np.zeros(0, dtype=int)
+        return tom, tom, tom, tom, np.zeros(0), np.zeros(0)
+    return tuple(np.concatenate(delar) for delar in zip(*steg))
+
+
+def optimera(capex, npv, budget, alternativ=None):
+    """
+    Väljer högst ett alternativ per fastighet (rad) så att summa NPV maximeras
+    med summa investering <= budget. Kolumn 0 ska vara "ingen lösning" (0, 0).
+    """
+    start = time.perf_counter()
+    capex = np.asarray(capex, dtype=float)
+    npv = np.asarray(npv, dtype=float)
+    n, m = capex.shape
+    alternativ = tuple(alternativ) if alternativ is not None else tuple(range(m))
+
+    fastighet, niva, fran, till, dcapex, dnpv = _holje(capex, npv)
+    ordning = np.lexsort((niva, -dnpv / dcapex))
+    fastighet, niva, till, dcapex, dnpv = fastighet[ordning], niva[ordning], till[ordning], dcapex[ordning], dnpv[ordning]
+
+    # Girigt prefix av stegen; första steget som inte får plats ger LP-gränsen
+    kumulativ = np.cumsum(dcapex)
+    k = int(np.searchsorted(kumulativ, budget, side='right'))
+    kvar = budget - (float(kumulativ[k - 1]) if k else 0.0)
+    ovre_grans = float(dnpv[:k].sum()) + (dnpv[k] * kvar / dcapex[k] if k < fastighet.size else 0.0)
+
+    val = np.zeros(n, dtype=int)
+    nasta_niva = np.zeros(n, dtype=int)
+    np.maximum.at(nasta_niva, fastighet[:k], niva[:k] + 1)
+    # Stegen tas i nivåordning per fastighet, så sista tagna steget är fastighetens val
+    val[fastighet[:k]] = till[:k]
+
+    # Fyll på med senare steg som fortfarande får plats (i effektivitetsordning)
+    for i in range(k, fastighet.size):
+        if dcapex[i] <= kvar and nasta_niva[fastighet[i]] == niva[i]:
+            kvar -= dcapex[i]
+            val[fastighet[i]] = till[i]
+            nasta_niva[fastighet[i]] += 1
+
+    val, kvar = _uppgradera(capex, npv, val, kvar)
+
+    # Skydd mot girighetens sämsta fall (ett stort, lönsamt alternativ som inte hann med):
+    # jämför med det bästa enskilda alternativet som ryms i budgeten, fyllt på samma sätt
+    rader = np.arange(n)
+    ryms = np.where(capex <= budget, npv, -np.inf)
+    f, j = np.unravel_index(np.argmax(ryms), ryms.shape)
+    if ryms[f, j] > npv[rader, val].sum():
+        ensam = np.zeros(n, dtype=int)
+        ensam[f] = j
+        ensam, _ = _uppgradera(capex, npv, ensam, budget - capex[f, j])
+        if npv[rader, ensam].sum() > npv[rader, val].sum():
+            val = ensam
+
+    summa_npv = float(npv[rader, val].sum())
+    return Optimering(
+        alternativ=alternativ,
+        val=val,
+        capex=capex,
+        npv=npv,
+        budget=float(budget),
+        summa_capex=float(capex[rader, val].sum()),
+        summa_npv=summa_npv,
+        ovre_grans=max(float(ovre_grans), summa_npv),
+        tid_ms=(time.perf_counter() - start) * 1000,
+    )
+
+
+def _uppgradera(capex, npv, val, kvar):
+    """Byter upp fastigheter till det bästa alternativ som ryms i resterande budget, störst vinst först."""
+    n, m = capex.shape
+    rader = np.arange(n)
+    val = val.copy()
+    for _ in range(m):
+        extra = capex - capex[rader, val][:, None]
+        vinst = np.where(extra <= kvar, npv - npv[rader, val][:, None], 0.0)
+        basta = vinst.argmax(axis=1)
+        basta_vinst = vinst[rader, basta]
+        kandidater = np.flatnonzero(basta_vinst > 0)
+        if kandidater.size == 0:
+            break
+        for f in kandidater[np.argsort(-basta_vinst[kandidater])]:
+            if extra[f, basta[f]] <= kvar:
+                kvar -= extra[f, basta[f]]
+                val[f] = basta[f]
+    return val, kvar
+
+
+def optimera_portfolj(tabell, budget, calcs=kalkyl.CALC_KEY_LIST, kombinationer=True, ar=portfolj.AR, standard=None,
+                      ranta=finans.STANDARD_RANTA, antaganden=None, resultat=None):
+    """
+    Beräknar alla fastigheter × lösningar i ett svep och väljer inom budgeten.
+    Ett redan beräknat PortfoljResultat kan skickas med som `resultat`.
+    """
+    if resultat is None:
+        resultat = portfolj.berakna_portfolj(tabell, calcs, ar, standard, ranta, antaganden)
+    alternativ, capex, npv = alternativ_matris(resultat, calcs, kombinationer)
+    return optimera(capex, npv, budget, alternativ)
@@ -0,0 +1,299 @@
+"""
+Parallell körning av stora portfölj- och Monte Carlo-beräkningar i en processpool.
+
+Beräkningarna är CPU-bundna NumPy-svep, så i Streamlit-processen låser de en
+kärna och blockerar sessionen. Här delas arbetet i block som körs i en
+processpool som lever lika länge som processen. Stora indata-arrayer läggs i
+delat minne (multiprocessing.shared_memory) och blocken skriver sina rader
+direkt i delade utdata-arrayer, så att bara små delaggregat skickas tillbaka.
+
+Delaggregaten slås ihop i den ordning blocken blir klara och skickas till
+`vid_delresultat` (t.ex. en förloppsindikator). Slutresultatet slås ihop i
+blockordning, så det är detsamma oavsett antal processer. Om körningen
+avbryts (`avbryt()` blir sant, eller Streamlit avbryter skriptet vid en ny
+omkörning) stryks block som inte har startat.
+
+Antal processer styrs med IOT_PROCESSER (standard: antal kärnor).
+"""
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import types
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import finans
+import kalkyl
+import portfolj
+
+BLOCK_PORTFOLJ = 25_000  # Fastigheter per block
+
+_pool = None
+_pool_storlek = 0
+_pool_las = threading.Lock()
+
+
+class Avbruten(Exception):
+    """Körningen avbröts innan alla block var klara."""
+
+    def __init__(self, klara, totalt):
+        super().__init__(f"avbruten efter {klara} av {totalt} block")
+        self.klara = klara
+        self.totalt = totalt
+
+
+def antal_processer():
+    """Antal processer i poolen: IOT_PROCESSER eller antalet kärnor."""
+    return max(int(os.environ.get('IOT_PROCESSER') or os.cpu_count() or 1), 1)
+
+
+@contextmanager
+def _utan_huvudskript():
+    """
+    Streamlit kör app.py som modulen __main__, och spawn/forkserver importerar
+    __main__ i varje ny process. Medan poolen startar byts den mot en tom modul
+    så att processerna inte kör om hela appen.
+    """
+    huvud = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = huvud
+
+
+def starta_pool(processer):
+    """Ny processpool som går att starta inifrån Streamlit (se även jobb.py)."""
+    # forkserver/spawn: Streamlit-processen har många trådar och ska inte forkas
+    metod = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with _utan_huvudskript():
+        return multiprocessing.get_context(metod).Pool(processer)
+
+
+def hamta_pool(processer=None):
+    """Processgemensam pool. Alla processer startas direkt och poolen skapas om bara om antalet ändras."""
+    global _pool, _pool_storlek
+    processer = processer or antal_processer()
+    with _pool_las:
+        if _pool is None or _pool_storlek != processer:
+            if _pool is not None:
+                _pool.terminate()
+            _pool = starta_pool(processer)
+            _pool_storlek = processer
+        return _pool
+
+
+def stang_pool():
+    global _pool
+    with _pool_las:
+        if _pool is not None:
+            _pool.close()
+            _pool.join()
+            _pool = None
+
+
+class DeladeArrayer:
+    """
+    NumPy-arrayer i delat minne, skapade i huvudprocessen. `beskrivning` är
+    liten och kan skickas till workers, som kopplar upp sig med `bifoga`.
+    Använd som context manager så att minnet alltid frigörs.
+    """
+
+    def __init__(self, arrayer=None, former=None):
+        """`arrayer`: namn -> array som kopieras in. `former`: namn -> (form, dtype) för nollställda utdata."""
+        self._block = []
+        self.arrayer = {}
+        self.beskrivning = {}
+        delar = [(namn, np.ascontiguousarray(a), None, None) for namn, a in (arrayer or {}).items()]
+        delar += [(namn, None, tuple(form), np.dtype(dtype)) for namn, (form, dtype) in (former or {}).items()]
+        try:
+            for namn, data, form, dtype in delar:
+                if data is not None:
+                    form, dtype = data.shape, data.dtype
+                storlek = int(np.prod(form, dtype=np.int64)) * dtype.itemsize
+                shm = shared_memory.SharedMemory(create=True, size=max(storlek, 1))
+                self._block.append(shm)
+                vy = np.ndarray(form, dtype, buffer=shm.buf)
+                if data is not None:
+                    vy[...] = data
+                else:
+                    vy.fill(0)
+                self.arrayer[namn] = vy
+                self.beskrivning[namn] = (shm.name, form, dtype.str)
+        except BaseException:
+            self.stang()
+            raise
+
+    def stang(self):
+        self.arrayer.clear()
+        for shm in self._block:
+            shm.close()
+            shm.unlink()
+        self._block = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.stang()
+
+
+def bifoga(beskrivning):
+    """I en worker: vyer mot arrayerna i `beskrivning`. Returnerar (arrayer, block); stäng blocken efteråt."""
+    arrayer, block = {}, []
+    for namn, (shm_namn, form, dtype) in beskrivning.items():
+        shm = shared_memory.SharedMemory(name=shm_namn)  # Workers delar huvudprocessens resource_tracker
+        block.append(shm)
+        arrayer[namn] = np.ndarray(form, np.dtype(dtype), buffer=shm.buf)
+    return arrayer, block
+
+
+def _stang_block(arrayer, block):
+    arrayer.clear()
+    for shm in block:
+        shm.close()
+
+
+def kor(funktion, uppgifter, sla_ihop, processer=None, vid_delresultat=None, avbryt=None):
+    """
+    Kör `funktion(*uppgift)` för varje uppgift i poolen och slår ihop
+    delresultaten med `sla_ihop(a, b)`.
+
+    Högst två block per process skickas i taget, så att en avbruten körning
+    bara behöver vänta in dem. `vid_delresultat(klara, totalt, aggregat)`
+    anropas efter varje klart block med det hittills ihopslagna resultatet.
+    Om `avbryt()` blir sant kastas Avbruten. Slutresultatet slås ihop i
+    uppgifternas ordning.
+
+    Med `processer=1` körs blocken i den egna processen, utan pool (så kan
+    även en worker, t.ex. ett bakgrundsjobb, räkna blockvis).
+    """
+    uppgifter = list(uppgifter)
+    if not uppgifter:
+        raise ValueError("inga uppgifter att köra")
+    processer = processer or antal_processer()
+    if processer == 1:
+        resultat = None
+        for klara, uppgift in enumerate(uppgifter, start=1):
+            del_resultat = funktion(*uppgift)
+            resultat = del_resultat if resultat is None else sla_ihop(resultat, del_resultat)
+            if vid_delresultat is not None:
+                vid_delresultat(klara, len(uppgifter), resultat)
+            if avbryt is not None and klara < len(uppgifter) and avbryt():
+                raise Avbruten(klara, len(uppgifter))
+        return resultat
+    pool = hamta_pool(processer)
+    klara_ko = queue.Queue()
+    delar = [None] * len(uppgifter)
+    nasta = pagaende = klara = 0
+    lopande = None
+
+    def skicka():
+        nonlocal nasta, pagaende
+        pool.apply_async(funktion, uppgifter[nasta],
+                         callback=lambda resultat, i=nasta: klara_ko.put((i, resultat, None)),
+                         error_callback=lambda fel, i=nasta: klara_ko.put((i, None, fel)))
+        nasta += 1
+        pagaende += 1
+
+    try:
+        while nasta < len(uppgifter) and pagaende < 2 * processer:
+            skicka()
+        while pagaende:
+            i, del_resultat, fel = klara_ko.get()
+            pagaende -= 1
+            if fel is not None:
+                raise fel
+            delar[i] = del_resultat
+            klara += 1
+            lopande = del_resultat if lopande is None else sla_ihop(lopande, del_resultat)
+            if vid_delresultat is not None:
+                vid_delresultat(klara, len(uppgifter), lopande)
+            if avbryt is not None and klara < len(uppgifter) and avbryt():
+                raise Avbruten(klara, len(uppgifter))
+            if nasta < len(uppgifter):
+                skicka()
+    finally:
+        # Block som redan körs måste bli klara innan delat minne frigörs
+        while pagaende:
+            klara_ko.get()
+            pagaende -= 1
+
+    resultat = delar[0]
+    for del_resultat in delar[1:]:
+        resultat = sla_ihop(resultat, del_resultat)
+    return resultat
+
+
+# --- PORTFÖLJ ---
+
+def _portfolj_block(indata, utdata, start, stopp, calcs, ar, standard, ranta, antaganden, med_irr):
+    """Worker: beräknar raderna start:stopp och skriver dem i utdata. Returnerar delaggregat per kalkyl."""
+    inn, inn_block = bifoga(indata)
+    ut, ut_block = bifoga(utdata)
+    try:
+        tabell = {kolumn: inn[kolumn][start:stopp] for kolumn in inn}
+        resultat = portfolj.berakna_portfolj(tabell, calcs, ar, standard, ranta, antaganden, med_irr)
+        delaggregat = {}
+        for calc in calcs:
+            for nyckel, varden in resultat.resultat[calc].items():
+                ut[f"{calc}/{nyckel}"][start:stopp] = varden
+            ut[f"{calc}/kassaflode"][start:stopp] = resultat.kassaflode[calc]
+            agg = resultat.aggregat[calc]
+            delaggregat[calc] = {k: agg[k] for k in _SUMMERADE}
+        return delaggregat
+    finally:
+        _stang_block(inn, inn_block)
+        _stang_block(ut, ut_block)
+
+
+_SUMMERADE = ('antal_fastigheter', 'antal_lonsamma', 'summa_total_initial', 'summa_netto', 'summa_npv', 'arsfloden_portfolj')
+
+
+def _sla_ihop_portfolj(a, b):
+    return {calc: {k: a[calc][k] + b[calc][k] for k in _SUMMERADE} for calc in a}
+
+
+def berakna_portfolj(tabell, calcs=kalkyl.CALC_KEY_LIST, ar=portfolj.AR, standard=None, ranta=finans.STANDARD_RANTA,
+                     antaganden=None, med_irr=False, processer=None, block=BLOCK_PORTFOLJ, vid_delresultat=None, avbryt=None):
+    """
+    Som portfolj.berakna_portfolj, men fastigheterna delas i block som räknas
+    i processpoolen. Ger samma PortfoljResultat. `vid_delresultat(klara, totalt,
+    delaggregat)` får summorna per kalkyl för de block som hittills är klara.
+    """
+    n = portfolj.antal_rader(tabell)
+    if n == 0:
+        return portfolj.berakna_portfolj(tabell, calcs, ar, standard, ranta, antaganden, med_irr)
+    kolumner = {}
+    for kolumn in tabell:
+        if kolumn in kalkyl.STANDARDVARDEN:
+            kolumner[kolumn] = np.asarray(tabell[kolumn], dtype=float).reshape(n)
+
+    # En rad räknas direkt för att få fram nycklarna och formerna på utdata
+    prov = portfolj.berakna_portfolj({k: v[:1] for k, v in kolumner.items()}, calcs, ar, standard, ranta, antaganden, med_irr)
+    former = {}
+    for calc in calcs:
+        for nyckel in prov.resultat[calc]:
+            former[f"{calc}/{nyckel}"] = ((n,), np.float64)
+        former[f"{calc}/kassaflode"] = ((n, ar), np.float64)
+
+    with DeladeArrayer(kolumner) as indata, DeladeArrayer(former=former) as utdata:
+        uppgifter = [(indata.beskrivning, utdata.beskrivning, start, min(start + block, n), tuple(calcs), ar,
+                      standard, ranta, antaganden, med_irr) for start in range(0, n, block)]
+        summor = kor(_portfolj_block, uppgifter, _sla_ihop_portfolj, processer, vid_delresultat, avbryt)
+
+        resultat = portfolj.PortfoljResultat(n=n)
+        for kolumn in tabell:
+            resultat.indata[kolumn] = np.asarray(tabell[kolumn]).reshape(n)
+        for calc in calcs:
+            varden = {nyckel: utdata.arrayer[f"{calc}/{nyckel}"].copy() for nyckel in prov.resultat[calc]}
+            resultat.resultat[calc] = varden
+            resultat.kassaflode[calc] = utdata.arrayer[f"{calc}/kassaflode"].copy()
+            # Summan av årsflödena räcker för aggregaten; skickas som en enda rad
+            resultat.aggregat[calc] = portfolj.aggregera(varden['total_initial'], varden['netto'], varden['payback'],
+                                                         summor[calc]['arsfloden_portfolj'][None, :], varden['npv'])
+    return resultat
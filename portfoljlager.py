@@ -0,0 +1,187 @@
+"""
+Stegvis uppdaterad portfölj: resultat per fastighet och löpande aggregat.
+
+När en fastighet ändras (t.ex. nytt antal lägenheter efter en renovering
+eller ett nytt sensorpris) räknas bara den raden om, med samma formler som
+portfolj.berakna_portfolj körda på en rad. Aggregaten (summa investering,
+summa netto, summa NPV, antal lönsamma, portföljens årsflöden och ett
+histogram över payback) uppdateras genom att radens gamla bidrag dras bort
+och det nya läggs till. En uppdatering tar därför lika lång tid oavsett hur
+många fastigheter portföljen har.
+
+Medianen för payback läses ur histogrammet och har dess upplösning
+(`upplosning` år). Löpande summor kan avvika från en ny summering med
+avrundningsfel efter många uppdateringar; `kontrollera` jämför med en full
+omräkning och `bygg_om` räknar om allt.
+
+    lager = Portfoljlager(portfolj_df)
+    lager.uppdatera(17, {'antal_lgh_main': 64})
+    lager.aggregat('temp')['summa_netto']
+"""
+import numpy as np
+
+import finans
+import kalkyl
+import kassaflode as kassaflodesmotor
+import portfolj
+
+MAX_PAYBACK = 50.0   # Längre payback räknas i histogrammets sista fack
+UPPLOSNING = 0.01    # År per fack i paybackhistogrammet
+
+
+def _berakna(calc, tabell, n, standard, ar, ranta, antaganden, med_irr):
+    """Samma steg som portfolj.berakna_portfolj för en kalkyl; returnerar resultat per rad och årsflöden."""
+    kolumner = portfolj.kolumner_fran_tabell(calc, tabell, n, standard)
+    varden = portfolj.berakna_vektor(calc, kolumner)
+    floden = kassaflodesmotor.arsfloden(calc, kolumner, ar, antaganden, varden)
+    varden.update(portfolj.berakna_finans(floden, ranta, med_irr))
+    return {k: np.broadcast_to(np.asarray(v, dtype=float), (n,)).copy() for k, v in varden.items()}, floden
+
+
+class Portfoljlager:
+    """
+    Portföljresultat som kan uppdateras en fastighet i taget. Argumenten är
+    desamma som till portfolj.berakna_portfolj; `tabell` kopieras.
+    """
+
+    def __init__(self, tabell, calcs=kalkyl.CALC_KEY_LIST, ar=portfolj.AR, standard=None, ranta=finans.STANDARD_RANTA,
+                 antaganden=None, med_irr=False, max_payback=MAX_PAYBACK, upplosning=UPPLOSNING):
+        self.n = portfolj.antal_rader(tabell)
+        self.calcs = tuple(calcs)
+        self.ar = ar
+        self.standard = kalkyl.STANDARDVARDEN if standard is None else dict(standard)
+        self.ranta = ranta
+        self.antaganden = antaganden
+        self.med_irr = med_irr
+        self.kanter = np.arange(0.0, max_payback + upplosning, upplosning)
+        self.indata = {kolumn: np.asarray(tabell[kolumn]).reshape(self.n).copy() for kolumn in tabell}
+        self.bygg_om()
+
+    def _fack(self, payback):
+        """Histogramfack för lönsamma rader (payback > 0); längre än max_payback hamnar i sista facket."""
+        return np.minimum(np.searchsorted(self.kanter, payback, side='right') - 1, len(self.kanter) - 2)
+
+    def _summera(self, calc):
+        """Aggregaten summerade från grunden ur resultaten per rad."""
+        varden, floden = self.resultat[calc], self.floden[calc]
+        lonsamma = varden['payback'] > 0
+        return {
+            'summa_total_initial': float(np.sum(varden['total_initial'])),
+            'summa_netto': float(np.sum(varden['netto'])),
+            'summa_npv': float(np.sum(varden['npv'])),
+            'antal_lonsamma': int(np.count_nonzero(lonsamma)),
+            'arsfloden': np.sum(floden, axis=0),
+            'antal_per_fack': np.bincount(self._fack(varden['payback'][lonsamma]), minlength=len(self.kanter) - 1),
+        }
+
+    def bygg_om(self):
+        """Räknar om alla fastigheter och aggregat från indata (vektoriserat, som berakna_portfolj)."""
+        self.resultat, self.floden, self.summor = {}, {}, {}
+        for calc in self.calcs:
+            self.resultat[calc], self.floden[calc] = _berakna(calc, self.indata, self.n, self.standard, self.ar, self.ranta,
+                                                              self.antaganden, self.med_irr)
+            self.summor[calc] = self._summera(calc)
+
+    def uppdatera(self, rad, varden):
+        """
+        Sätter nya indata (nyckel -> värde) för fastigheten på rad `rad` och
+        räknar om den raden och aggregaten. Nycklar som saknades i tabellen
+        läggs till med standardvärdet för övriga fastigheter.
+        """
+        if not 0 <= rad < self.n:
+            raise IndexError(f"rad {rad} finns inte (portföljen har {self.n} fastigheter)")
+        okanda = set(varden) - set(kalkyl.STANDARDVARDEN)
+        if okanda:
+            raise ValueError(f"okända indata: {', '.join(sorted(okanda))}")
+        for nyckel, varde in varden.items():
+            if nyckel not in self.indata:
+                self.indata[nyckel] = np.full(self.n, float(self.standard.get(nyckel, kalkyl.STANDARDVARDEN[nyckel])))
+            elif not np.issubdtype(self.indata[nyckel].dtype, np.floating):
+                self.indata[nyckel] = self.indata[nyckel].astype(float)
+            self.indata[nyckel][rad] = varde
+
+        en_rad = {kolumn: kolumn_varden[rad:rad + 1] for kolumn, kolumn_varden in self.indata.items()}
+        for calc in self.calcs:
+            nya, nya_floden = _berakna(calc, en_rad, 1, self.standard, self.ar, self.ranta, self.antaganden, self.med_irr)
+            self._byt_rad(calc, rad, {k: v[0] for k, v in nya.items()}, nya_floden[0])
+
+    def _byt_rad(self, calc, rad, nya, nya_floden):
+        """Drar bort radens gamla bidrag till aggregaten, lägger till det nya och skriver raden."""
+        varden, summor = self.resultat[calc], self.summor[calc]
+        gamla_payback, nya_payback = varden['payback'][rad], nya['payback']
+        summor['summa_total_initial'] += nya['total_initial'] - varden['total_initial'][rad]
+        summor['summa_netto'] += nya['netto'] - varden['netto'][rad]
+        summor['summa_npv'] += nya['npv'] - varden['npv'][rad]
+        summor['arsfloden'] += nya_floden - self.floden[calc][rad]
+        if gamla_payback > 0:
+            summor['antal_lonsamma'] -= 1
+            summor['antal_per_fack'][self._fack(gamla_payback)] -= 1
+        if nya_payback > 0:
+            summor['antal_lonsamma'] += 1
+            summor['antal_per_fack'][self._fack(nya_payback)] += 1
+        for nyckel, varde in nya.items():
+            varden[nyckel][rad] = varde
+        self.floden[calc][rad] = nya_floden
+
+    def payback_percentil(self, calc, p):
+        """Percentil för payback bland lönsamma fastigheter, med histogrammets upplösning (0 om ingen är lönsam)."""
+        antal_per_fack = self.summor[calc]['antal_per_fack']
+        antal = self.summor[calc]['antal_lonsamma']
+        if not antal:
+            return 0.0
+        kumulativ = np.cumsum(antal_per_fack)
+        fack = int(np.searchsorted(kumulativ, max(int(np.ceil(p / 100 * antal)), 1)))
+        return round(float(self.kanter[fack + 1]), 6)
+
+    def aggregat(self, calc):
+        """Portföljaggregat med samma nycklar som portfolj.aggregera, plus paybackhistogrammet."""
+        summor = self.summor[calc]
+        return {
+            'antal_fastigheter': self.n,
+            'antal_lonsamma': summor['antal_lonsamma'],
+            'summa_total_initial': summor['summa_total_initial'],
+            'summa_netto': summor['summa_netto'],
+            'payback_portfolj': kalkyl.payback(summor['summa_total_initial'], summor['summa_netto']),
+            'payback_median': self.payback_percentil(calc, 50),
+            'arsfloden_portfolj': summor['arsfloden'].copy(),
+            'kassaflode_portfolj': kassaflodesmotor.ackumulerat(summor['arsfloden'][None, :])[0],
+            'summa_npv': summor['summa_npv'],
+            'payback_histogram': (self.kanter, summor['antal_per_fack'].copy()),
+        }
+
+    def som_resultat(self):
+        """Aktuellt läge som portfolj.PortfoljResultat, för samma visning som en full beräkning."""
+        resultat = portfolj.PortfoljResultat(n=self.n, indata=dict(self.indata))
+        for calc in self.calcs:
+            resultat.resultat[calc] = self.resultat[calc]
+            resultat.kassaflode[calc] = kassaflodesmotor.ackumulerat(self.floden[calc])
+            resultat.aggregat[calc] = self.aggregat(calc)
+        return resultat
+
+    def kontrollera(self):
+        """
+        Jämför de löpande aggregaten med en summering från grunden och
+        resultaten per rad med en full omräkning. Returnerar per kalkyl den
+        största relativa avvikelsen för summorna och om antal och histogram
+        stämmer exakt. Lagret ändras inte.
+        """
+        avvikelser = {}
+        for calc in self.calcs:
+            rader, floden = _berakna(calc, self.indata, self.n, self.standard, self.ar, self.ranta, self.antaganden,
+                                     self.med_irr)
+            fran_grunden = self._summera(calc)
+            summor = self.summor[calc]
+            relativ = [
+                abs(summor[k] - fran_grunden[k]) / max(abs(fran_grunden[k]), 1.0)
+                for k in ('summa_total_initial', 'summa_netto', 'summa_npv')
+            ]
+            relativ.append(float(np.max(np.abs(summor['arsfloden'] - fran_grunden['arsfloden']) / np.maximum(np.abs(fran_grunden['arsfloden']), 1.0))))
+            avvikelser[calc] = {
+                'summor': max(relativ),
+                'rader': max(float(np.nanmax(np.abs(self.resultat[calc][k] - rader[k]) / np.maximum(np.abs(rader[k]), 1.0), initial=0.0))
+                             for k in rader),
+                'floden': float(np.max(np.abs(self.floden[calc] - floden) / np.maximum(np.abs(floden), 1.0), initial=0.0)),
+                'antal_stammer': summor['antal_lonsamma'] == fran_grunden['antal_lonsamma']
+                                  and np.array_equal(summor['antal_per_fack'], fran_grunden['antal_per_fack']),
+            }
+        return avvikelser
@@ -0,0 +1,129 @@
+"""
+Tidtagning per avsnitt i en omkörning av Streamlit-skriptet.
+
+En `Profilerare` skapas överst i skriptet för varje omkörning. `klar(namn)`
+fungerar som ett varvur: tiden sedan föregående markering bokförs på avsnittet
+`namn`, så att skriptet kan delas upp utan att blocken behöver dras in.
+`sektion(namn)` mäter ett enskilt anrop (t.ex. formlerna eller st.plotly_chart)
+inuti ett avsnitt. När profileringen är avstängd gör båda ingenting.
+
+`Statistik` samlar omkörningarna för hela processen i ett rullande fönster
+(p50/p95 per avsnitt) och kan exporteras som Prometheus-text eller JSONL.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+METRIKNAMN = "iot_kalkyl_omkorning_sekunder"
+
+
+class Profilerare:
+    def __init__(self, aktiv=True):
+        self.aktiv = aktiv
+        self.start = self._senaste = time.perf_counter()
+        self.tider = {}
+
+    def klar(self, namn):
+        """Bokför tiden sedan föregående markering (eller starten) på avsnittet `namn`."""
+        if not self.aktiv:
+            return
+        nu = time.perf_counter()
+        self.tider[namn] = self.tider.get(namn, 0.0) + (nu - self._senaste)
+        self._senaste = nu
+
+    @contextmanager
+    def sektion(self, namn):
+        """Mäter blocket och bokför det på `namn`. Påverkar inte varvuret i `klar`."""
+        if not self.aktiv:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tider[namn] = self.tider.get(namn, 0.0) + (time.perf_counter() - start)
+
+    def avsluta(self):
+        """Bokför resten sedan senaste markering och total tid. Returnerar {avsnitt: sekunder}."""
+        if self.aktiv:
+            self.klar("övrigt")
+            self.tider["total"] = time.perf_counter() - self.start
+        return dict(self.tider)
+
+
+class Statistik:
+    """Trådsäkert rullande fönster med de senaste `fonster` mätningarna per avsnitt, för hela processen."""
+
+    def __init__(self, fonster=500):
+        self.fonster = fonster
+        self._matningar = {}
+        self._summa = {}
+        self._antal = {}
+        self._las = threading.Lock()
+
+    def registrera(self, tider):
+        with self._las:
+            for namn, sekunder in tider.items():
+                self._matningar.setdefault(namn, deque(maxlen=self.fonster)).append(sekunder)
+                self._summa[namn] = self._summa.get(namn, 0.0) + sekunder
+                self._antal[namn] = self._antal.get(namn, 0) + 1
+
+    def sammanfattning(self):
+        """En rad per avsnitt: p50, p95 och max i fönstret (sekunder) samt totalt antal mätningar."""
+        with self._las:
+            kopior = {namn: np.array(varden) for namn, varden in self._matningar.items()}
+            antal = dict(self._antal)
+            summa = dict(self._summa)
+        return [
+            {
+                'avsnitt': namn,
+                'p50': float(np.percentile(varden, 50)),
+                'p95': float(np.percentile(varden, 95)),
+                'max': float(varden.max()),
+                'antal': antal[namn],
+                'summa': summa[namn],
+            }
+            for namn, varden in kopior.items()
+        ]
+
+    def prometheus_text(self):
+        """Prometheus-exponering (summary per avsnitt; kvantiler över fönstret, sum/count sedan start)."""
+        rader = [
+            f"# HELP {METRIKNAMN} Tid per avsnitt i en omkörning av IoT ROI-kalkylatorn.",
+            f"# TYPE {METRIKNAMN} summary",
+        ]
+        for rad in self.sammanfattning():
+            etikett = rad['avsnitt'].replace('\\', '\\\\').replace('"', '\\"')
+            rader.append(f'{METRIKNAMN}{{avsnitt="{etikett}",quantile="0.5"}} {rad["p50"]:.6f}')
+            rader.append(f'{METRIKNAMN}{{avsnitt="{etikett}",quantile="0.95"}} {rad["p95"]:.6f}')
+            rader.append(f'{METRIKNAMN}_sum{{avsnitt="{etikett}"}} {rad["summa"]:.6f}')
+            rader.append(f'{METRIKNAMN}_count{{avsnitt="{etikett}"}} {rad["antal"]}')
+        return "\n".join(rader) + "\n"
+
+
+_skrivlas = threading.Lock()
+
+
+def exportera(sokvag, statistik, tider, session=None):
+    """
+    Skriver mätvärdena till `sokvag`: .jsonl får en rad per omkörning, annars
+    skrivs hela filen om atomiskt i Prometheus-format (för node_exporters
+    textfile collector eller liknande).
+    """
+    with _skrivlas:
+        if sokvag.lower().endswith('.jsonl'):
+            rad = {'tid': time.time(), 'session': session, 'avsnitt_ms': {k: v * 1000 for k, v in tider.items()}}
+            with open(sokvag, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(rad, ensure_ascii=False) + "\n")
+            return
+        katalog = os.path.dirname(os.path.abspath(sokvag))
+        fd, tmp = tempfile.mkstemp(dir=katalog, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(statistik.prometheus_text())
+        os.replace(tmp, sokvag)
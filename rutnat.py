@@ -0,0 +1,65 @@
+"""
+Tvådimensionella rutnät (heatmaps) av payback och netto över två indata.
+
+Rutnätet beräknas genom att x-värdena läggs som en radvektor och y-värdena som
+en kolumnvektor; formlerna i kalkyl.py broadcastar då till hela (ny, nx)-matrisen
+utan Python-loopar.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+import kalkyl
+import portfolj
+
+# Förvalda axlar per kalkyl för prisförhandlingar
+STANDARDAXLAR = {
+    'temp': ('pris_sensor_temp', 'besparing_temp'),
+    'imd': ('pris_sensor_imd', 'besparing_lgh_vatten'),
+    'skada': ('kostnad_skada', 'frekvens_skada'),
+}
+
+
+@dataclass
+class Rutnat:
+    x_nyckel: str
+    y_nyckel: str
+    x: np.ndarray
+    y: np.ndarray
+    netto: np.ndarray     # Form (len(y), len(x))
+    payback: np.ndarray   # NaN där investeringen aldrig betalar sig
+
+
+def axel_kring(varde, spann_pct, n):
+    """n jämnt fördelade värden i intervallet varde ± spann_pct, aldrig under noll."""
+    d = abs(float(varde)) * spann_pct / 100
+    return np.linspace(max(float(varde) - d, 0.0), float(varde) + d, n)
+
+
+def berakna_rutnat(calc, scenario, x_nyckel, x_varden, y_nyckel, y_varden):
+    """Beräknar netto och payback för alla kombinationer av x- och y-värden."""
+    if x_nyckel == y_nyckel:
+        raise ValueError("x- och y-axeln måste vara olika indata")
+    for nyckel in (x_nyckel, y_nyckel):
+        if nyckel not in kalkyl.SCENARIO_NYCKLAR[calc]:
+            raise ValueError(f"{nyckel!r} är inte en indata i {calc}-kalkylen")
+
+    x = np.asarray(x_varden, dtype=float)
+    y = np.asarray(y_varden, dtype=float)
+    kolumner = kalkyl.INDATA_KLASSER[calc].from_dict(scenario).as_dict()
+    kolumner[x_nyckel] = x[None, :]
+    kolumner[y_nyckel] = y[:, None]
+
+    varden = kalkyl.FORMLER[calc](kolumner)
+    form = (y.size, x.size)
+    total_initial = np.broadcast_to(np.asarray(varden['total_initial'], dtype=float), form)
+    netto = np.broadcast_to(np.asarray(varden['netto'], dtype=float), form)
+    payback = portfolj.payback_vektor(total_initial, netto)
+    return Rutnat(
+        x_nyckel=x_nyckel,
+        y_nyckel=y_nyckel,
+        x=x,
+        y=y,
+        netto=np.ascontiguousarray(netto),
+        payback=np.where(payback > 0, payback, np.nan),
+    )
@@ -0,0 +1,188 @@
+"""
+Scenariobibliotek i SQLite: spara, sök och ladda många scenarier.
+
+Varje scenario lagras med kalkyltyp, namn, antal lägenheter, nyckeltal och
+skapandetid i indexerade kolumner, och hela scenariot som JSON. Listningen
+pagineras med nyckelmarkör (sorteringsvärde, id) i stället för OFFSET, så
+att även sista sidan i ett bibliotek med miljontals scenarier tar
+millisekunder.
+
+    bibliotek = ScenarioBibliotek("iot_scenarier.sqlite")
+    bibliotek.spara("skada", scenario, namn="Brf Ekbacken")
+    rader, markor = bibliotek.lista(calc="skada", max_payback=4)
+"""
+import json
+import math
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+import kalkyl
+import portfolj
+
+SORTERINGAR = ('skapad', 'payback', 'antal_lgh')  # Indexerade kolumner som listan kan sorteras på
+ANALYSERA_EFTER = 10_000  # Uppdatera planerarens statistik efter så här stora importer
+KOLUMNER = ('id', 'calc', 'namn', 'antal_lgh', 'total_initial', 'netto', 'payback', 'skapad')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarier (
+    id INTEGER PRIMARY KEY,
+    calc TEXT NOT NULL,
+    namn TEXT,
+    antal_lgh INTEGER,
+    total_initial REAL,
+    netto REAL,
+    payback REAL NOT NULL,  -- Inf = betalar sig aldrig, så att payback < x och sortering fungerar direkt
+    skapad TEXT NOT NULL,   -- UTC, 'YYYY-MM-DD HH:MM:SS'
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_scenarier_calc_payback ON scenarier (calc, payback, id);
+CREATE INDEX IF NOT EXISTS ix_scenarier_calc_antal_lgh ON scenarier (calc, antal_lgh, id);
+CREATE INDEX IF NOT EXISTS ix_scenarier_calc_skapad ON scenarier (calc, skapad, id);
+CREATE INDEX IF NOT EXISTS ix_scenarier_payback ON scenarier (payback, id);
+CREATE INDEX IF NOT EXISTS ix_scenarier_antal_lgh ON scenarier (antal_lgh, id);
+CREATE INDEX IF NOT EXISTS ix_scenarier_skapad ON scenarier (skapad, id);
+"""
+
+
+def _nu():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _som_dict(rad):
+    """Databasrad -> dict. Payback Inf blir 0 (samma konvention som kalkyl.payback)."""
+    post = dict(zip(KOLUMNER, rad))
+    if math.isinf(post['payback']):
+        post['payback'] = 0.0
+    return post
+
+
+class ScenarioBibliotek:
+    """
+    Trådsäkert scenariobibliotek i en SQLite-fil (en anslutning, skyddad av ett lås).
+    `sokvag=":memory:"` ger ett tillfälligt bibliotek.
+    """
+
+    def __init__(self, sokvag):
+        self.sokvag = sokvag
+        self._las = threading.Lock()
+        self._db = sqlite3.connect(sokvag, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA cache_size=-65536")  # 64 MB sidcache, indexen hålls i minnet vid stora importer
+        self._db.executescript(_SCHEMA)
+        if self._db.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None:
+            self.analysera()
+
+    def analysera(self):
+        """
+        Uppdaterar SQLites statistik så att planeraren väljer rätt index, t.ex.
+        (calc, skapad) för "nyaste först" när nästan alla rader matchar filtret.
+        """
+        with self._las:
+            self._db.execute("ANALYZE")
+
+    def stang(self):
+        with self._las:
+            self._db.close()
+
+    def spara(self, calc, scenario, namn=None):
+        """Sparar ett scenario och returnerar dess id. Nyckeltalen beräknas med kalkyl.py."""
+        return self.spara_manga(calc, [scenario], [namn])[0]
+
+    def spara_manga(self, calc, scenarier, namn=None, skapad=None):
+        """
+        Sparar många scenarier av samma kalkyltyp i en transaktion. Nyckeltalen
+        beräknas vektoriserat. Returnerar listan med nya id:n.
+        """
+        if calc not in kalkyl.SCENARIO_NYCKLAR:
+            raise ValueError(f"okänd kalkyl: {calc!r}")
+        nycklar = kalkyl.SCENARIO_NYCKLAR[calc]
+        scenarier = [{k: s.get(k, kalkyl.STANDARDVARDEN[k]) for k in nycklar} for s in scenarier]
+        if not scenarier:
+            return []
+        namn = namn if namn is not None else [None] * len(scenarier)
+        kolumner = {k: np.array([s[k] for s in scenarier], dtype=float) for k in nycklar}
+        varden = portfolj.berakna_vektor(calc, kolumner)
+        n = len(scenarier)
+        total_initial = np.broadcast_to(varden['total_initial'], (n,)).tolist()
+        netto = np.broadcast_to(varden['netto'], (n,)).tolist()
+        payback = np.where(np.broadcast_to(varden['payback'], (n,)) > 0, varden['payback'], np.inf).tolist()
+        skapad = skapad or _nu()
+
+        rader = [
+            (calc, namn[i], int(s['antal_lgh_main']), total_initial[i], netto[i], payback[i], skapad,
+             json.dumps(s, separators=(',', ':')))
+            for i, s in enumerate(scenarier)
+        ]
+        with self._las, self._db:
+            # Skrivlåset tas före MAX(id), så att ingen annan process kan lägga till rader emellan
+            # och de nya raderna får id:n i en obruten följd från `forsta`
+            self._db.execute("BEGIN IMMEDIATE")
+            forsta = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM scenarier").fetchone()[0] + 1
+            self._db.executemany(
+                "INSERT INTO scenarier (calc, namn, antal_lgh, total_initial, netto, payback, skapad, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rader)
+        if n >= ANALYSERA_EFTER:
+            self.analysera()
+        return list(range(forsta, forsta + n))
+
+    def hamta(self, id):
+        """Returnerar (calc, scenario-dict) eller None om id saknas."""
+        with self._las:
+            rad = self._db.execute("SELECT calc, data FROM scenarier WHERE id = ?", (id,)).fetchone()
+        return None if rad is None else (rad[0], json.loads(rad[1]))
+
+    def ta_bort(self, id):
+        with self._las, self._db:
+            return self._db.execute("DELETE FROM scenarier WHERE id = ?", (id,)).rowcount > 0
+
+    @staticmethod
+    def _villkor(calc, max_payback, min_lgh, max_lgh, fran, till):
+        villkor, parametrar = [], []
+        for sql, varde in (("calc = ?", calc), ("payback < ?", max_payback),
+                           ("antal_lgh >= ?", min_lgh), ("antal_lgh <= ?", max_lgh),
+                           ("skapad >= ?", fran), ("skapad < ?", till)):
+            if varde is not None:
+                villkor.append(sql)
+                parametrar.append(varde)
+        return villkor, parametrar
+
+    def lista(self, calc=None, max_payback=None, min_lgh=None, max_lgh=None, fran=None, till=None,
+              sortering='skapad', fallande=None, antal=50, efter=None):
+        """
+        En sida scenarier (utan scenariodata) som matchar filtren.
+
+        `max_payback` ger bara scenarier som betalar sig på kortare tid. `fran`/`till`
+        är datumsträngar ('2024-01-01'). Standard är nyaste först vid sortering på
+        skapad, annars stigande. Returnerar (rader, markör); skicka markören som
+        `efter` för att hämta nästa sida. Markören är None på sista sidan.
+        """
+        if sortering not in SORTERINGAR:
+            raise ValueError(f"kan bara sortera på {', '.join(SORTERINGAR)}")
+        fallande = (sortering == 'skapad') if fallande is None else fallande
+        villkor, parametrar = self._villkor(calc, max_payback, min_lgh, max_lgh, fran, till)
+        if efter is not None:
+            villkor.append(f"({sortering}, id) {'<' if fallande else '>'} (?, ?)")
+            parametrar.extend(efter)
+        riktning = "DESC" if fallande else "ASC"
+        sql = (f"SELECT {', '.join(KOLUMNER)} FROM scenarier"
+               + (" WHERE " + " AND ".join(villkor) if villkor else "")
+               + f" ORDER BY {sortering} {riktning}, id {riktning} LIMIT ?")
+        with self._las:
+            rader = self._db.execute(sql, parametrar + [antal + 1]).fetchall()
+        markor = None
+        if len(rader) > antal:
+            rader = rader[:antal]
+            sista = rader[-1]
+            markor = (sista[KOLUMNER.index(sortering)], sista[0])
+        return [_som_dict(rad) for rad in rader], markor
+
+    def rakna(self, calc=None, max_payback=None, min_lgh=None, max_lgh=None, fran=None, till=None):
+        """Antal scenarier som matchar filtren."""
+        villkor, parametrar = self._villkor(calc, max_payback, min_lgh, max_lgh, fran, till)
+        sql = "SELECT COUNT(*) FROM scenarier" + (" WHERE " + " AND ".join(villkor) if villkor else "")
+        with self._las:
+            return self._db.execute(sql, parametrar).fetchone()[0]
@@ -0,0 +1,195 @@
+"""
+Cache för beräknade resultat och serialiserade figurer.
+
+Nyckeln är en kanonisk SHA-256 av scenariot (samma dict som scenario_data_to_save
+bygger), så identiska scenarier delar post oavsett session. Minnesdelen är en
+storleksbegränsad LRU; valfritt kan en katalog på disk delas mellan flera
+serverprocesser.
+"""
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def _normalisera(varde):
+    """Gör värdet kanoniskt: tal blir float (1000 == 1000.0), tupler blir listor, dict-nycklar strängar."""
+    if isinstance(varde, bool) or varde is None or isinstance(varde, str):
+        return varde
+    if isinstance(varde, dict):
+        return {str(k): _normalisera(v) for k, v in varde.items()}
+    if isinstance(varde, (list, tuple)):
+        return [_normalisera(v) for v in varde]
+    try:
+        tal = float(varde)
+    except (TypeError, ValueError):
+        return str(varde)
+    return repr(tal) if math.isnan(tal) or math.isinf(tal) else tal
+
+
+def scenario_hash(*delar):
+    """Kanonisk hash av ett eller flera JSON-lika värden, t.ex. ('resultat', 'temp', scenario)."""
+    kanonisk = json.dumps(_normalisera(list(delar)), sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(kanonisk.encode('utf-8')).hexdigest()
+
+
+class ScenarioCache:
+    """
+    Trådsäker LRU-cache med gräns för antal poster och totalt antal bytes.
+
+    Värden lagras serialiserade som JSON-text, vilket ger exakt storleksräkning
+    och gör att anropare aldrig delar muterbara objekt. Med `katalog` skrivs
+    varje post även till disk och kan läsas av andra processer.
+    """
+
+    def __init__(self, max_poster=1024, max_bytes=64 * 2**20, katalog=None, max_filer=10_000):
+        self.max_poster = max_poster
+        self.max_bytes = max_bytes
+        self.katalog = katalog
+        self.max_filer = max_filer
+        self._poster = OrderedDict()
+        self._bytes = 0
+        self._las = threading.Lock()
+        self._skrivningar_sedan_rensning = 0
+        self.traffar = 0
+        self.disktraffar = 0
+        self.missar = 0
+        self.utkastade = 0
+        if katalog:
+            os.makedirs(katalog, exist_ok=True)
+
+    # --- MINNE ---
+
+    def _lagg_till(self, nyckel, text):
+        storlek = len(text.encode('utf-8'))
+        if storlek > self.max_bytes:
+            return
+        if nyckel in self._poster:
+            self._bytes -= len(self._poster.pop(nyckel).encode('utf-8'))
+        self._poster[nyckel] = text
+        self._bytes += storlek
+        while len(self._poster) > self.max_poster or self._bytes > self.max_bytes:
+            _, utkastad = self._poster.popitem(last=False)
+            self._bytes -= len(utkastad.encode('utf-8'))
+            self.utkastade += 1
+
+    # --- DISK ---
+
+    def _sokvag(self, nyckel):
+        return os.path.join(self.katalog, nyckel[:2], f"{nyckel}.json")
+
+    def _las_disk(self, nyckel):
+        try:
+            with open(self._sokvag(nyckel), encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(self._sokvag(nyckel))  # mtime används som LRU-ordning på disk
+        except OSError:
+            pass
+        return text
+
+    def _skriv_disk(self, nyckel, text):
+        mapp = os.path.dirname(self._sokvag(nyckel))
+        os.makedirs(mapp, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=mapp, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, self._sokvag(nyckel))
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+        self._skrivningar_sedan_rensning += 1
+        if self._skrivningar_sedan_rensning >= 100:
+            self._skrivningar_sedan_rensning = 0
+            self._rensa_disk()
+
+    def _rensa_disk(self):
+        """Tar bort de äldsta filerna (efter mtime) när katalogen har fler än max_filer poster."""
+        filer = []
+        for rot, _, namn in os.walk(self.katalog):
+            filer.extend(os.path.join(rot, n) for n in namn if n.endswith('.json'))
+        if len(filer) <= self.max_filer:
+            return
+        # Andra processer kan rensa samtidigt; filer som redan har försvunnit hoppas över
+        aldrar = []
+        for sokvag in filer:
+            try:
+                aldrar.append((os.stat(sokvag).st_mtime, sokvag))
+            except OSError:
+                pass
+        aldrar.sort()
+        for _, sokvag in aldrar[:len(aldrar) - self.max_filer]:
+            try:
+                os.remove(sokvag)
+            except OSError:
+                pass
+
+    # --- PUBLIKT API ---
+
+    def hamta(self, nyckel, standard=None):
+        """Hämtar ett värde (deserialiserat). Räknas som träff eller miss i statistiken."""
+        with self._las:
+            text = self._poster.get(nyckel)
+            if text is not None:
+                self._poster.move_to_end(nyckel)
+                self.traffar += 1
+                return json.loads(text)
+        if self.katalog:
+            text = self._las_disk(nyckel)
+            if text is not None:
+                with self._las:
+                    self._lagg_till(nyckel, text)
+                    self.disktraffar += 1
+                return json.loads(text)
+        with self._las:
+            self.missar += 1
+        return standard
+
+    def spara(self, nyckel, varde):
+        """Sparar ett JSON-serialiserbart värde. Returnerar den serialiserade texten."""
+        text = json.dumps(varde, separators=(',', ':'), default=float)
+        with self._las:
+            self._lagg_till(nyckel, text)
+        if self.katalog:
+            self._skriv_disk(nyckel, text)
+        return text
+
+    def hamta_eller_berakna(self, delar, berakna):
+        """
+        Hämtar värdet för nyckeln som `delar` hashas till, eller kör `berakna()` och sparar resultatet.
+        Värdet returneras alltid efter en JSON-rundresa, så träff och miss ger samma typer.
+        """
+        nyckel = scenario_hash(*delar)
+        saknas = object()
+        varde = self.hamta(nyckel, saknas)
+        if varde is saknas:
+            varde = json.loads(self.spara(nyckel, berakna()))
+        return varde
+
+    def rensa(self):
+        with self._las:
+            self._poster.clear()
+            self._bytes = 0
+
+    def statistik(self):
+        with self._las:
+            uppslag = self.traffar + self.disktraffar + self.missar
+            return {
+                'poster': len(self._poster),
+                'bytes': self._bytes,
+                'traffar': self.traffar,
+                'disktraffar': self.disktraffar,
+                'missar': self.missar,
+                'utkastade': self.utkastade,
+                'traffgrad': (self.traffar + self.disktraffar) / uppslag if uppslag else 0.0,
+            }
@@ -0,0 +1,174 @@
+"""
+Stokastisk simulering av vattenskador: årlig skadekostnad som fördelning i stället för väntevärde.
+
+Skadekalkylen räknar med väntevärdet (antal_lgh / 1000) · frekvens_skada ·
+kostnad_skada, vilket döljer svansrisken. Här får varje lägenhet
+Poissonfördelade skador varje år med intensiteten frekvens_skada / 1000, och
+varje skada en kostnad ur en tungsvansad fördelning (lognormal eller Pareto)
+med medelvärdet kostnad_skada. Summan av lägenheternas oberoende
+Poissonvariabler är Poissonfördelad med summan av intensiteterna, så antalet
+skador per försök och år dras direkt för hela fastigheten, vilket ger exakt
+samma fördelning som en dragning per lägenhet men kräver en dragning per
+försök och år i stället för en per lägenhet.
+
+Varje skada undviks med sannolikheten besparing_skada_pct / 100. Eftersom
+kostnaderna är oberoende och likafördelade är summan för de undvikna skadorna
+lika fördelad som summan för de första av årets skador, så de undvikna
+skadorna tas som de första i varje år och bara antalet behöver dras
+(binomialfördelat).
+
+Försöken körs i block, så att antalet skadekostnader som finns i minnet
+samtidigt begränsas av `block_skador` även för 100 000 lägenheter och 10 000
+försök. Blocken har egna slumpströmmar och kan köras i en processpool
+(parallell.py) eller som bakgrundsjobb (jobb.py). Resultatet innehåller
+skadekostnaden per försök och år med och utan sensorer, som VaR och
+expected shortfall beräknas ur.
+
+    resultat = simulera({'antal_lgh_main': 100_000}, antal_forsok=10_000, seed=1)
+    resultat.riskmatt()   # VaR och ES per nivå, per år och för hela perioden
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import kalkyl
+import parallell
+import portfolj
+
+SVANSFORDELNINGAR = ('lognormal', 'pareto')
+STANDARD_CV = 2.0       # Variationskoefficient för lognormal (std / medel)
+STANDARD_ALFA = 2.5     # Svansindex för Pareto (lägre = tyngre svans, måste vara > 1)
+NIVAER = (0.90, 0.95, 0.99, 0.995)
+PERCENTILER = (5, 50, 95)
+BLOCK_SKADOR = 2_000_000  # Ungefärligt antal skadekostnader per block
+
+
+@dataclass
+class Skaderesultat:
+    """Skadekostnad per försök och år (form (försök, år)) utan sensorer och den del som undviks."""
+    antal_lgh: int
+    seed: object
+    forvantad: float        # Väntevärdet per år enligt skadekalkylen, år 1
+    utan: np.ndarray = field(repr=False)
+    undviken: np.ndarray = field(repr=False)
+
+    @property
+    def antal_forsok(self):
+        return self.utan.shape[0]
+
+    @property
+    def ar(self):
+        return self.utan.shape[1]
+
+    @property
+    def med(self):
+        """Kvarvarande skadekostnad med sensorer."""
+        return self.utan - self.undviken
+
+    def _utfall(self, serie, period):
+        if period == 'ar':
+            return serie.ravel()
+        if period == 'horisont':
+            return serie.sum(axis=1)
+        raise ValueError(f"okänd period: {period!r} ('ar' eller 'horisont')")
+
+    def riskmatt(self, nivaer=NIVAER, period='ar'):
+        """
+        VaR (kvantilen) och expected shortfall (medel av utfallen från och
+        med kvantilen) på varje nivå, utan och med sensorer. `period` 'ar'
+        ger årlig kostnad (alla försök och år), 'horisont' summan per försök.
+        """
+        rader = {}
+        for namn, serie in (('utan', self.utan), ('med', self.med)):
+            utfall = np.sort(self._utfall(serie, period))
+            for niva in nivaer:
+                start = min(int(np.floor(niva * len(utfall))), len(utfall) - 1)
+                rader.setdefault(niva, {})[f'var_{namn}'] = float(utfall[start])
+                rader[niva][f'es_{namn}'] = float(utfall[start:].mean())
+        return pd.DataFrame.from_dict(rader, orient='index').rename_axis('niva')
+
+    def undviken_percentiler(self, percentiler=PERCENTILER, period='ar'):
+        """Percentiler för den undvikna kostnaden (det sensorerna sparar)."""
+        utfall = self._utfall(self.undviken, period)
+        return {p: float(np.percentile(utfall, p)) for p in percentiler}
+
+    def sammanfattning(self):
+        """Medelvärden per år, för jämförelse med skadekalkylens väntevärde."""
+        return {
+            'forvantad': self.forvantad,
+            'medel_utan': float(self.utan[:, 0].mean()),
+            'medel_undviken': float(self.undviken[:, 0].mean()),
+            'std_utan': float(self.utan.std()),
+            'andel_ar_utan_skador': float(np.mean(self.utan == 0)),
+        }
+
+
+def dra_kostnader(rng, n, medel, fordelning='lognormal', cv=STANDARD_CV, alfa=STANDARD_ALFA):
+    """`n` skadekostnader med medelvärdet `medel` ur den tungsvansade fördelningen."""
+    if fordelning == 'lognormal':
+        sigma2 = np.log1p(cv ** 2)
+        return rng.lognormal(np.log(medel) - sigma2 / 2, np.sqrt(sigma2), n)
+    if fordelning == 'pareto':
+        if alfa <= 1:
+            raise ValueError("Pareto kräver alfa > 1 för att medelvärdet ska finnas")
+        # NumPys pareto är Lomax (Pareto II) med medelvärdet 1 / (alfa - 1)
+        return rng.pareto(alfa, n) * (medel * (alfa - 1))
+    raise ValueError(f"okänd fördelning: {fordelning!r} ({', '.join(SVANSFORDELNINGAR)})")
+
+
+def _simulera_block(intensitet, kostnad, andel, fordelning, cv, alfa, forsok, ar, seed):
+    """Ett block med `forsok` försök och egen slumpström."""
+    rng = np.random.default_rng(seed)
+    antal = rng.poisson(intensitet, (forsok, ar)).ravel()
+    undvikna = rng.binomial(antal, andel)
+    kostnader = dra_kostnader(rng, int(antal.sum()), kostnad, fordelning, cv, alfa)
+    # Kumulativ summa: skadorna för försök-år i ligger på platserna [start_i, start_i + antal_i)
+    kumulativ = np.concatenate(([0.0], np.cumsum(kostnader)))
+    start = np.cumsum(antal) - antal
+    return {
+        'utan': (kumulativ[start + antal] - kumulativ[start]).reshape(forsok, ar),
+        'undviken': (kumulativ[start + undvikna] - kumulativ[start]).reshape(forsok, ar),
+    }
+
+
+def _sla_ihop(a, b):
+    return {k: np.concatenate([a[k], b[k]]) for k in a}
+
+
+def simulera(scenario, antal_forsok=10_000, ar=portfolj.AR, fordelning='lognormal', cv=STANDARD_CV, alfa=STANDARD_ALFA,
+             prisokning_pct=0.0, seed=None, block_skador=BLOCK_SKADOR, processer=1, vid_delresultat=None, avbryt=None):
+    """
+    Simulerar `antal_forsok` förlopp om `ar` år för skadekalkylens scenario
+    (saknade nycklar får standardvärden). Skadekostnaden räknas upp med
+    `prisokning_pct` per år som i kassaflödet.
+
+    Varje block får en egen slumpström från `seed`, så resultatet är detsamma
+    oavsett `processer`. `vid_delresultat(klara, totalt, delsummor)` och
+    `avbryt()` fungerar som i montecarlo.simulera.
+    """
+    v = kalkyl.INDATA_KLASSER['skada'].from_dict(scenario).as_dict()
+    intensitet = v['antal_lgh_main'] / 1000 * v['frekvens_skada']
+    if intensitet < 0 or v['kostnad_skada'] < 0:
+        raise ValueError("frekvens_skada och kostnad_skada får inte vara negativa")
+    andel = min(max(v['besparing_skada_pct'] / 100, 0.0), 1.0)
+    if fordelning not in SVANSFORDELNINGAR:
+        raise ValueError(f"okänd fördelning: {fordelning!r} ({', '.join(SVANSFORDELNINGAR)})")
+
+    per_block = int(min(max(block_skador // max(intensitet * ar, 1.0), 1), antal_forsok))
+    starter = range(0, antal_forsok, per_block)
+    fron = np.random.SeedSequence(seed).spawn(len(starter))
+    uppgifter = [
+        (intensitet, v['kostnad_skada'], andel, fordelning, cv, alfa, min(per_block, antal_forsok - start), ar, fro)
+        for start, fro in zip(starter, fron)
+    ]
+    summa = parallell.kor(_simulera_block, uppgifter, _sla_ihop, processer, vid_delresultat, avbryt)
+
+    prisfaktor = (1 + prisokning_pct / 100) ** np.arange(ar)
+    return Skaderesultat(
+        antal_lgh=int(v['antal_lgh_main']),
+        seed=seed,
+        forvantad=kalkyl.tot_skadekostnad_utan_iot(v['antal_lgh_main'], v['frekvens_skada'], v['kostnad_skada']),
+        utan=summa['utan'] * prisfaktor,
+        undviken=summa['undviken'] * prisfaktor,
+    )
@@ -0,0 +1,92 @@
+"""
+Timviktat energipris för temperaturkalkylen.
+
+Kalkylen räknar årets kWh gånger ett fast `pris_kwh`. Värmekostnaden följer
+dock timpriset, och besparingen hamnar där värmelasten är störst, dvs. under
+kalla (och ofta dyra) timmar. Med en prisserie och en lastprofil för årets
+timmar (8 760, eller 8 784 ett skottår) fördelas besparingen över timmarna
+efter lastprofilen och värderas med timpriset:
+
+    besparing_kr = Σ_h Σ_a pris_h · last_ha / Σ_h last_ha · kwh_a · besparing_temp / 100
+
+Lastprofilen kan ha en kolumn (hela fastigheten) eller en kolumn per
+lägenhet eller lägenhetsgrupp. Summan är en matris-vektorprodukt (timmar ×
+profiler) och tar några millisekunder även för tusentals profiler. Det
+lastviktade priset (besparing_kr delat med besparingen i kWh) kan ersätta
+`pris_kwh` rakt av, så att kassaflöde, känslighetsanalys och Monte Carlo
+räknar med det.
+
+    pris = las_serie("spotpris_2024.csv", kolumn='pris')
+    last = las_serie("varmelast_2024.csv")
+    viktat_pris(pris, last, tillagg=0.65)   # kr/kWh
+"""
+import numpy as np
+import pandas as pd
+
+TIMMAR = (8760, 8784)   # Normalår och skottår
+TIDKOLUMNER = ('tid', 'timme', 'datum')
+
+
+def las_serie(kalla, kolumn=None):
+    """
+    Läser en timserie ur en CSV-fil med en rad per timme. Med `kolumn` läses
+    bara den kolumnen (1-d array), annars alla numeriska kolumner utom
+    tidskolumner (1-d vid en kolumn, annars form (timmar, kolumner)).
+    """
+    df = pd.read_csv(kalla)
+    if kolumn is not None:
+        if kolumn not in df:
+            raise ValueError(f"kolumnen {kolumn!r} saknas i filen")
+        df = df[[kolumn]]
+    else:
+        df = df.drop(columns=[k for k in df if str(k).lower() in TIDKOLUMNER]).select_dtypes('number')
+    if df.shape[1] == 0:
+        raise ValueError("filen har inga numeriska kolumner")
+    if len(df) not in TIMMAR:
+        raise ValueError(f"serien har {len(df)} rader, väntade {' eller '.join(map(str, TIMMAR))} (en per timme)")
+    if df.isna().any().any():
+        raise ValueError("serien har saknade värden")
+    serie = df.to_numpy(dtype=float)
+    return serie[:, 0] if serie.shape[1] == 1 else serie
+
+
+def _last(last):
+    """Lastprofilen som form (timmar, profiler) och summan per profil."""
+    last = np.asarray(last, dtype=float)
+    if last.ndim == 1:
+        last = last[:, None]
+    if (last < 0).any():
+        raise ValueError("lastprofilen har negativa värden")
+    summa = last.sum(axis=0)
+    if (summa <= 0).any():
+        raise ValueError("lastprofilen har kolumner utan last")
+    return last, summa
+
+
+def pris_per_profil(pris, last):
+    """Lastviktat pris (samma enhet som `pris`) per kolumn i lastprofilen."""
+    pris = np.asarray(pris, dtype=float)
+    last, summa = _last(last)
+    if pris.ndim != 1 or len(pris) != len(last):
+        raise ValueError(f"prisserien ({len(pris)} timmar) och lastprofilen ({len(last)} timmar) måste vara lika långa")
+    # Normeringen görs efter produkten, så att ingen normerad kopia av profilen behövs
+    return (pris @ last) / summa
+
+
+def besparing_kr(pris, last, kwh_ar, besparing_temp, tillagg=0.0):
+    """
+    Timviktad besparing i kr/år per profil. `kwh_ar` är årsförbrukningen per
+    profil (skalär eller en per kolumn) och `tillagg` ett fast påslag per kWh
+    (t.ex. nätavgift och energiskatt som inte ingår i timpriset).
+    """
+    return (pris_per_profil(pris, last) + tillagg) * np.asarray(kwh_ar, dtype=float) * besparing_temp / 100
+
+
+def viktat_pris(pris, last, kwh_ar=1.0, tillagg=0.0):
+    """
+    Lastviktat pris i kr/kWh för hela fastigheten: den timviktade
+    besparingen delad med besparingen i kWh. Profilerna vägs med `kwh_ar`.
+    """
+    per_profil = pris_per_profil(pris, last) + tillagg
+    vikter = np.broadcast_to(np.asarray(kwh_ar, dtype=float), per_profil.shape)
+    return float(np.average(per_profil, weights=vikter))